@@ -1,54 +1,128 @@
-from flask import Flask, render_template, request, send_file
+from flask import Flask, abort, jsonify, redirect, render_template, request, send_from_directory, url_for
 import os
+import logging
+import threading
 from werkzeug.utils import secure_filename
 
-from redcap_preprocessing import redcap_preprocessing
+from redcap_preprocessing.jobs import JobQueue, get_default_job_processes, load_job_status
+from redcap_preprocessing.result_cache import DEFAULT_CACHE_SIZE
+from redcap_preprocessing.workspaces import DEFAULT_WORKSPACE_TTL, JOB_STATUS_FILENAME, WorkspaceStore
 
 app = Flask(__name__)
 
+logger = logging.getLogger(__name__)
+
+# one workspace per upload, shared by the app processes
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads')
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
 
-# Make sure the folder is empty
-for filename in os.listdir(UPLOAD_FOLDER):
-    file_path = os.path.join(UPLOAD_FOLDER, filename)
-    try:
-        if os.path.isfile(file_path):
-            os.unlink(file_path)
-    except Exception as e:
-        print(e)
+# created by init_app, not when the module is imported
+workspaces = None
+job_queue = None
+_init_lock = threading.Lock()
+
+def init_app():
+    """
+    Configure the app from the environment, and create the workspace store
+    and the job queue of the process. Called again, it does nothing.
+
+    run calls it before serving, and the first request otherwise, e.g. when
+    the app is served by gunicorn app:app.
+    """
+
+    global workspaces, job_queue
+
+    with _init_lock:
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+        app.config.setdefault('UPLOAD_FOLDER', UPLOAD_FOLDER)
+        app.config.setdefault('WORKSPACE_TTL', float(os.environ.get('REDCAP_WORKSPACE_TTL', DEFAULT_WORKSPACE_TTL)))
+        # outputs of the previous uploads of the same export
+        app.config.setdefault('CACHE_DIR', os.environ.get('REDCAP_CACHE_DIR', os.path.join(os.path.dirname(__file__), 'cache')))
+        app.config.setdefault('CACHE_SIZE', int(os.environ.get('REDCAP_CACHE_SIZE', DEFAULT_CACHE_SIZE)))
+        # the job threads share the GIL, each job converts its records in processes of its own
+        app.config.setdefault('JOB_PROCESSES', int(os.environ.get('REDCAP_JOB_PROCESSES', get_default_job_processes())))
+
+        if workspaces is None:
+            workspaces = WorkspaceStore(app.config['UPLOAD_FOLDER'], app.config['WORKSPACE_TTL'])
+
+        # the exports are preprocessed in the background, the requests only queue them
+        if job_queue is None:
+            job_queue = JobQueue()
+
+    return app
+
+@app.before_request
+def init_before_request():
+    init_app()
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
     if request.method == 'POST':
+        # the workspaces of the previous jobs expire
+        job_queue.remove(workspaces.cleanup())
+
         # Check if a file part is present in the request
-        if 'file' in request.files:
-            file = request.files['file']
-            if file.filename != '':
-                filename = secure_filename(file.filename)
-                file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-        
+        file = request.files.get('file')
+        if file is None or file.filename == '':
+            abort(400)
+
         # Fetch the selected analysis type
         analysis_type = request.form.get('analysis_type')
+        if analysis_type not in ['CRC', 'PDAC']:
+            abort(400)
+
+        # the rejected requests leave nothing on disk
+        workspace_id = workspaces.create()
+        filename = secure_filename(file.filename) or 'redcap.csv'
+        redcap_filepath = workspaces.get_path(workspace_id, filename)
+        file.save(redcap_filepath)
+
+        job = job_queue.submit(redcap_filepath=redcap_filepath,
+                               disease_type=analysis_type,
+                               output_dir=workspaces.get_output_dir(workspace_id),
+                               job_id=workspace_id,
+                               status_path=workspaces.get_path(workspace_id, JOB_STATUS_FILENAME),
+                               save_as_single_file=True,
+                               workers=app.config['JOB_PROCESSES'],
+                               cache_dir=app.config['CACHE_DIR'],
+                               cache_size=app.config['CACHE_SIZE'])
 
-        redcap_preprocessing.preprocess_redcap_data(redcap_filepath=os.path.join(app.config['UPLOAD_FOLDER'], filename),
-                             disease_type=analysis_type,
-                             save_as_single_file=True)
-                             
-        return render_template('result.html')
+        return redirect(url_for('job_result', job_id=job.job_id))
 
     return render_template('index.html')
 
-@app.route('/uploads/preprocessed_redcap_data/<filename>')
-def download_file(filename):
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], 'preprocessed_redcap_data', filename)
-    return send_file(file_path, as_attachment=True)
+def get_job_status(job_id):
+
+    # the job may run in another app process
+    job = job_queue.get(job_id)
+    if job is not None:
+        return job.to_dict()
+
+    status_path = workspaces.get_path(job_id, JOB_STATUS_FILENAME)
+    job_status = load_job_status(status_path) if status_path is not None else None
+    if job_status is None:
+        abort(404)
+
+    return job_status
+
+@app.route('/jobs/<job_id>')
+def job_result(job_id):
+    # polls the status until the outputs are ready
+    return render_template('result.html', job=get_job_status(job_id))
+
+@app.route('/jobs/<job_id>/status')
+def job_status(job_id):
+    return jsonify(get_job_status(job_id))
+
+@app.route('/jobs/<job_id>/files/<filename>')
+def download_file(job_id, filename):
+    output_dir = workspaces.get_output_dir(job_id)
+    if output_dir is None:
+        abort(404)
+    # send_from_directory refuses the paths outside of the job outputs
+    return send_from_directory(output_dir, filename, as_attachment=True)
 
 def run():
-    app.run(debug=True)
+    init_app().run(debug=True)
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    run()
@@ -0,0 +1,258 @@
+import io
+import os
+import sys
+import time
+import json
+import shutil
+import argparse
+import tempfile
+import contextlib
+import subprocess
+import tracemalloc
+
+from redcap_preprocessing import split_clinical_data_from_redcap
+from redcap_preprocessing import split_treatment_data_from_redcap
+from redcap_preprocessing import split_molecular_data_from_redcap
+from redcap_preprocessing.conversion_tables import get_conversion_table_path
+from redcap_preprocessing.dataset import RedcapDataset
+from redcap_preprocessing.redcap_preprocessing import preprocess_redcap_data
+from redcap_preprocessing.synthetic import SyntheticSchema, write_redcap_export
+
+# number of records of the synthetic cohorts
+BENCHMARK_SIZES = (1000, 10000, 100000)
+
+SPLITTERS = {'clinical': split_clinical_data_from_redcap.split_clinical_data,
+             'treatment': split_treatment_data_from_redcap.split_treatment_data,
+             'molecular': split_molecular_data_from_redcap.split_molecular_data}
+
+# entry points of the command line and the app processes -> seconds their
+# import should take at most, loading none of the heavy dependencies. The
+# data processing modules, redcap_preprocessing.redcap_preprocessing included,
+# import pandas at the top
+COLD_START_MODULES = {'app': 1.0,
+                      'redcap_preprocessing.cli': 0.5,
+                      'redcap_preprocessing.jobs': 0.5}
+
+# imported by the entry points on the first run only
+HEAVY_MODULES = ('pandas', 'numpy', 'pyarrow', 'chardet', 'dateutil',
+                 'redcap_preprocessing.split_clinical_data_from_redcap',
+                 'redcap_preprocessing.split_treatment_data_from_redcap',
+                 'redcap_preprocessing.split_molecular_data_from_redcap')
+
+def measure_import(module: str,
+                   repeat: int = 3):
+    """
+    Import a module in fresh interpreters, from the working directory.
+
+    Returns the best import time in seconds, and the heavy modules loaded
+    by the import.
+
+    Parameters
+    ----------
+    module: str
+        module to import, e.g. 'redcap_preprocessing.cli'
+    repeat: int
+        number of interpreters, the first ones warming the bytecode cache
+    """
+
+    code = ('import sys, json, time\n'
+            'start = time.perf_counter()\n'
+            f'import {module}\n'
+            'seconds = time.perf_counter() - start\n'
+            f'print(json.dumps([seconds, [name for name in {HEAVY_MODULES!r} if name in sys.modules]]))\n')
+
+    seconds = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+        import_seconds, heavy_modules = json.loads(output.splitlines()[-1])
+        seconds.append(import_seconds)
+
+    return {'module': module, 'seconds': min(seconds), 'heavy_modules': heavy_modules}
+
+def measure(function, *args, trace_memory: bool = True, **kwargs):
+    """
+    Time a call, then measure its peak memory in a second traced call, the
+    tracing slowing it down.
+
+    Returns the result of the timed call, its duration in seconds and the
+    peak memory in bytes, None if not traced.
+
+    Parameters
+    ----------
+    function: callable
+        function to benchmark, its prints are silenced
+    trace_memory: bool
+        whether the peak memory is measured
+    """
+
+    with contextlib.redirect_stdout(io.StringIO()):
+
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        seconds = time.perf_counter() - start
+
+        peak_memory = None
+        if trace_memory:
+            tracemalloc.start()
+            try:
+                function(*args, **kwargs)
+                peak_memory = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+    return result, seconds, peak_memory
+
+def benchmark_cohort(disease_type: str,
+                     n_records: int,
+                     work_dir: str,
+                     prototype_path: str,
+                     save_as_single_file: bool = False,
+                     trace_memory: bool = True,
+                     seed: int = 0,
+                     **options):
+    """
+    Benchmark the loading of a synthetic export, each splitter and the end
+    to end preprocess_redcap_data.
+
+    Returns one result per stage, with its duration and peak memory.
+
+    Parameters
+    ----------
+    disease_type: str
+        'CRC' or 'PDAC'
+    n_records: int
+        number of records of the synthetic export
+    work_dir: str
+        directory of the export and the outputs
+    prototype_path: str
+        path to the real export the synthetic one is modelled on, see
+        synthetic.SyntheticSchema
+    save_as_single_file: bool
+        whether the data is saved as single files
+    trace_memory: bool
+        whether the peak memory is measured
+    seed: int
+        seed of the synthetic export
+    options: dict
+        other arguments of preprocess_redcap_data, e.g. workers
+    """
+
+    redcap_filepath = os.path.join(work_dir, f'redcap_{disease_type}_{n_records}.csv')
+    conversion_table_filepath = get_conversion_table_path(disease_type)
+
+    n_rows = write_redcap_export(redcap_filepath, disease_type, n_records, prototype_path, seed, schema=SyntheticSchema(disease_type, prototype_path))
+
+    def get_output_dir(stage):
+        output_dir = os.path.join(work_dir, f'{disease_type}_{n_records}_{stage}')
+        shutil.rmtree(output_dir, ignore_errors=True)
+        return output_dir
+
+    results = []
+
+    def add_result(stage, seconds, peak_memory):
+        results.append({'disease_type': disease_type,
+                        'records': n_records,
+                        'rows': n_rows,
+                        'stage': stage,
+                        'seconds': seconds,
+                        'peak_memory_mb': None if peak_memory is None else peak_memory / 2**20})
+
+    dataset, seconds, peak_memory = measure(RedcapDataset.from_csv, redcap_filepath, conversion_table_filepath, disease_type,
+                                            trace_memory=trace_memory)
+    add_result('load', seconds, peak_memory)
+
+    # the consolidated treatment table reads the clinical one
+    splitters_dir = get_output_dir('splitters')
+    os.makedirs(splitters_dir)
+
+    for stage, split_data in SPLITTERS.items():
+        _, seconds, peak_memory = measure(split_data, dataset, splitters_dir, save_as_single_file, trace_memory=trace_memory)
+        add_result(stage, seconds, peak_memory)
+
+    _, seconds, peak_memory = measure(preprocess_redcap_data, redcap_filepath, disease_type, save_as_single_file,
+                                      get_output_dir('end_to_end'), trace_memory=trace_memory, **options)
+    add_result('end_to_end', seconds, peak_memory)
+
+    return results
+
+def format_results(results: list,
+                   header: bool = True):
+
+    lines = []
+    if header:
+        lines.append(f'{"disease":<8}{"records":>9}{"rows":>10}  {"stage":<12}{"seconds":>10}{"peak MB":>10}')
+
+    for result in results:
+        peak_memory = '-' if result['peak_memory_mb'] is None else f'{result["peak_memory_mb"]:.1f}'
+        lines.append(f'{result["disease_type"]:<8}{result["records"]:>9}{result["rows"]:>10}  {result["stage"]:<12}'
+                     f'{result["seconds"]:>10.3f}{peak_memory:>10}')
+
+    return '\n'.join(lines)
+
+def format_import_results(results: list):
+
+    lines = [f'{"module":<40}{"seconds":>10}  heavy modules']
+
+    for result in results:
+        lines.append(f'{result["module"]:<40}{result["seconds"]:>10.3f}  {", ".join(result["heavy_modules"]) or "-"}')
+
+    return '\n'.join(lines)
+
+def main(argv: list = None):
+    """
+    Run the benchmark suite from the root of the repository, e.g.
+
+        python -m redcap_preprocessing.benchmark --prototype data/prototype_redcap.csv --records 1000 10000 --disease CRC
+    """
+
+    parser = argparse.ArgumentParser(description='Benchmark the splitters on synthetic REDCap exports.')
+    parser.add_argument('--prototype', help='real export the synthetic ones are modelled on, e.g. data/prototype_redcap.csv')
+    parser.add_argument('--records', type=int, nargs='+', default=list(BENCHMARK_SIZES),
+                        help='numbers of records of the synthetic exports')
+    parser.add_argument('--disease', nargs='+', default=['CRC', 'PDAC'], choices=['CRC', 'PDAC'])
+    parser.add_argument('--single-file', action='store_true', help='save the data as single files')
+    parser.add_argument('--workers', type=int, default=1, help='processes of the end to end run')
+    parser.add_argument('--no-memory', action='store_true', help='skip the peak memory measurement')
+    parser.add_argument('--work-dir', help='directory of the exports and outputs, temporary by default')
+    parser.add_argument('--imports', action='store_true', help='only time the imports of the entry points, see COLD_START_MODULES')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    if args.imports:
+        results = [measure_import(module) for module in COLD_START_MODULES]
+        print(format_import_results(results), flush=True)
+
+        if args.json is not None:
+            with open(args.json, 'w') as file:
+                json.dump(results, file, indent=1)
+
+        return results
+
+    if args.prototype is None:
+        parser.error('--prototype is required to generate the synthetic exports')
+
+    results = []
+
+    with contextlib.ExitStack() as stack:
+
+        work_dir = args.work_dir
+        if work_dir is None:
+            work_dir = stack.enter_context(tempfile.TemporaryDirectory())
+        os.makedirs(work_dir, exist_ok=True)
+
+        for disease_type in args.disease:
+            for n_records in args.records:
+                cohort_results = benchmark_cohort(disease_type, n_records, work_dir, args.prototype, args.single_file,
+                                                  not args.no_memory, workers=args.workers)
+                # printed as the cohorts complete, the largest ones take a while
+                print(format_results(cohort_results, header=len(results) == 0), flush=True)
+                results.extend(cohort_results)
+
+    if args.json is not None:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=1)
+
+    return results
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,191 @@
+import numpy as np
+import pandas as pd
+
+from redcap_preprocessing.dates import format_dates
+from redcap_preprocessing.utils import get_cell_line_code, standardize_code
+
+# repeat instrument holding the PDO cell lines
+ORGANOID_INSTRUMENTS = {'CRC': 'organoides',
+                        'PDAC': 'organodes'}
+
+# fields of the repeat instrument holding the cell line code and date
+CELL_LINE_COLUMNS = {'CRC': ['nom_lign_e', 'date_sample'],
+                     'PDAC': ['namepdo', 'date_pdo']}
+
+class CellLineIndex:
+    """
+    Cell line codes and row positions of every record, computed in a single
+    pass over the redcap data set.
+
+    Parameters
+    ----------
+    redcap: pd.DataFrame
+        redcap data set
+    disease_type: str
+        'CRC' or 'PDAC'
+    """
+
+    def __init__(self,
+                 redcap: pd.DataFrame,
+                 disease_type: str):
+
+        # record_id -> positions of its rows in the redcap data set
+        self.rows = redcap.groupby('record_id', sort=False).indices
+
+        # record_id -> (cell_line_code, date_cell_line), as returned by
+        # utils.get_cell_line_code
+        self.cell_lines = {}
+
+        organoid_rows = redcap[redcap['redcap_repeat_instrument'] == ORGANOID_INSTRUMENTS[disease_type]]
+        organoid_row_positions = organoid_rows.groupby('record_id', sort=False).indices
+
+        for record_id in self.rows:
+
+            positions = organoid_row_positions.get(record_id, np.array([], dtype=int))
+
+            self.cell_lines[record_id] = get_cell_line_code(disease_type,
+                                                            organoid_rows.iloc[positions],
+                                                            record_id)
+
+    def get_cell_line_code(self, record_id):
+        """
+        Get the cell line codes and dates of a record.
+
+        Parameters
+        ----------
+        record_id: str
+        """
+
+        return self.cell_lines.get(record_id, ('', ''))
+
+    def get_rows(self, record_id, mask = None):
+        """
+        Get the positions of the rows of a record in the redcap data set.
+
+        Parameters
+        ----------
+        record_id: str
+        mask: np.ndarray
+            optional boolean array over the redcap data set, only the rows
+            where it is set are returned
+        """
+
+        positions = self.rows.get(record_id, np.array([], dtype=int))
+
+        if mask is not None:
+            positions = positions[mask[positions]]
+
+        return positions
+
+def get_cell_line_table(cell_lines: list,
+                        placeholder_indexes: list,
+                        standardize_sister_codes: bool = False):
+    """
+    One row per record and cell line, in output order, with the position of
+    the record, its cell_line_code, sister_cell_line_codes and formatted
+    date_cell_line.
+
+    The ';'-joined codes and dates of each record are exploded in lockstep,
+    the extra codes or dates of a record being dropped. The empty codes are
+    replaced by XX placeholders numbered from the placeholder index of the
+    record.
+
+    Parameters
+    ----------
+    cell_lines: list
+        (cell_line_code, date_cell_line) of each record, as returned by
+        CellLineIndex.get_cell_line_code
+    placeholder_indexes: list
+        number of the first XX placeholder code of each record
+    standardize_sister_codes: bool
+        whether the sister codes are standardized too, as in the clinical
+        tables
+    """
+
+    codes = pd.Series([cell_line_code for cell_line_code, _ in cell_lines], dtype=object)
+    dates = pd.Series([date_cell_line for _, date_cell_line in cell_lines], dtype=object)
+
+    # TO IMPROVE
+    codes = codes.str.replace('CGR', 'GR', regex=False).where(codes.str.contains('CGR', regex=False),
+                                                              codes.str.replace('PGR', 'GR', regex=False))
+
+    extracted_codes = codes.str.split(';')
+    extracted_dates = dates.str.split(';')
+
+    # the codes and dates are paired in order
+    lengths = [min(len(record_codes), len(record_dates)) for record_codes, record_dates in zip(extracted_codes, extracted_dates)]
+
+    cell_line_table = pd.DataFrame({'position': np.arange(len(cell_lines)),
+                                    'cell_line_code': [record_codes[:length] for record_codes, length in zip(extracted_codes, lengths)],
+                                    'date_cell_line': [record_dates[:length] for record_dates, length in zip(extracted_dates, lengths)]})
+    cell_line_table = cell_line_table.explode(['cell_line_code', 'date_cell_line'], ignore_index=True)
+
+    positions = cell_line_table['position'].to_numpy()
+    cell_line_codes = cell_line_table['cell_line_code'].astype(object)
+
+    # standardized codes, or numbered placeholders for the missing ones
+    is_placeholder = cell_line_codes == ''
+    placeholder_numbers = np.asarray(placeholder_indexes, dtype=int)[positions] + is_placeholder.groupby(positions).cumsum().to_numpy() - 1
+    cell_line_table['cell_line_code'] = np.where(is_placeholder,
+                                                 'XX' + pd.Series(placeholder_numbers).astype(str).str.zfill(4),
+                                                 'GR' + cell_line_codes.str[2:].str.zfill(4))
+
+    # the other codes of the record, compared as extracted
+    standardize = standardize_code if standardize_sister_codes else str
+    cell_line_table['sister_cell_line_codes'] = [';'.join(standardize(code) for code in extracted_codes[position] if code != cell_line_code)
+                                                 for position, cell_line_code in zip(positions, cell_line_table['cell_line_code'])]
+
+    # each date parsed once, before the tables are fanned out
+    format_dates(cell_line_table)
+
+    return cell_line_table[['position', 'cell_line_code', 'sister_cell_line_codes', 'date_cell_line']]
+
+def fan_out_cell_lines(data: pd.DataFrame,
+                       record_ids: list,
+                       record_rows: list,
+                       cell_lines: list,
+                       placeholder_indexes: list,
+                       standardize_sister_codes: bool = False):
+    """
+    Repeat the rows of each record once per cell line, with the
+    cell_line_code, sister_cell_line_codes, date_cell_line and record_id
+    columns, see get_cell_line_table.
+
+    Returns the fanned out table, and a table of the cell lines with the
+    start and stop positions of their rows in it. The records without rows
+    have no cell lines.
+
+    Parameters
+    ----------
+    data: pd.DataFrame
+        converted rows of the records, dates formatted
+    record_ids: list
+        record ids
+    record_rows: list
+        positions in data of the rows of each record
+    cell_lines: list
+        (cell_line_code, date_cell_line) of each record
+    placeholder_indexes: list
+        number of the first XX placeholder code of each record
+    standardize_sister_codes: bool
+        whether the sister codes are standardized too
+    """
+
+    cell_line_table = get_cell_line_table(cell_lines, placeholder_indexes, standardize_sister_codes)
+
+    row_counts = np.array([len(record_rows[position]) for position in cell_line_table['position']], dtype=int)
+    cell_line_table = cell_line_table[row_counts > 0].reset_index(drop=True)
+    row_counts = row_counts[row_counts > 0]
+
+    positions = cell_line_table['position'].to_numpy()
+    rows = np.concatenate([record_rows[position] for position in positions]) if len(positions) > 0 else np.array([], dtype=int)
+
+    fanned_out_data = data.iloc[rows].assign(cell_line_code=np.repeat(cell_line_table['cell_line_code'].to_numpy(), row_counts),
+                                             sister_cell_line_codes=np.repeat(cell_line_table['sister_cell_line_codes'].to_numpy(), row_counts),
+                                             date_cell_line=np.repeat(cell_line_table['date_cell_line'].to_numpy(), row_counts),
+                                             record_id=np.repeat(pd.Series(record_ids).to_numpy()[positions], row_counts))
+
+    cell_line_table['stop'] = np.cumsum(row_counts)
+    cell_line_table['start'] = cell_line_table['stop'] - row_counts
+
+    return fanned_out_data, cell_line_table
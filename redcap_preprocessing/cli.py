@@ -0,0 +1,306 @@
+import os
+import sys
+import glob
+import json
+import time
+import logging
+import argparse
+
+from redcap_preprocessing import report
+
+# the preprocessing modules, and pandas with them, are imported by the
+# functions using them, not when the command starts
+
+logger = logging.getLogger(__name__)
+
+# exports processed at the same time
+DEFAULT_JOBS = 4
+
+# rows read at once to find the repeat instrument of the PDO cell lines
+DETECTION_CHUNKSIZE = 10000
+
+def expand_exports(patterns: list):
+    """
+    Paths of the exports matching the given paths or globs, without
+    duplicates, in the given order.
+
+    Raises a ValueError if a pattern matches no file.
+
+    Parameters
+    ----------
+    patterns: list
+        paths or globs, e.g. 'exports/*.csv'
+    """
+
+    redcap_filepaths = []
+
+    for pattern in patterns:
+
+        matches = sorted(path for path in glob.glob(pattern) if os.path.isfile(path))
+        if len(matches) == 0:
+            raise ValueError(f'No export matches {pattern}.')
+
+        for path in matches:
+            if path not in redcap_filepaths:
+                redcap_filepaths.append(path)
+
+    return redcap_filepaths
+
+def detect_disease_type(redcap_filepath: str):
+    """
+    Disease type of an export, from the repeat instrument of its PDO cell
+    lines, 'organoides' for CRC and 'organodes' for PDAC.
+
+    Only the redcap_repeat_instrument column is parsed, in chunks, until the
+    first chunk holding a cell line. Raises a ValueError if the export has
+    neither, or both in that chunk.
+
+    Parameters
+    ----------
+    redcap_filepath: str
+        path to redcap data set
+    """
+
+    import pandas as pd
+
+    from redcap_preprocessing.cell_line_index import ORGANOID_INSTRUMENTS
+    from redcap_preprocessing.dataset import get_redcap_encoding
+    from redcap_preprocessing.utils import get_delimiter
+
+    redcap_delimiter = get_delimiter(redcap_filepath)
+    file_encoding = get_redcap_encoding(redcap_filepath)
+
+    header = pd.read_csv(redcap_filepath, delimiter=redcap_delimiter, encoding=file_encoding, nrows=0)
+    if 'redcap_repeat_instrument' not in header.columns:
+        raise ValueError(f'Could not detect the disease type of {redcap_filepath}: there is no redcap_repeat_instrument column.')
+
+    disease_types = []
+
+    chunks = pd.read_csv(redcap_filepath, delimiter=redcap_delimiter, encoding=file_encoding,
+                         usecols=['redcap_repeat_instrument'], dtype=str, chunksize=DETECTION_CHUNKSIZE)
+
+    with chunks:
+        for chunk in chunks:
+            instruments = set(chunk['redcap_repeat_instrument'].dropna())
+            disease_types = [disease_type for disease_type, instrument in ORGANOID_INSTRUMENTS.items() if instrument in instruments]
+            if len(disease_types) > 0:
+                break
+
+    if len(disease_types) != 1:
+        raise ValueError(f'Could not detect the disease type of {redcap_filepath}, '
+                         f'found the instruments of {disease_types or "no disease type"}.')
+
+    return disease_types[0]
+
+def get_output_dirs(redcap_filepaths: list,
+                    output_dir: str):
+    """
+    Output directory of each export, named after the export in output_dir,
+    numbered if several exports have the same name.
+
+    Parameters
+    ----------
+    redcap_filepaths: list
+        paths to the redcap data sets
+    output_dir: str
+        directory of the output directories
+    """
+
+    output_dirs = []
+    names = set()
+
+    for redcap_filepath in redcap_filepaths:
+
+        name = os.path.splitext(os.path.basename(redcap_filepath))[0]
+        unique_name, index = name, 1
+        while unique_name in names:
+            index += 1
+            unique_name = f'{name}_{index}'
+        names.add(unique_name)
+
+        output_dirs.append(os.path.join(output_dir, unique_name))
+
+    return output_dirs
+
+def preprocess_export(redcap_filepath: str,
+                      disease_type: str,
+                      output_dir: str,
+                      **options):
+    """
+    Preprocess an export, and return a summary of the run, with its error if
+    it failed.
+
+    Parameters
+    ----------
+    redcap_filepath: str
+        path to redcap data set
+    disease_type: str
+        'CRC', 'PDAC', or None to detect it
+    output_dir: str
+        output directory
+    options: dict
+        other arguments of preprocess_redcap_data
+    """
+
+    from redcap_preprocessing.redcap_preprocessing import preprocess_redcap_data
+
+    summary = {'export': redcap_filepath,
+               'disease_type': disease_type,
+               'output_dir': output_dir,
+               'status': 'failed',
+               'error': None,
+               'seconds': None,
+               'report': None}
+
+    start_time = time.perf_counter()
+
+    try:
+        if disease_type is None:
+            summary['disease_type'] = disease_type = detect_disease_type(redcap_filepath)
+        summary['report'] = preprocess_redcap_data(redcap_filepath, disease_type, output_dir=output_dir, **options)
+    except Exception as error:
+        logger.exception('Could not preprocess %s.', redcap_filepath)
+        summary['error'] = str(error)
+    else:
+        summary['status'] = 'done'
+    finally:
+        summary['seconds'] = time.perf_counter() - start_time
+
+    return summary
+
+def preprocess_exports(redcap_filepaths: list,
+                       output_dir: str,
+                       disease_type: str = None,
+                       jobs: int = DEFAULT_JOBS,
+                       log_level = None,
+                       **options):
+    """
+    Preprocess several exports concurrently, each in its own output
+    directory, and return the summary of each run, see preprocess_export.
+
+    The exports are processed in jobs processes, the conversion being CPU
+    bound. A single job runs in the current process.
+
+    Parameters
+    ----------
+    redcap_filepaths: list
+        paths to the redcap data sets
+    output_dir: str
+        directory of the output directories, see get_output_dirs
+    disease_type: str
+        'CRC' or 'PDAC' for all the exports, detected for each export if None
+    jobs: int
+        number of processes converting the exports at the same time
+    log_level: int or str
+        optional level of the messages of the export processes printed on
+        stderr, see report.configure_logging
+    options: dict
+        other arguments of preprocess_redcap_data, e.g. save_as_single_file
+    """
+
+    from redcap_preprocessing.parallel import get_process_pool
+
+    assert disease_type is None or disease_type in ['CRC', 'PDAC']
+    assert jobs >= 1
+
+    output_dirs = get_output_dirs(redcap_filepaths, output_dir)
+    jobs = min(jobs, max(len(redcap_filepaths), 1))
+
+    if jobs == 1:
+        return [preprocess_export(redcap_filepath, disease_type, export_output_dir, **options)
+                for redcap_filepath, export_output_dir in zip(redcap_filepaths, output_dirs)]
+
+    initializer = report.configure_logging if log_level is not None else None
+
+    with get_process_pool(jobs, initializer, (log_level,)) as executor:
+        futures = [executor.submit(preprocess_export, redcap_filepath, disease_type, export_output_dir, **options)
+                   for redcap_filepath, export_output_dir in zip(redcap_filepaths, output_dirs)]
+        return [future.result() for future in futures]
+
+def format_summaries(summaries: list):
+    """
+    Table of the runs of preprocess_exports, their timings and counts.
+    """
+
+    from redcap_preprocessing.incremental import MODALITIES
+
+    lines = [f'{"export":<32}{"disease":<8}{"status":<8}{"records":>9}{"rows in":>9}'
+             + ''.join(f'{modality + " out":>15}' for modality in MODALITIES)
+             + f'{"files":>7}{"seconds":>9}']
+
+    for summary in summaries:
+
+        counters = summary['report']['counters'] if summary['report'] is not None else {}
+        export = os.path.basename(summary['export'])
+
+        lines.append(f'{export[:31]:<32}{summary["disease_type"] or "-":<8}{summary["status"]:<8}'
+                     f'{counters.get("records", 0):>9}{counters.get("rows_in", 0):>9}'
+                     + ''.join(f'{counters.get(modality + "_rows_out", 0):>15}' for modality in MODALITIES)
+                     + f'{counters.get("files_written", 0):>7}{summary["seconds"]:>9.2f}')
+
+    for summary in summaries:
+        if summary['error'] is not None:
+            lines.append(f'{summary["export"]}: {summary["error"]}')
+
+    return '\n'.join(lines)
+
+def main(argv: list = None):
+    """
+    Preprocess REDCap exports, e.g.
+
+        redcap-preprocess exports/*.csv --output-dir preprocessed --jobs 4
+
+    Returns 1 if any export failed, 0 otherwise.
+    """
+
+    from redcap_preprocessing.columnar import OUTPUT_FORMATS
+    from redcap_preprocessing.readers import READER_ENGINES
+
+    parser = argparse.ArgumentParser(description='Convert REDCap exports into the clinical, treatment and molecular tables.')
+    parser.add_argument('exports', nargs='+', help='paths or globs of the exports')
+    parser.add_argument('--disease', choices=['CRC', 'PDAC'], help='disease type of all the exports, detected for each export by default')
+    parser.add_argument('--output-dir', default='preprocessed_redcap_data', help='directory of the output directories, one per export')
+    parser.add_argument('--jobs', type=int, default=DEFAULT_JOBS, help='processes converting exports at the same time')
+    parser.add_argument('--workers', type=int, default=1, help='processes of each export')
+    parser.add_argument('--single-file', action='store_true', help='save the data as single files')
+    parser.add_argument('--format', default='csv', choices=OUTPUT_FORMATS, help='format of the output files')
+    parser.add_argument('--chunksize', type=int, help='records read at once, the whole export by default')
+    parser.add_argument('--reader-engine', choices=READER_ENGINES, help='parser of the exports, pyarrow if it is installed by default')
+    parser.add_argument('--cache-dir', help='directory caching the outputs of the --single-file runs')
+    parser.add_argument('--log-level', default='WARNING', help='level of the messages printed on stderr')
+    parser.add_argument('--json', help='also write the summaries to this file')
+    args = parser.parse_args(argv)
+
+    # only the consolidated outputs are cached
+    if args.cache_dir is not None and not args.single_file:
+        parser.error('--cache-dir requires --single-file')
+
+    report.configure_logging(args.log_level)
+
+    try:
+        redcap_filepaths = expand_exports(args.exports)
+    except ValueError as error:
+        parser.error(str(error))
+
+    summaries = preprocess_exports(redcap_filepaths,
+                                   args.output_dir,
+                                   args.disease,
+                                   args.jobs,
+                                   log_level=args.log_level,
+                                   save_as_single_file=args.single_file,
+                                   workers=args.workers,
+                                   chunksize=args.chunksize,
+                                   output_format=args.format,
+                                   cache_dir=args.cache_dir,
+                                   reader_engine=args.reader_engine)
+
+    print(format_summaries(summaries), flush=True)
+
+    if args.json is not None:
+        with open(args.json, 'w') as file:
+            json.dump(summaries, file, indent=1)
+
+    return int(any(summary['status'] == 'failed' for summary in summaries))
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,181 @@
+import io
+
+import pandas as pd
+
+from redcap_preprocessing.dates import OUTPUT_DATE_FORMAT
+
+OUTPUT_FORMATS = ('csv', 'parquet', 'arrow')
+
+OUTPUT_EXTENSIONS = {'csv': '.csv',
+                     'parquet': '.parquet',
+                     'arrow': '.arrow'}
+
+# kinds of the columns added by the splitters, next to the ones of the
+# conversion plan, see ConversionPlan.get_column_kinds
+ADDED_COLUMN_KINDS = {'sister_cell_line_codes': 'list',
+                      'disease_type': 'category',
+                      'treatment_type': 'category'}
+
+LIST_SEPARATOR = ';'
+
+def import_pyarrow():
+
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.ipc
+    except ImportError:
+        raise ImportError('The parquet and arrow output formats need pyarrow, install it with pip install pyarrow.')
+
+    return pyarrow
+
+def get_output_path(path: str,
+                    output_format: str):
+    """
+    Add the extension of the output format to a path.
+
+    Parameters
+    ----------
+    path: str
+        path without extension
+    output_format: str
+        one of OUTPUT_FORMATS
+    """
+
+    return path + OUTPUT_EXTENSIONS[output_format]
+
+def to_arrow_array(values: pd.Series,
+                   column_kind: str = None):
+
+    pa = import_pyarrow()
+
+    is_missing = (values.isna() | (values.astype(str) == '')).to_numpy()
+
+    if column_kind == 'date':
+        dates = pd.to_datetime(values.where(~is_missing), format=OUTPUT_DATE_FORMAT, errors='coerce')
+        # the dates left unparsed by format_dates stay as text
+        if not (dates.isna().to_numpy() & ~is_missing).any():
+            return pa.array(dates.dt.date, type=pa.date32(), from_pandas=True)
+        column_kind = None
+
+    if column_kind == 'list':
+        return pa.array([None if missing else str(value).split(LIST_SEPARATOR) for value, missing in zip(values, is_missing)],
+                        type=pa.list_(pa.string()))
+
+    if column_kind == 'category':
+        return pa.array([None if missing else str(value) for value, missing in zip(values, is_missing)],
+                        type=pa.string()).dictionary_encode()
+
+    try:
+        return pa.array(values.where(~is_missing, None), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # mixed raw values, e.g. numbers and text
+        return pa.array([None if missing else str(value) for value, missing in zip(values, is_missing)],
+                        type=pa.string())
+
+def to_arrow_table(frame: pd.DataFrame,
+                   column_kinds: dict = None):
+    """
+    Convert an output table to an arrow table, with real types instead of
+    the text of the csvs.
+
+    The date columns are converted to dates, the ';'-joined values to lists
+    and the option columns to dictionary encoded strings. Empty cells become
+    nulls. The index, written as the first column of the csvs, is dropped.
+
+    Parameters
+    ----------
+    frame: pd.DataFrame
+        output table of a splitter
+    column_kinds: dict
+        column name -> 'list' or 'category', see ConversionPlan.get_column_kinds
+    """
+
+    pa = import_pyarrow()
+
+    column_kinds = {**ADDED_COLUMN_KINDS, **(column_kinds or {})}
+
+    arrays = []
+    for column in frame.columns:
+        column_kind = 'date' if 'date' in str(column).lower() else column_kinds.get(column)
+        arrays.append(to_arrow_array(frame[column], column_kind))
+
+    return pa.Table.from_arrays(arrays, names=[str(column) for column in frame.columns])
+
+def write_table(frame: pd.DataFrame,
+                file,
+                output_format: str,
+                column_kinds: dict = None):
+    """
+    Write an output table in the given format.
+
+    Parameters
+    ----------
+    frame: pd.DataFrame
+        output table of a splitter
+    file: str or file object
+        destination, opened in binary mode
+    output_format: str
+        one of OUTPUT_FORMATS
+    column_kinds: dict
+        column name -> 'list' or 'category', see ConversionPlan.get_column_kinds
+    """
+
+    assert output_format in OUTPUT_FORMATS
+
+    if output_format == 'csv':
+        file.write(frame.to_csv(sep=';').encode('utf-8'))
+        return None
+
+    pa = import_pyarrow()
+    table = to_arrow_table(frame, column_kinds)
+
+    if output_format == 'parquet':
+        pa.parquet.write_table(table, file)
+    elif output_format == 'arrow':
+        with pa.ipc.new_file(file, table.schema) as arrow_writer:
+            arrow_writer.write_table(table)
+
+    return None
+
+def render_table(frame: pd.DataFrame,
+                 output_format: str,
+                 column_kinds: dict = None):
+
+    buffer = io.BytesIO()
+    write_table(frame, buffer, output_format, column_kinds)
+
+    return buffer.getvalue()
+
+def read_table(path: str,
+               output_format: str):
+    """
+    Read back an output table, with the dates as DD/MM/YYYY text as in the
+    csvs.
+
+    Parameters
+    ----------
+    path: str
+        path of the table, with its extension
+    output_format: str
+        one of OUTPUT_FORMATS
+    """
+
+    if output_format == 'csv':
+        return pd.read_csv(path, sep=';')
+
+    pa = import_pyarrow()
+
+    if output_format == 'parquet':
+        table = pa.parquet.read_table(path)
+    elif output_format == 'arrow':
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+
+    frame = table.to_pandas()
+
+    for field in table.schema:
+        if pa.types.is_date(field.type):
+            frame[field.name] = pd.to_datetime(frame[field.name]).dt.strftime(OUTPUT_DATE_FORMAT)
+
+    return frame
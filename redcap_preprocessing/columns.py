@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype, is_bool_dtype
+
+from redcap_preprocessing.cell_line_index import CELL_LINE_COLUMNS
+
+# columns read by the splitters, next to the redcap_name of the conversion table
+SPECIAL_COLUMNS = ['record_id', 'redcap_repeat_instrument']
+
+# free text replacing the 'other' and 'clinical_trial' chemotherapy types
+CHEMOTHERAPY_TYPE_DETAIL_COLUMNS = {'CRC': ['other_iv'],
+                                    'PDAC': ['spe_autre_met', 'bras_essai_clinique_met']}
+
+def get_redcap_columns(redcap_conversion_table: pd.DataFrame,
+                       disease_type: str):
+    """
+    Columns of the export used by the splitters, in the order of the
+    conversion table.
+
+    Parameters
+    ----------
+    redcap_conversion_table: pd.DataFrame
+        conversion table, all data types included
+    disease_type: str
+        'CRC' or 'PDAC'
+    """
+
+    redcap_columns = SPECIAL_COLUMNS + CELL_LINE_COLUMNS[disease_type] + CHEMOTHERAPY_TYPE_DETAIL_COLUMNS[disease_type]
+    redcap_columns = redcap_columns + list(redcap_conversion_table['redcap_name'])
+
+    return list(dict.fromkeys(redcap_columns))
+
+def check_redcap_columns(columns,
+                         redcap_columns: list):
+    """
+    Check that the export has all the columns used by the splitters.
+
+    Parameters
+    ----------
+    columns: list
+        columns of the export
+    redcap_columns: list
+        columns used by the splitters, see get_redcap_columns
+    """
+
+    missing_columns = [column for column in redcap_columns if column not in set(columns)]
+
+    if len(missing_columns) > 0:
+        raise ValueError(f'The redcap export is missing {len(missing_columns)} columns used by the conversion table: '
+                         f'{", ".join(missing_columns)}')
+
+def get_compact_dtypes(redcap_conversion_table: pd.DataFrame):
+    """
+    Compact types of the export columns that are only compared to options by
+    the conversion rules, so their values are never written out:
+    'checkbox' for the type 2 columns, 'category' for the type 3 columns and
+    the repeat instrument.
+
+    Parameters
+    ----------
+    redcap_conversion_table: pd.DataFrame
+        conversion table, all data types included
+    """
+
+    matching_types = redcap_conversion_table.groupby('redcap_name')['matching_type'].agg(set)
+
+    compact_dtypes = {'redcap_repeat_instrument': 'category'}
+
+    for redcap_name, column_matching_types in matching_types.items():
+        if redcap_name in compact_dtypes:
+            continue
+        if column_matching_types == {2}:
+            compact_dtypes[redcap_name] = 'checkbox'
+        elif column_matching_types == {3}:
+            compact_dtypes[redcap_name] = 'category'
+
+    return compact_dtypes
+
+def compact_redcap(redcap: pd.DataFrame,
+                   compact_dtypes: dict):
+    """
+    Convert the columns of the export to compact types.
+
+    The checkboxes become small integers, or float32 when some rows are
+    empty, and the option codes categoricals. The values compared by the
+    conversion rules are unchanged.
+
+    Parameters
+    ----------
+    redcap: pd.DataFrame
+        redcap data set
+    compact_dtypes: dict
+        column -> 'checkbox' or 'category', see get_compact_dtypes
+    """
+
+    compact_columns = {}
+
+    for column, compact_dtype in compact_dtypes.items():
+
+        if column not in redcap.columns:
+            continue
+
+        values = redcap[column]
+
+        if compact_dtype == 'category':
+            compact_columns[column] = values.astype('category')
+
+        elif compact_dtype == 'checkbox' and is_numeric_dtype(values.dtype) and not is_bool_dtype(values.dtype):
+
+            present_values = values.dropna().to_numpy()
+
+            # e.g. a checkbox holding other codes than 0 and 1
+            if not (np.all(present_values == np.round(present_values)) and np.all(np.abs(present_values) <= np.iinfo(np.int8).max)):
+                continue
+
+            compact_columns[column] = values.astype('int8' if len(present_values) == len(values) else 'float32')
+
+    if len(compact_columns) == 0:
+        return redcap
+
+    return redcap.assign(**compact_columns)
@@ -0,0 +1,178 @@
+import pandas as pd
+from collections import namedtuple
+
+from redcap_preprocessing.utils import get_delimiter
+
+# a single line of the conversion table, once the orakloncology_name and
+# matching_type have been used as lookup keys
+ConversionRule = namedtuple('ConversionRule', ['redcap_name', 'redcap_option', 'orakloncology_option'])
+
+MATCHING_TYPES = (1, 2, 3, 4)
+
+def read_conversion_table(redcap_conversion_table_path: str):
+    """
+    Read the conversion table, all data types included.
+
+    Parameters
+    ----------
+    redcap_conversion_table_path: str
+        path to the redcap conversion table
+    """
+
+    conversion_table_delimiter = get_delimiter(redcap_conversion_table_path)
+    redcap_conversion_table = pd.read_csv(redcap_conversion_table_path, delimiter=conversion_table_delimiter)
+    redcap_conversion_table['redcap_name'] = redcap_conversion_table['redcap_name'].str.strip()
+
+    return redcap_conversion_table
+
+class ConversionPlan:
+    """
+    Conversion table compiled into plain lookup structures.
+
+    The table is scanned once: for every orakloncology_name the rules are
+    grouped by matching type, keeping the order in which they appear in the
+    table, so that the splitters only do dictionary lookups per cell.
+
+    Parameters
+    ----------
+    redcap_conversion_table: pd.DataFrame
+        conversion table between redcap and orakloncology, already filtered
+        on a single data_type
+    """
+
+    def __init__(self, redcap_conversion_table: pd.DataFrame):
+
+        # output columns, in the order of the conversion table
+        self.columns = list(redcap_conversion_table['orakloncology_name'].unique())
+
+        # orakloncology_name -> matching_type -> ordered list of rules
+        self.rules = {column_name: {} for column_name in self.columns}
+
+        for row in redcap_conversion_table.itertuples(index=False):
+            column_rules = self.rules[row.orakloncology_name]
+            column_rules.setdefault(int(row.matching_type), []).append(ConversionRule(row.redcap_name,
+                                                                                      row.redcap_options,
+                                                                                      row.orakloncology_options))
+
+        self.validate()
+
+    @classmethod
+    def from_conversion_table(cls,
+                              redcap_conversion_table: pd.DataFrame,
+                              data_type: str):
+        """
+        Compile the rules of a single data type of a conversion table.
+
+        Parameters
+        ----------
+        redcap_conversion_table: pd.DataFrame
+            conversion table, as returned by read_conversion_table
+        data_type: str
+            one of 'clinical-profile', 'treatment' or 'molecular_profile'
+        """
+
+        return cls(redcap_conversion_table[redcap_conversion_table.data_type == data_type])
+
+    @classmethod
+    def from_csv(cls,
+                 redcap_conversion_table_path: str,
+                 data_type: str):
+        """
+        Read the conversion table and compile the rules of a single data type.
+
+        Parameters
+        ----------
+        redcap_conversion_table_path: str
+            path to the redcap conversion table
+        data_type: str
+            one of 'clinical-profile', 'treatment' or 'molecular_profile'
+        """
+
+        return cls.from_conversion_table(read_conversion_table(redcap_conversion_table_path), data_type)
+
+    def validate(self):
+
+        for column_name, column_rules in self.rules.items():
+
+            unknown_matching_types = [matching_type for matching_type in column_rules if matching_type not in MATCHING_TYPES]
+            if len(unknown_matching_types) > 0:
+                raise ValueError(f'unknown matching types {unknown_matching_types} for column {column_name} in conversion table')
+
+            if 1 in column_rules and len(column_rules[1]) != 1:
+                raise ValueError(f'multiple redcap names found for column {column_name} in a type 1 match')
+
+    def get_column_kinds(self):
+        """
+        Kind of the values of the output columns, used by the columnar output
+        formats: 'list' for the ';'-joined values of several checkboxes or
+        redcap fields, 'category' for a single option. The other columns are
+        not listed.
+        """
+
+        column_kinds = {}
+
+        for column_name, column_rules in self.rules.items():
+
+            # dates are single values, see dates.format_dates
+            if 'date' in column_name.lower():
+                continue
+
+            redcap_names = {rule.redcap_name for rules in column_rules.values() for rule in rules}
+
+            if 2 in column_rules or len(redcap_names) > 1:
+                column_kinds[column_name] = 'list'
+            elif list(column_rules) == [3]:
+                column_kinds[column_name] = 'category'
+
+        return column_kinds
+
+    def matching_types(self, column_name):
+
+        return list(self.rules[column_name])
+
+    def get_rules(self, column_name, matching_type):
+
+        return self.rules[column_name][matching_type]
+
+    def get_content(self, row, column_name, matching_type):
+        """
+        Get the content of a single output cell for one matching type: the
+        value of the redcap column for type 1, the options of the checked
+        checkboxes for type 2, of the selected option codes for type 3, and
+        the non missing values for type 4, joined by ';'.
+
+        Parameters
+        ----------
+        row: pd.Series
+            row of the redcap data set
+        column_name: str
+            orakloncology column name
+        matching_type: int
+            matching type of the rules to apply
+        """
+
+        rules = self.rules[column_name][matching_type]
+
+        if matching_type == 1:
+            return row[rules[0].redcap_name]
+
+        content = []
+
+        for rule in rules:
+
+            value = row[rule.redcap_name]
+
+            if matching_type == 2:
+                if value == 1:
+                    content.append(rule.orakloncology_option)
+
+            elif matching_type == 3:
+                if rule.redcap_option == value:
+                    content.append(rule.orakloncology_option)
+
+            elif matching_type == 4:
+                # test if not nan, then add to content
+                if value == value:
+                    content.append(str(value))
+
+        return ';'.join(content)
@@ -0,0 +1,207 @@
+import io
+import os
+import csv
+import hashlib
+import logging
+import threading
+from importlib import resources
+
+import pandas as pd
+
+from redcap_preprocessing.conversion_plan import MATCHING_TYPES, ConversionPlan
+
+logger = logging.getLogger(__name__)
+
+# conversion tables shipped with the package, in redcap_preprocessing/tables
+TABLES_DIRNAME = 'tables'
+
+CONVERSION_TABLE_COLUMNS = ['matching_type', 'redcap_name', 'redcap_options', 'orakloncology_name', 'orakloncology_options', 'data_type']
+
+# a rule appearing twice has the same values in these columns
+RULE_COLUMNS = ['data_type', 'orakloncology_name', 'matching_type', 'redcap_name', 'redcap_options']
+
+# (path, strict) -> (mtime_ns, size), CompiledConversionTable
+_compiled_tables = {}
+_compiled_tables_lock = threading.Lock()
+
+def get_conversion_table_path(disease_type: str):
+    """
+    Path of the conversion table of a disease type shipped with the package,
+    whatever the working directory.
+
+    Parameters
+    ----------
+    disease_type: str
+        'CRC' or 'PDAC'
+    """
+
+    assert disease_type in ['CRC', 'PDAC']
+
+    return str(resources.files('redcap_preprocessing') / TABLES_DIRNAME / f'redcap_{disease_type}_conversion_table.csv')
+
+class CompiledConversionTable:
+    """
+    Conversion table validated and compiled into a ConversionPlan per data
+    type, see load_conversion_table.
+
+    Parameters
+    ----------
+    redcap_conversion_table: pd.DataFrame
+        conversion table, all data types included, not modified afterwards
+    content_hash: str
+        sha256 of the content of the conversion table file
+    """
+
+    def __init__(self,
+                 redcap_conversion_table: pd.DataFrame,
+                 content_hash: str):
+
+        self.redcap_conversion_table = redcap_conversion_table
+        self.content_hash = content_hash
+
+        # data_type -> ConversionPlan
+        self.conversion_plans = {data_type: ConversionPlan.from_conversion_table(redcap_conversion_table, data_type)
+                                 for data_type in redcap_conversion_table['data_type'].unique()}
+
+def is_packaged_table(redcap_conversion_table_path: str):
+    """
+    Whether a conversion table is one of the tables shipped with the package.
+    """
+
+    packaged_dir = os.path.abspath(str(resources.files('redcap_preprocessing') / TABLES_DIRNAME))
+
+    return os.path.dirname(os.path.abspath(redcap_conversion_table_path)) == packaged_dir
+
+def validate_conversion_table(redcap_conversion_table: pd.DataFrame,
+                              strict: bool = False,
+                              warning_level: int = logging.WARNING):
+    """
+    Check a conversion table, as read from its file.
+
+    Missing columns, unknown matching types and type 1 columns with several
+    rules raise a ValueError. The rules appearing twice and the names with
+    leading or trailing spaces are logged, or raise if strict.
+
+    Parameters
+    ----------
+    redcap_conversion_table: pd.DataFrame
+        conversion table, all data types included
+    strict: bool
+        whether the warnings raise a ValueError too
+    warning_level: int
+        logging level of the warnings, e.g. logging.DEBUG for the known
+        quirks of the packaged tables
+    """
+
+    missing_columns = [column for column in CONVERSION_TABLE_COLUMNS if column not in redcap_conversion_table.columns]
+    if len(missing_columns) > 0:
+        raise ValueError(f'The conversion table is missing the columns {", ".join(missing_columns)}')
+
+    matching_types = redcap_conversion_table['matching_type']
+    unknown_matching_types = sorted(set(matching_types[~matching_types.isin(MATCHING_TYPES)].astype(str)))
+    if len(unknown_matching_types) > 0:
+        raise ValueError(f'Unknown matching types {", ".join(unknown_matching_types)} in the conversion table, '
+                         f'expected one of {MATCHING_TYPES}')
+
+    type_1_rules = redcap_conversion_table[matching_types == 1].groupby(['data_type', 'orakloncology_name']).size()
+    type_1_columns = [f'{orakloncology_name} ({data_type})' for (data_type, orakloncology_name), count in type_1_rules.items() if count > 1]
+    if len(type_1_columns) > 0:
+        raise ValueError(f'Multiple type 1 rules for the columns {", ".join(type_1_columns)} in the conversion table')
+
+    warnings = []
+
+    for column in ['redcap_name', 'orakloncology_name']:
+        names = redcap_conversion_table[column].astype(str)
+        unstripped_names = sorted(set(names[names != names.str.strip()]))
+        if len(unstripped_names) > 0:
+            warnings.append(f'{len(unstripped_names)} {column} with leading or trailing spaces: '
+                            f'{", ".join(repr(name) for name in unstripped_names)}')
+
+    # the redcap names are stripped before use
+    rules = redcap_conversion_table.assign(redcap_name=redcap_conversion_table['redcap_name'].astype(str).str.strip())
+    duplicated_rules = rules[rules.duplicated(RULE_COLUMNS)]
+    if len(duplicated_rules) > 0:
+        warnings.append(f'{len(duplicated_rules)} duplicated rules for the columns '
+                        f'{", ".join(sorted(set(duplicated_rules["orakloncology_name"].astype(str))))}')
+
+    for warning in warnings:
+        if strict:
+            raise ValueError(f'The conversion table has {warning}')
+        logger.log(warning_level, 'The conversion table has %s', warning)
+
+def parse_conversion_table(content: bytes,
+                           strict: bool = False,
+                           warning_level: int = logging.WARNING):
+    """
+    Parse and validate the content of a conversion table file.
+
+    The redcap_name are stripped, the orakloncology_name are kept as they
+    are, being the names of the output columns.
+
+    Parameters
+    ----------
+    content: bytes
+        content of the conversion table file
+    strict: bool
+        whether the warnings of the validation raise, see
+        validate_conversion_table
+    warning_level: int
+        logging level of the warnings of the validation
+    """
+
+    # sniffed as utils.get_delimiter does
+    sample = content[:1024].decode('utf-8', errors='ignore')
+    conversion_table_delimiter = csv.Sniffer().sniff(sample).delimiter
+
+    redcap_conversion_table = pd.read_csv(io.BytesIO(content), delimiter=conversion_table_delimiter)
+
+    validate_conversion_table(redcap_conversion_table, strict, warning_level)
+
+    redcap_conversion_table['redcap_name'] = redcap_conversion_table['redcap_name'].str.strip()
+
+    return redcap_conversion_table
+
+def load_conversion_table(redcap_conversion_table_path: str,
+                          strict: bool = False):
+    """
+    Read, validate and compile a conversion table, once per process.
+
+    The compiled table is kept in memory until the file changes: its
+    modification time and size are checked on each call, and its content
+    hashed when they changed. The validation warnings of the packaged tables,
+    known quirks, are logged at debug level.
+
+    Parameters
+    ----------
+    redcap_conversion_table_path: str
+        path to the redcap conversion table, see get_conversion_table_path
+    strict: bool
+        whether the warnings of the validation raise, see
+        validate_conversion_table
+    """
+
+    path = os.path.abspath(redcap_conversion_table_path)
+    file_stat = os.stat(path)
+    stat_key = (file_stat.st_mtime_ns, file_stat.st_size)
+
+    with _compiled_tables_lock:
+        cached = _compiled_tables.get((path, strict))
+
+    if cached is not None and cached[0] == stat_key:
+        return cached[1]
+
+    with open(path, 'rb') as file:
+        content = file.read()
+    content_hash = hashlib.sha256(content).hexdigest()
+
+    # e.g. touched, but not changed
+    if cached is not None and cached[1].content_hash == content_hash:
+        compiled_table = cached[1]
+    else:
+        warning_level = logging.DEBUG if is_packaged_table(path) else logging.WARNING
+        compiled_table = CompiledConversionTable(parse_conversion_table(content, strict, warning_level), content_hash)
+
+    with _compiled_tables_lock:
+        _compiled_tables[(path, strict)] = (stat_key, compiled_table)
+
+    return compiled_table
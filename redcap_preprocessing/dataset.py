@@ -0,0 +1,187 @@
+import logging
+
+import pandas as pd
+
+from redcap_preprocessing import report
+from redcap_preprocessing.cell_line_index import CellLineIndex
+from redcap_preprocessing.columns import check_redcap_columns, compact_redcap, get_compact_dtypes, get_redcap_columns
+from redcap_preprocessing.conversion_plan import ConversionPlan
+from redcap_preprocessing.conversion_tables import load_conversion_table
+from redcap_preprocessing.encoding import detect_encoding
+from redcap_preprocessing.enrichments import get_clinical_enrichments
+from redcap_preprocessing.readers import read_csv_table
+from redcap_preprocessing.utils import get_delimiter
+
+logger = logging.getLogger(__name__)
+
+def read_redcap(redcap_path: str,
+                cache_dir: str = None,
+                columns: list = None,
+                reader_engine: str = None):
+    """
+    Read the redcap export, detecting its delimiter and encoding.
+
+    Parameters
+    ----------
+    redcap_path: str
+        path to redcap data set
+    cache_dir: str
+        optional directory where the detected encodings are cached
+    columns: list
+        optional columns to read, the other ones are not parsed
+    reader_engine: str
+        'pandas' or 'pyarrow', see readers.read_csv_table
+    """
+
+    # detect the separator type and read the data
+    redcap_delimiter = get_delimiter(redcap_path)
+    file_encoding = get_redcap_encoding(redcap_path, cache_dir)
+
+    with report.stage('parsing'):
+        redcap = read_csv_table(redcap_path, redcap_delimiter, file_encoding, columns, reader_engine)
+
+    # check that the table isn't empty
+    if len(redcap) == 0:
+        raise ValueError('The redcap table is empty.')
+
+    return redcap, file_encoding, redcap_delimiter
+
+def get_redcap_encoding(redcap_path: str,
+                        cache_dir: str = None):
+    """
+    Detect the encoding of the redcap export, see encoding.detect_encoding.
+
+    Parameters
+    ----------
+    redcap_path: str
+        path to redcap data set
+    cache_dir: str
+        optional directory where the detected encodings are cached
+    """
+
+    with report.stage('encoding_detection'):
+        file_encoding = detect_encoding(redcap_path, cache_dir)
+
+    logger.info('Detected encoding: %s', file_encoding)
+
+    return file_encoding
+
+class RedcapDataset:
+    """
+    REDCap export and conversion table, loaded once and shared by the
+    clinical, treatment and molecular splitters.
+
+    Parameters
+    ----------
+    redcap: pd.DataFrame
+        redcap data set
+    redcap_conversion_table: pd.DataFrame
+        conversion table between redcap and orakloncology, all data types
+    disease_type: str
+        'CRC' or 'PDAC'
+    conversion_plans: dict
+        optional compiled conversion plans by data type, shared with other
+        data sets
+    """
+
+    def __init__(self,
+                 redcap: pd.DataFrame,
+                 redcap_conversion_table: pd.DataFrame,
+                 disease_type: str,
+                 encoding: str = None,
+                 delimiter: str = None,
+                 conversion_plans: dict = None):
+
+        assert disease_type in ['CRC', 'PDAC']
+
+        self.redcap = redcap
+        self.redcap_conversion_table = redcap_conversion_table
+        self.disease_type = disease_type
+        self.encoding = encoding
+        self.delimiter = delimiter
+
+        # data_type -> ConversionPlan, can be shared by the batches of a streaming run
+        self._conversion_plans = conversion_plans if conversion_plans is not None else {}
+        self._cell_line_index = None
+        self._clinical_enrichments = None
+
+    @classmethod
+    def from_csv(cls,
+                 redcap_path: str,
+                 redcap_conversion_table_path: str,
+                 disease_type: str,
+                 cache_dir: str = None,
+                 reader_engine: str = None):
+        """
+        Parse the redcap export and the conversion table.
+
+        Only the columns used by the conversion table and the splitters are
+        read, the checkboxes and option codes with compact types.
+
+        Parameters
+        ----------
+        redcap_path: str
+            path to redcap data set
+        redcap_conversion_table_path: str
+            path to redcap conversion table
+        disease_type: str
+            'CRC' or 'PDAC'
+        cache_dir: str
+            optional directory where the detected encodings are cached
+        reader_engine: str
+            'pandas' or 'pyarrow', the pyarrow one if it is installed
+        """
+
+        assert disease_type in ['CRC', 'PDAC']
+
+        # validated and compiled once per process
+        with report.stage('conversion_table_load'):
+            compiled_table = load_conversion_table(redcap_conversion_table_path)
+        redcap_conversion_table = compiled_table.redcap_conversion_table
+        redcap_columns = get_redcap_columns(redcap_conversion_table, disease_type)
+
+        redcap, encoding, delimiter = read_redcap(redcap_path, cache_dir, redcap_columns, reader_engine)
+        check_redcap_columns(redcap.columns, redcap_columns)
+        redcap = compact_redcap(redcap, get_compact_dtypes(redcap_conversion_table))
+
+        return cls(redcap, redcap_conversion_table, disease_type, encoding, delimiter,
+                   conversion_plans=dict(compiled_table.conversion_plans))
+
+    def get_conversion_plan(self, data_type: str):
+        """
+        Compiled conversion rules of a data type, built on first use.
+
+        Parameters
+        ----------
+        data_type: str
+            one of 'clinical-profile', 'treatment' or 'molecular_profile'
+        """
+
+        if data_type not in self._conversion_plans:
+            with report.stage('conversion_table_load'):
+                self._conversion_plans[data_type] = ConversionPlan.from_conversion_table(self.redcap_conversion_table, data_type)
+
+        return self._conversion_plans[data_type]
+
+    def get_cell_line_index(self):
+        """
+        Cell line codes and row positions of every record, built on first use.
+        """
+
+        if self._cell_line_index is None:
+            with report.stage('cell_line_lookup'):
+                self._cell_line_index = CellLineIndex(self.redcap, self.disease_type)
+
+        return self._cell_line_index
+
+    def get_clinical_enrichments(self):
+        """
+        Clinical columns joined to the other modalities, indexed by
+        record_id, built on first use, see enrichments.get_clinical_enrichments.
+        """
+
+        if self._clinical_enrichments is None:
+            with report.stage('enrichments'):
+                self._clinical_enrichments = get_clinical_enrichments(self.redcap, self.redcap_conversion_table)
+
+        return self._clinical_enrichments
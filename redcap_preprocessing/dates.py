@@ -0,0 +1,163 @@
+import logging
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from redcap_preprocessing import report
+
+logger = logging.getLogger(__name__)
+
+# values standing for a missing date
+MISSING_DATES = ('nan', 'NaT', '0000-00-00', '', 'None')
+
+# formats tried in order when parsing a date
+INPUT_DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y')
+
+OUTPUT_DATE_FORMAT = '%d/%m/%Y'
+
+def is_missing_date(date_str):
+
+    # nan and None
+    if date_str != date_str or date_str is None:
+        return True
+
+    return isinstance(date_str, str) and date_str in MISSING_DATES
+
+def clean_date_string(date_str):
+
+    # keep the first of multiple ';'-joined dates
+    date_str = date_str.split(';')[0]
+
+    return date_str.replace(';', '').replace(' ', '')
+
+def normalize_date(date_str):
+    """
+    Convert a single date to DD/MM/YYYY.
+
+    Raises a ValueError if the date matches none of the input formats.
+
+    Parameters
+    ----------
+    date_str: str
+        date in YYYY-MM-DD or DD/MM/YYYY format
+    """
+
+    if is_missing_date(date_str):
+        return ''
+
+    date_str = clean_date_string(date_str)
+
+    try:
+        # Try to parse the date from YYYY-MM-DD format
+        date_obj = datetime.strptime(date_str, '%Y-%m-%d')
+    except ValueError:
+        # Fallback: Try to parse the date from DD/MM/YYYY if the initial format fails
+        date_obj = datetime.strptime(date_str, '%d/%m/%Y')
+
+    # Convert the date object to DD/MM/YYYY format
+    return date_obj.strftime(OUTPUT_DATE_FORMAT)
+
+def normalize_unique_dates(unique_dates):
+    """
+    Normalize an array of distinct dates, parsing each format for all the
+    values at once.
+
+    Returns the normalized dates, and the values that could not be parsed,
+    which are left unchanged.
+
+    Parameters
+    ----------
+    unique_dates: np.ndarray
+        distinct values of one or several date columns
+    """
+
+    normalized_dates = np.full(len(unique_dates), '', dtype=object)
+    unparseable_dates = []
+
+    # the values to parse
+    to_parse = []
+    for position, date_str in enumerate(unique_dates):
+        if is_missing_date(date_str):
+            continue
+        if not isinstance(date_str, str):
+            normalized_dates[position] = date_str
+            unparseable_dates.append(date_str)
+            continue
+        to_parse.append(position)
+
+    if len(to_parse) == 0:
+        return normalized_dates, unparseable_dates
+
+    to_parse = np.array(to_parse)
+    date_strings = pd.Series([clean_date_string(unique_dates[position]) for position in to_parse])
+    parsed_dates = pd.Series(pd.NaT, index=date_strings.index, dtype='datetime64[ns]')
+
+    for date_format in INPUT_DATE_FORMATS:
+        not_parsed = parsed_dates.isna()
+        if not not_parsed.any():
+            break
+        parsed_dates[not_parsed] = pd.to_datetime(date_strings[not_parsed], format=date_format, errors='coerce')
+
+    is_parsed = parsed_dates.notna().to_numpy()
+    normalized_dates[to_parse[is_parsed]] = parsed_dates[is_parsed].dt.strftime(OUTPUT_DATE_FORMAT).to_numpy()
+
+    # dates out of the pandas range, or accepted by strptime only
+    for position in to_parse[~is_parsed]:
+        try:
+            normalized_dates[position] = normalize_date(unique_dates[position])
+        except ValueError:
+            normalized_dates[position] = unique_dates[position]
+            unparseable_dates.append(unique_dates[position])
+
+    return normalized_dates, unparseable_dates
+
+def normalize_date_series(dates: pd.Series):
+    """
+    Normalize a column of dates to DD/MM/YYYY, parsing each distinct value
+    once.
+
+    Returns the normalized column and the list of values that could not be
+    parsed, which are left unchanged.
+
+    Parameters
+    ----------
+    dates: pd.Series
+        column of dates
+    """
+
+    codes, unique_dates = pd.factorize(dates.to_numpy(dtype=object), use_na_sentinel=False)
+
+    normalized_dates, unparseable_dates = normalize_unique_dates(unique_dates)
+
+    return pd.Series(normalized_dates[codes], index=dates.index, name=dates.name, dtype=object), unparseable_dates
+
+def format_dates(df, unparseable_dates = None):
+    """
+    Normalize all the columns with 'date' in their name to DD/MM/YYYY.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        table to format, modified in place
+    unparseable_dates: dict
+        optional column name -> list of values that could not be parsed. If
+        not given, the unparseable values are logged.
+    """
+
+    for column in df.columns:
+
+        if 'date' in column.lower():
+
+            with report.stage('date_formatting'):
+                df[column], column_unparseable_dates = normalize_date_series(df[column])
+
+            if len(column_unparseable_dates) == 0:
+                continue
+
+            if unparseable_dates is not None:
+                unparseable_dates.setdefault(column, []).extend(column_unparseable_dates)
+            else:
+                logger.warning('Could not parse dates %s in column %s, left unchanged.', column_unparseable_dates, column)
+
+    return df
@@ -0,0 +1,276 @@
+import os
+import json
+import uuid
+import codecs
+import hashlib
+import threading
+
+# encodings tried in order with a strict decode, before running the detector
+CANDIDATE_ENCODINGS = ('utf-8', 'utf-8-sig', 'cp1252')
+
+# used when neither the candidates nor the detector give an answer, it
+# decodes any byte sequence
+FALLBACK_ENCODING = 'latin-1'
+
+# the detector stops after this many bytes, or earlier once it is confident
+DETECTION_SAMPLE_SIZE = 256 * 1024
+DETECTION_MIN_CONFIDENCE = 0.5
+
+# bytes read at the beginning and at the end of a file to decide its encoding
+# and to key the cache, the whole file being decoded only when they are ascii
+SAMPLE_SIZE = 256 * 1024
+
+# longest character of the candidates, the end sample may start within one
+MAX_CHARACTER_SIZE = 4
+
+CHUNK_SIZE = 1024 * 1024
+
+ENCODING_CACHE_FILENAME = 'encodings.json'
+
+# file key -> encoding, shared by all the calls of the process
+_encoding_cache = {}
+# serializes the updates of the cache files by the threads of the process
+_encoding_cache_lock = threading.Lock()
+
+def get_file_hash(file_path):
+    """
+    Get the sha256 of the content of a file.
+
+    Parameters
+    ----------
+    file_path: str
+        path to the file
+    """
+
+    file_hash = hashlib.sha256()
+
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+def can_decode(file_path, encoding):
+
+    decoder = codecs.getincrementaldecoder(encoding)('strict')
+
+    try:
+        with open(file_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+                decoder.decode(chunk)
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return False
+
+    return True
+
+class FileSample:
+    """
+    Beginning and end of a file, SAMPLE_SIZE bytes each, or the whole file if
+    it is smaller, with its size and modification time.
+
+    Parameters
+    ----------
+    file_path: str
+        path to the file
+    """
+
+    def __init__(self, file_path):
+
+        self.file_path = file_path
+
+        with open(file_path, 'rb') as file:
+            file_stat = os.fstat(file.fileno())
+            self.size = file_stat.st_size
+            self.mtime_ns = file_stat.st_mtime_ns
+
+            self.complete = self.size <= 2 * SAMPLE_SIZE
+            self.head = file.read() if self.complete else file.read(SAMPLE_SIZE)
+            self.tail = b''
+            if not self.complete:
+                file.seek(-SAMPLE_SIZE, os.SEEK_END)
+                self.tail = file.read(SAMPLE_SIZE)
+
+    def get_key(self):
+        """
+        Key of the file in the encoding caches: its path, size, modification
+        time and the hash of the sample.
+        """
+
+        sample_hash = hashlib.sha256(self.head + self.tail).hexdigest()
+
+        return f'{os.path.abspath(self.file_path)}:{self.size}:{self.mtime_ns}:{sample_hash}'
+
+    def has_bom(self):
+
+        return self.head.startswith(codecs.BOM_UTF8)
+
+    def is_ambiguous(self):
+        """
+        Whether the sample can't tell the encoding of the file: it is only a
+        part of the file, and ascii, which all the candidates decode.
+        """
+
+        return not self.complete and self.head.isascii() and self.tail.isascii()
+
+    def can_decode(self, encoding):
+        """
+        Whether the sample decodes with encoding, the whole file if the
+        sample is ambiguous.
+        """
+
+        if self.is_ambiguous():
+            return can_decode(self.file_path, encoding)
+
+        try:
+            # the head may end within a character
+            codecs.getincrementaldecoder(encoding)('strict').decode(self.head, final=self.complete)
+        except UnicodeDecodeError:
+            return False
+
+        if self.complete:
+            return True
+
+        # the tail may start within a character
+        for offset in range(MAX_CHARACTER_SIZE):
+            try:
+                self.tail[offset:].decode(encoding)
+            except UnicodeDecodeError:
+                continue
+            return True
+
+        return False
+
+def run_detector(file_path):
+    """
+    Run chardet on the beginning of the file, stopping as soon as it is
+    confident.
+
+    Parameters
+    ----------
+    file_path: str
+        path to the file
+    """
+
+    # only needed by the exports no candidate encoding decodes
+    from chardet import UniversalDetector
+
+    detector = UniversalDetector()
+    read_size = 0
+
+    with open(file_path, 'rb') as file:
+        while read_size < DETECTION_SAMPLE_SIZE and not detector.done:
+            chunk = file.read(min(64 * 1024, DETECTION_SAMPLE_SIZE - read_size))
+            if len(chunk) == 0:
+                break
+            detector.feed(chunk)
+            read_size += len(chunk)
+
+    result = detector.close()
+
+    if result['encoding'] is None or result['confidence'] < DETECTION_MIN_CONFIDENCE:
+        return None
+
+    return result['encoding']
+
+def guess_encoding(file_path, sample = None):
+    """
+    Guess the encoding of a file, without using the cache.
+
+    The candidates are decoded on the beginning and the end of the file, the
+    whole file being decoded only when they are ascii, see FileSample.
+
+    Parameters
+    ----------
+    file_path: str
+        path to the file
+    sample: FileSample
+        optional sample of the file, read otherwise
+    """
+
+    if sample is None:
+        sample = FileSample(file_path)
+
+    bom = sample.has_bom()
+
+    for encoding in CANDIDATE_ENCODINGS:
+
+        # utf-8 would keep the BOM in the first column name
+        if encoding == 'utf-8' and bom:
+            continue
+
+        if sample.can_decode(encoding):
+            return encoding
+
+    detected_encoding = run_detector(file_path)
+    if detected_encoding is not None and sample.can_decode(detected_encoding):
+        return detected_encoding
+
+    return FALLBACK_ENCODING
+
+def read_encoding_cache(cache_dir):
+
+    cache_path = os.path.join(cache_dir, ENCODING_CACHE_FILENAME)
+
+    if not os.path.exists(cache_path):
+        return {}
+
+    try:
+        with open(cache_path, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def write_encoding_cache(cache_dir, encoding_cache):
+
+    os.makedirs(cache_dir, exist_ok=True)
+
+    cache_path = os.path.join(cache_dir, ENCODING_CACHE_FILENAME)
+    # unique to the call, the threads of a process share its pid
+    tmp_path = f'{cache_path}.{uuid.uuid4().hex}.tmp'
+
+    with open(tmp_path, 'w') as file:
+        json.dump(encoding_cache, file)
+    os.replace(tmp_path, cache_path)
+
+def detect_encoding(file_path, cache_dir = None):
+    """
+    Detect the encoding of a file.
+
+    The decision is cached in memory, and in cache_dir if given, keyed by the
+    path, size and modification time of the file and the hash of its
+    beginning and end, see FileSample.get_key.
+
+    The cache file is replaced atomically, and updated by one thread of a
+    process at a time. Processes updating it at the same time may drop each
+    other's decisions, which are then made again.
+
+    Parameters
+    ----------
+    file_path: str
+        path to the file
+    cache_dir: str
+        optional directory where the decisions are persisted across runs
+    """
+
+    sample = FileSample(file_path)
+    file_key = sample.get_key()
+
+    if file_key in _encoding_cache:
+        return _encoding_cache[file_key]
+
+    encoding = None
+    if cache_dir is not None:
+        encoding = read_encoding_cache(cache_dir).get(file_key)
+
+    if encoding is None:
+        encoding = guess_encoding(file_path, sample)
+        if cache_dir is not None:
+            with _encoding_cache_lock:
+                encoding_cache = read_encoding_cache(cache_dir)
+                encoding_cache[file_key] = encoding
+                write_encoding_cache(cache_dir, encoding_cache)
+
+    _encoding_cache[file_key] = encoding
+
+    return encoding
@@ -0,0 +1,89 @@
+import pandas as pd
+
+from redcap_preprocessing.conversion_plan import ConversionPlan
+from redcap_preprocessing.dates import format_dates
+from redcap_preprocessing.transform import transform_data
+
+# columns of the clinical table added to the tables of the other modalities
+CLINICAL_ENRICHMENTS = {'treatment': ['date_death']}
+
+def get_clinical_enrichments(redcap: pd.DataFrame,
+                             redcap_conversion_table: pd.DataFrame):
+    """
+    Clinical columns of each record used by the other modalities, as in the
+    clinical table, indexed by record_id.
+
+    Only these columns are converted, from the first row of each record as
+    the clinical splitter does, so the other splitters don't wait for the
+    clinical outputs.
+
+    Parameters
+    ----------
+    redcap: pd.DataFrame
+        redcap data set
+    redcap_conversion_table: pd.DataFrame
+        conversion table, all data types included
+    """
+
+    columns = list(dict.fromkeys(column for columns in CLINICAL_ENRICHMENTS.values() for column in columns))
+
+    clinical_rules = redcap_conversion_table[(redcap_conversion_table['data_type'] == 'clinical-profile') &
+                                             redcap_conversion_table['orakloncology_name'].isin(columns)]
+
+    redcap_clinical_data = redcap.groupby('record_id').first().reset_index()
+
+    clinical_enrichments = transform_data(redcap_clinical_data, ConversionPlan(clinical_rules), combine_contents=False)
+    # the unparseable dates are reported by the clinical splitter
+    clinical_enrichments = format_dates(clinical_enrichments, unparseable_dates={})
+    clinical_enrichments.index = redcap_clinical_data['record_id'].to_numpy()
+
+    return clinical_enrichments.reindex(columns=columns)
+
+def get_modality_enrichments(clinical_enrichments: pd.DataFrame,
+                             modality: str,
+                             record_ids: list = None):
+    """
+    Clinical columns added to the tables of a modality, None if there are
+    none.
+
+    Parameters
+    ----------
+    clinical_enrichments: pd.DataFrame
+        as returned by get_clinical_enrichments
+    modality: str
+        'treatment' or 'molecular'
+    record_ids: list
+        optional records to keep, e.g. those of a shard
+    """
+
+    columns = CLINICAL_ENRICHMENTS.get(modality, [])
+
+    if len(columns) == 0:
+        return None
+
+    modality_enrichments = clinical_enrichments[columns]
+
+    if record_ids is not None:
+        modality_enrichments = modality_enrichments.reindex(record_ids)
+
+    return modality_enrichments
+
+def add_enrichments(data: pd.DataFrame,
+                    enrichments: pd.DataFrame):
+    """
+    Join the clinical columns on record_id, added at the end of the table.
+
+    Parameters
+    ----------
+    data: pd.DataFrame
+        table of a modality, with a record_id column
+    enrichments: pd.DataFrame
+        as returned by get_modality_enrichments, or None
+    """
+
+    if enrichments is None:
+        return data
+
+    record_ids = data['record_id']
+
+    return data.assign(**{column: record_ids.map(enrichments[column]) for column in enrichments.columns})
@@ -0,0 +1,310 @@
+import os
+import json
+import hashlib
+import logging
+
+import pandas as pd
+
+from redcap_preprocessing import __version__
+from redcap_preprocessing import report
+from redcap_preprocessing.columnar import get_output_path
+from redcap_preprocessing.dataset import RedcapDataset
+from redcap_preprocessing.writer import write_atomically
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = 'manifest.json'
+
+# per record tables of the consolidated files, to rebuild them without the
+# unchanged records
+OUTPUTS_FILENAME = 'outputs.json'
+
+MODALITIES = ('clinical', 'treatment', 'molecular')
+
+# bumped when the manifest layout changes
+MANIFEST_VERSION = 3
+
+def hash_file(path: str):
+
+    file_hash = hashlib.sha256()
+
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            file_hash.update(block)
+
+    return file_hash.hexdigest()
+
+def table_to_dict(table: pd.DataFrame):
+    """
+    Values of a per record table by column, with their dtypes, to save it
+    as json. The values keep their python types, e.g. the numbers and texts
+    of an object column, so that the consolidated file is written the same.
+
+    Parameters
+    ----------
+    table: pd.DataFrame
+        per record table of a splitter
+    """
+
+    return {'index': table.index.tolist(),
+            'index_name': table.index.name,
+            'columns': table.columns.tolist(),
+            'dtypes': [str(dtype) for dtype in table.dtypes],
+            'values': [table.iloc[:, position].tolist() for position in range(len(table.columns))]}
+
+def table_from_dict(table: dict):
+    """
+    Per record table saved by table_to_dict.
+    """
+
+    frame = pd.DataFrame({position: pd.Series(values, dtype=dtype)
+                          for position, (values, dtype) in enumerate(zip(table['values'], table['dtypes']))},
+                         index=pd.RangeIndex(len(table['index'])))
+    frame.columns = pd.Index(table['columns'])
+    frame.index = pd.Index(table['index'], name=table['index_name'])
+
+    return frame
+
+def get_record_hashes(redcap: pd.DataFrame):
+    """
+    Hash the rows of each record of the export.
+
+    The content hash changes with the values of the record. The rows hash
+    changes with the index of its rows, written in the treatment and
+    molecular outputs.
+
+    Parameters
+    ----------
+    redcap: pd.DataFrame
+        redcap data set
+    """
+
+    row_hashes = pd.util.hash_pandas_object(redcap, index=False).to_numpy()
+    index_hashes = pd.util.hash_pandas_object(redcap.index.to_series(), index=False).to_numpy()
+
+    record_hashes = {}
+
+    for record_id, rows in redcap.groupby('record_id', sort=False, dropna=False).indices.items():
+        record_hashes[str(record_id)] = {'content': hashlib.sha256(row_hashes[rows].tobytes()).hexdigest(),
+                                         'rows': hashlib.sha256(index_hashes[rows].tobytes()).hexdigest()}
+
+    return record_hashes
+
+class IncrementalRun:
+    """
+    Reprocess only the records of the export changed since the previous run
+    in the same output directory.
+
+    The manifest of the output directory holds the hashes of each record and
+    its outputs. A record is converted again when it is new, its rows changed,
+    or its XX placeholder codes moved. Everything is converted when the
+    conversion table, the columns of the export and their types, or the output
+    options changed. The per patient files not produced again, e.g. of the
+    deleted records, are removed.
+
+    Parameters
+    ----------
+    output_dir: str
+        output directory
+    dataset: RedcapDataset
+        redcap data set and conversion table
+    conversion_table_filepath: str
+        path to the conversion table
+    save_as_single_file: bool
+        whether the data is saved as single files
+    output_format: str
+        'csv', 'parquet' or 'arrow'
+    """
+
+    def __init__(self,
+                 output_dir: str,
+                 dataset: RedcapDataset,
+                 conversion_table_filepath: str,
+                 save_as_single_file: bool,
+                 output_format: str = 'csv'):
+
+        self.output_dir = output_dir
+        self.save_as_single_file = save_as_single_file
+        self.output_format = output_format
+
+        # the outputs of the unchanged records are kept with the same code only
+        self.key = {'version': MANIFEST_VERSION,
+                    'package_version': __version__,
+                    'conversion_table': hash_file(conversion_table_filepath),
+                    'columns': [[str(column), str(dtype)] for column, dtype in dataset.redcap.dtypes.items()],
+                    'disease_type': dataset.disease_type,
+                    'save_as_single_file': save_as_single_file,
+                    'output_format': output_format}
+
+        self.record_hashes = get_record_hashes(dataset.redcap)
+
+        # manifest of the previous run, its files are removed if not produced again
+        self.previous_filenames = []
+        self.previous = self.load_manifest()
+
+        previous_outputs = self.load_outputs() if self.previous is not None else None
+
+        # modality -> record_id -> filenames, or tables if save_as_single_file
+        self.record_outputs = {modality: {} for modality in MODALITIES}
+        # modality -> record_id -> number of its first XX placeholder code
+        self.placeholder_indexes = {modality: {} for modality in MODALITIES}
+        # modality -> converted record_ids
+        self.converted = {modality: set() for modality in MODALITIES}
+
+        if self.previous is not None:
+            for modality in MODALITIES:
+                for record_id in dataset.redcap['record_id'].unique():
+                    if str(record_id) not in self.previous['outputs'][modality]:
+                        continue
+                    if save_as_single_file:
+                        self.record_outputs[modality][record_id] = previous_outputs[modality].get(str(record_id), [])
+                    else:
+                        self.record_outputs[modality][record_id] = self.previous['outputs'][modality][str(record_id)]['filenames']
+
+    def load_manifest(self):
+
+        manifest_path = os.path.join(self.output_dir, MANIFEST_FILENAME)
+
+        if not os.path.exists(manifest_path):
+            return None
+
+        try:
+            with open(manifest_path) as file:
+                manifest = json.load(file)
+            previous_filenames = [get_output_path(os.path.join(self.output_dir, filename), manifest['key']['output_format'])
+                                  for modality in MODALITIES
+                                  for previous_outputs in manifest['outputs'][modality].values()
+                                  for filename in previous_outputs['filenames']]
+        except (ValueError, KeyError):
+            logger.warning('The manifest %s is invalid, all the records are converted.', manifest_path)
+            return None
+
+        self.previous_filenames = previous_filenames
+
+        if manifest.get('key') != self.key:
+            logger.info('The conversion table, the columns of the export or the output options changed, all the records are converted.')
+            return None
+
+        return manifest
+
+    def load_outputs(self):
+
+        if not self.save_as_single_file:
+            return None
+
+        outputs_path = os.path.join(self.output_dir, OUTPUTS_FILENAME)
+
+        if not os.path.exists(outputs_path):
+            # the manifest is useless without the tables of the records
+            self.previous = None
+            return None
+
+        try:
+            with open(outputs_path) as file:
+                outputs = json.load(file)
+            return {modality: {record_id: [table_from_dict(table) for table in tables]
+                               for record_id, tables in outputs[modality].items()}
+                    for modality in MODALITIES}
+        except (ValueError, KeyError, TypeError):
+            logger.warning('The outputs %s are invalid, all the records are converted.', outputs_path)
+            self.previous = None
+            return None
+
+    def is_changed(self,
+                   modality: str,
+                   record_id: str,
+                   placeholder_index: int):
+
+        if self.previous is None:
+            return True
+
+        previous_hashes = self.previous['records'].get(record_id)
+        previous_outputs = self.previous['outputs'][modality].get(record_id)
+
+        if previous_hashes is None or previous_outputs is None:
+            return True
+
+        if previous_hashes['content'] != self.record_hashes[record_id]['content']:
+            return True
+
+        if previous_outputs['placeholder_index'] != placeholder_index:
+            return True
+
+        # the treatment and molecular outputs hold the index of the redcap rows
+        if modality != 'clinical' and previous_hashes['rows'] != self.record_hashes[record_id]['rows']:
+            return True
+
+        # the files removed since the previous run
+        if not self.save_as_single_file:
+            for filename in previous_outputs['filenames']:
+                if not os.path.exists(get_output_path(os.path.join(self.output_dir, filename), self.output_format)):
+                    return True
+
+        return False
+
+    def get_split_arguments(self, modality: str):
+        """
+        select_record and record_outputs arguments of a splitter.
+
+        Parameters
+        ----------
+        modality: str
+            'clinical', 'treatment' or 'molecular'
+        """
+
+        def select_record(record_id, placeholder_index: int):
+
+            record_id = str(record_id)
+            self.placeholder_indexes[modality][record_id] = placeholder_index
+
+            if self.is_changed(modality, record_id, placeholder_index):
+                self.converted[modality].add(record_id)
+                return True
+
+            return False
+
+        return {'select_record': select_record,
+                'record_outputs': self.record_outputs[modality]}
+
+    def save(self):
+        """
+        Remove the files of the deleted records, and write the manifest once
+        the outputs are complete.
+        """
+
+        outputs = {modality: {str(record_id): record_outputs
+                              for record_id, record_outputs in self.record_outputs[modality].items()
+                              if str(record_id) in self.placeholder_indexes[modality]}
+                   for modality in MODALITIES}
+
+        paths = set()
+        if not self.save_as_single_file:
+            paths = {get_output_path(os.path.join(self.output_dir, filename), self.output_format)
+                     for modality in MODALITIES for record_filenames in outputs[modality].values() for filename in record_filenames}
+
+        for path in self.previous_filenames:
+            if path not in paths and os.path.exists(path):
+                os.remove(path)
+
+        if self.save_as_single_file:
+            outputs_dict = {modality: {record_id: [table_to_dict(table) for table in tables]
+                                       for record_id, tables in outputs[modality].items()}
+                            for modality in MODALITIES}
+            write_atomically(os.path.join(self.output_dir, OUTPUTS_FILENAME), json.dumps(outputs_dict).encode('utf-8'))
+
+        manifest = {'key': self.key,
+                    'records': self.record_hashes,
+                    'outputs': {modality: {record_id: {'placeholder_index': placeholder_index,
+                                                       'filenames': [] if self.save_as_single_file else outputs[modality].get(record_id, [])}
+                                           for record_id, placeholder_index in self.placeholder_indexes[modality].items()}
+                                for modality in MODALITIES}}
+
+        write_atomically(os.path.join(self.output_dir, MANIFEST_FILENAME), json.dumps(manifest, indent=1).encode('utf-8'))
+
+        for modality in MODALITIES:
+            report.count(f'{modality}_records_converted', len(self.converted[modality]))
+
+        logger.info('Incremental run: %s records converted.',
+                    ', '.join(f'{len(self.converted[modality])} {modality}' for modality in MODALITIES))
+
+        return None
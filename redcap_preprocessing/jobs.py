@@ -0,0 +1,267 @@
+import os
+import json
+import uuid
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from redcap_preprocessing.report import RunReport
+
+# preprocess_redcap_data is imported by the first job: the app processes
+# start without loading pandas
+
+logger = logging.getLogger(__name__)
+
+# jobs run at the same time, the others wait in the queue
+DEFAULT_JOB_WORKERS = 4
+
+# seconds between two saves of the progress of a running job
+PROGRESS_SAVE_INTERVAL = 1.0
+
+def get_default_job_processes(workers: int = DEFAULT_JOB_WORKERS):
+    """
+    Processes converting each job, the cpus shared by the jobs running at
+    the same time.
+    """
+
+    return max((os.cpu_count() or 1) // workers, 1)
+
+JOB_STATUSES = ('queued', 'running', 'done', 'failed')
+
+class Job:
+    """
+    A preprocess_redcap_data run queued by a JobQueue.
+
+    Parameters
+    ----------
+    redcap_filepath: str
+        path to redcap data set
+    disease_type: str
+        'CRC' or 'PDAC'
+    output_dir: str
+        output directory
+    job_id: str
+        optional id, random by default
+    status_path: str
+        optional json file the status is saved to at each change, and every
+        PROGRESS_SAVE_INTERVAL while running, so that other processes can
+        read it, see load_job_status
+    options: dict
+        other arguments of preprocess_redcap_data, e.g. save_as_single_file
+    """
+
+    def __init__(self,
+                 redcap_filepath: str,
+                 disease_type: str,
+                 output_dir: str,
+                 job_id: str = None,
+                 status_path: str = None,
+                 **options):
+
+        self.job_id = job_id if job_id is not None else uuid.uuid4().hex
+        self.status_path = status_path
+        self.redcap_filepath = redcap_filepath
+        self.disease_type = disease_type
+        self.output_dir = output_dir
+        self.options = options
+
+        self.status = 'queued'
+        self.error = None
+        self.created_time = time.time()
+        self.start_time = None
+        self.end_time = None
+
+        # collected while the job runs, to follow its progress
+        self.run_report = RunReport(on_count=self.save_progress)
+        self.progress_save_time = 0.0
+        # final report, once done
+        self.report = None
+
+        self.lock = threading.Lock()
+
+        self.save_status()
+
+    def save_status(self):
+
+        if self.status_path is None:
+            return
+
+        from redcap_preprocessing.writer import write_atomically
+
+        with self.lock:
+            write_atomically(self.status_path, json.dumps(self.to_dict()).encode('utf-8'))
+
+    def save_progress(self):
+        """
+        Save the status of the running job, at most every
+        PROGRESS_SAVE_INTERVAL seconds.
+        """
+
+        now = time.monotonic()
+
+        if self.status != 'running' or now - self.progress_save_time < PROGRESS_SAVE_INTERVAL:
+            return
+
+        self.progress_save_time = now
+        self.save_status()
+
+    def run(self):
+
+        from redcap_preprocessing.redcap_preprocessing import preprocess_redcap_data
+
+        self.status = 'running'
+        self.start_time = time.time()
+        self.save_status()
+
+        try:
+            self.report = preprocess_redcap_data(self.redcap_filepath,
+                                                 self.disease_type,
+                                                 output_dir=self.output_dir,
+                                                 run_report=self.run_report,
+                                                 **self.options)
+        except Exception as error:
+            logger.exception('Job %s failed.', self.job_id)
+            self.error = str(error)
+            self.status = 'failed'
+        else:
+            self.status = 'done'
+        finally:
+            self.end_time = time.time()
+            self.save_status()
+
+    def get_progress(self):
+        """
+        Fraction of the records converted by the splitters, from 0 to 1.
+        """
+
+        from redcap_preprocessing.incremental import MODALITIES
+
+        if self.status == 'done':
+            return 1.0
+
+        counters = self.run_report.get_state()['counters']
+        records = counters.get('records', 0)
+
+        if records == 0:
+            return 0.0
+
+        return sum(min(counters.get(f'{modality}_records', 0) / records, 1.0) for modality in MODALITIES) / len(MODALITIES)
+
+    def to_dict(self):
+
+        return {'job_id': self.job_id,
+                'disease_type': self.disease_type,
+                'status': self.status,
+                'progress': self.get_progress(),
+                'error': self.error,
+                'created_time': self.created_time,
+                'start_time': self.start_time,
+                'end_time': self.end_time,
+                'report': self.report}
+
+def load_job_status(status_path: str):
+    """
+    Status of a job saved by another process, as returned by Job.to_dict,
+    None if there is none.
+
+    Parameters
+    ----------
+    status_path: str
+        status_path of the job
+    """
+
+    try:
+        with open(status_path) as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+class JobQueue:
+    """
+    Run the preprocessing jobs in a pool of background threads, so that a
+    request enqueues a job and returns at once.
+
+    The threads share the GIL: the conversions of concurrent jobs only
+    overlap in their reads, writes and cache copies. Pass workers to submit,
+    see preprocess_redcap_data, for a job to convert its records in worker
+    processes.
+
+    Parameters
+    ----------
+    workers: int
+        number of jobs run at the same time
+    """
+
+    def __init__(self,
+                 workers: int = DEFAULT_JOB_WORKERS):
+
+        assert workers >= 1
+
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='redcap-job')
+        # job_id -> Job
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self,
+               redcap_filepath: str,
+               disease_type: str,
+               output_dir: str,
+               job_id: str = None,
+               status_path: str = None,
+               **options):
+        """
+        Queue a preprocess_redcap_data run, and return its Job.
+
+        Parameters
+        ----------
+        redcap_filepath: str
+            path to redcap data set
+        disease_type: str
+            'CRC' or 'PDAC'
+        output_dir: str
+            output directory
+        job_id: str
+            optional id, random by default
+        status_path: str
+            optional json file the status is saved to
+        options: dict
+            other arguments of preprocess_redcap_data
+        """
+
+        # invalid arguments are reported to the caller rather than by the job
+        assert disease_type in ['CRC', 'PDAC']
+
+        job = Job(redcap_filepath, disease_type, output_dir, job_id, status_path, **options)
+
+        with self.lock:
+            self.jobs[job.job_id] = job
+
+        # even the check of the cache runs in the background, a cached job
+        # finishes as soon as its outputs are copied
+        self.executor.submit(job.run)
+
+        return job
+
+    def get(self, job_id: str):
+        """
+        Job of the given id, None if unknown.
+        """
+
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def remove(self, job_ids: list):
+        """
+        Forget finished jobs, e.g. once their workspace is removed.
+        """
+
+        with self.lock:
+            for job_id in job_ids:
+                job = self.jobs.get(job_id)
+                if job is not None and job.status in ['done', 'failed']:
+                    del self.jobs[job_id]
+
+    def shutdown(self, wait: bool = True):
+
+        self.executor.shutdown(wait=wait)
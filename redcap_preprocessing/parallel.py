@@ -0,0 +1,125 @@
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+from redcap_preprocessing import report
+
+# number of records processed by a single task of the process pool
+RECORDS_PER_SHARD = 64
+
+# the pools are started from threads, e.g. of the app's job queue, and forking
+# a process while another thread holds a lock could deadlock the workers
+PROCESS_START_METHODS = ('forkserver', 'spawn')
+
+def get_process_pool(workers: int,
+                     initializer = None,
+                     initargs: tuple = ()):
+    """
+    Process pool, e.g. of the shards, its workers started without forking the
+    threads of the run, see PROCESS_START_METHODS.
+
+    Parameters
+    ----------
+    workers: int
+        number of processes
+    initializer: callable
+        optional function called with initargs by each worker when it starts
+    initargs: tuple
+        arguments of initializer
+    """
+
+    start_method = next(method for method in PROCESS_START_METHODS if method in multiprocessing.get_all_start_methods())
+
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(start_method),
+                               initializer=initializer, initargs=initargs)
+
+def count_placeholders(cell_line_code: str, date_cell_line: str):
+    """
+    Number of XX placeholder codes used by a record, one per empty cell line
+    code among those paired with a date, as in get_cell_line_table.
+
+    Parameters
+    ----------
+    cell_line_code: str
+        ';'-joined cell line codes of the record
+    date_cell_line: str
+        ';'-joined cell line dates of the record
+    """
+
+    codes = cell_line_code.split(';')[:len(date_cell_line.split(';'))]
+
+    return sum(len(code) == 0 for code in codes)
+
+def get_placeholder_indexes(placeholder_counts: list,
+                            placeholder_index: int = 0):
+    """
+    Number of the first XX placeholder of each record, as in a serial run.
+
+    Parameters
+    ----------
+    placeholder_counts: list
+        number of placeholders used by each record, in output order
+    placeholder_index: int
+        number of the first XX placeholder
+    """
+
+    placeholder_indexes = []
+
+    for placeholder_count in placeholder_counts:
+        placeholder_indexes.append(placeholder_index)
+        placeholder_index += placeholder_count
+
+    return placeholder_indexes
+
+def get_shards(positions: list,
+               records_per_shard: int = RECORDS_PER_SHARD):
+    """
+    Split the positions of the records to process in shards.
+
+    Parameters
+    ----------
+    positions: list
+        positions of the records to process, in output order
+    records_per_shard: int
+        maximum number of records in a shard
+    """
+
+    return [positions[start:start + records_per_shard] for start in range(0, len(positions), records_per_shard)]
+
+def run_shards(function,
+               shard_arguments: list,
+               executor: Executor = None):
+    """
+    Run a function on each shard, in the executor if given.
+
+    The results are returned in shard order, and the timers and counters of
+    the shards added to the report of the run, if any.
+
+    Parameters
+    ----------
+    function: callable
+        module level function, so that it can be sent to a process pool
+    shard_arguments: list
+        arguments of each call
+    executor: Executor
+        optional process pool
+    """
+
+    if executor is None:
+        return [function(*arguments) for arguments in shard_arguments]
+
+    run_report = report.get_report()
+
+    if run_report is None:
+        futures = [executor.submit(function, *arguments) for arguments in shard_arguments]
+        return [future.result() for future in futures]
+
+    # the timers and counters of the workers are sent back with the results
+    futures = [executor.submit(report.run_with_report, function, *arguments) for arguments in shard_arguments]
+
+    results = []
+    for future in futures:
+        result, worker_report = future.result()
+        run_report.merge(worker_report)
+        results.append(result)
+
+    return results
@@ -0,0 +1,167 @@
+import io
+import codecs
+
+import numpy as np
+import pandas as pd
+
+# engines of read_csv_table, the pyarrow one being multithreaded
+READER_ENGINES = ('pandas', 'pyarrow')
+
+# encodings both engines read from the file as it is, the other ones are
+# transcoded to utf-8 first
+UTF8_COMPATIBLE_ENCODINGS = ('utf-8', 'utf-8-sig', 'ascii')
+
+# values read as missing by the pandas parser
+NA_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+             '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+# values read as booleans by the pandas parser
+TRUE_VALUES = ['True', 'TRUE', 'true']
+FALSE_VALUES = ['False', 'FALSE', 'false']
+
+def get_default_engine():
+    """
+    The pyarrow engine if pyarrow is installed, the pandas one otherwise.
+    """
+
+    try:
+        import pyarrow.csv
+    except ImportError:
+        return 'pandas'
+
+    return 'pyarrow'
+
+def is_utf8_compatible(encoding: str):
+
+    return codecs.lookup(encoding).name in UTF8_COMPATIBLE_ENCODINGS
+
+def open_csv_source(path: str, encoding: str):
+    """
+    The file itself if its encoding is utf-8 compatible, its content
+    transcoded to utf-8 in memory otherwise, and the encoding to read it with.
+
+    Parameters
+    ----------
+    path: str
+        path to the csv file
+    encoding: str
+        encoding of the file
+    """
+
+    if is_utf8_compatible(encoding):
+        return path, encoding
+
+    with open(path, 'rb') as file:
+        content = file.read()
+
+    return io.BytesIO(content.decode(encoding).encode('utf-8')), 'utf-8'
+
+def read_csv_table(path: str,
+                   delimiter: str,
+                   encoding: str,
+                   columns: list = None,
+                   engine: str = None):
+    """
+    Read a csv file as the pandas parser does, whatever the engine.
+
+    The utf-8 compatible files are memory mapped, the other ones transcoded
+    to utf-8 once.
+
+    Parameters
+    ----------
+    path: str
+        path to the csv file
+    delimiter: str
+        delimiter of the file
+    encoding: str
+        encoding of the file, e.g. as returned by encoding.detect_encoding
+    columns: list
+        optional columns to read, the other ones are not parsed
+    engine: str
+        one of READER_ENGINES, see get_default_engine
+    """
+
+    if engine is None:
+        engine = get_default_engine()
+
+    assert engine in READER_ENGINES
+
+    source, encoding = open_csv_source(path, encoding)
+
+    if columns is not None:
+        columns = set(columns)
+
+    if engine == 'pandas':
+        usecols = (lambda column: column in columns) if columns is not None else None
+        return pd.read_csv(source, delimiter=delimiter, encoding=encoding, usecols=usecols, memory_map=isinstance(source, str))
+
+    return read_pyarrow_table(source, delimiter, columns)
+
+def read_pyarrow_table(source,
+                       delimiter: str,
+                       columns: set = None):
+    """
+    Read a utf-8 csv file with the pyarrow engine, with the types and missing
+    values of the pandas parser.
+
+    Parameters
+    ----------
+    source: str or io.BytesIO
+        path to the csv file, or its content
+    delimiter: str
+        delimiter of the file
+    columns: set
+        optional columns to read
+    """
+
+    import pyarrow
+    import pyarrow.csv
+
+    parse_options = pyarrow.csv.ParseOptions(delimiter=delimiter, newlines_in_values=True)
+
+    def open_input_file():
+
+        if isinstance(source, str):
+            return pyarrow.memory_map(source)
+
+        source.seek(0)
+        return source
+
+    # the selected columns, in the order of the file
+    with pyarrow.csv.open_csv(open_input_file(), parse_options=parse_options) as header_reader:
+        include_columns = [column for column in header_reader.schema.names if columns is None or column in columns]
+
+    def read(column_types = None, include_columns = include_columns):
+
+        convert_options = pyarrow.csv.ConvertOptions(include_columns=include_columns,
+                                                     column_types=column_types,
+                                                     null_values=NA_VALUES,
+                                                     true_values=TRUE_VALUES,
+                                                     false_values=FALSE_VALUES,
+                                                     strings_can_be_null=True)
+
+        return pyarrow.csv.read_csv(open_input_file(),
+                                    read_options=pyarrow.csv.ReadOptions(use_threads=True),
+                                    parse_options=parse_options,
+                                    convert_options=convert_options)
+
+    table = read()
+
+    # the dates and times are strings for pandas, they are read again as such
+    temporal_columns = [field.name for field in table.schema if pyarrow.types.is_temporal(field.type)]
+    if len(temporal_columns) > 0:
+        temporal_table = read({column: pyarrow.string() for column in temporal_columns}, temporal_columns)
+        for column in temporal_columns:
+            table = table.set_column(table.schema.get_field_index(column), column, temporal_table.column(column))
+
+    frame = table.to_pandas()
+
+    for field, column in zip(table.schema, table.columns):
+        if pyarrow.types.is_null(field.type):
+            # an empty column is a float column for pandas
+            frame[field.name] = np.full(len(frame), np.nan)
+        elif column.null_count > 0 and frame[field.name].dtype == object:
+            # missing strings and booleans are NaN for pandas
+            frame[field.name] = frame[field.name].where(frame[field.name].notna(), np.nan)
+
+    return frame
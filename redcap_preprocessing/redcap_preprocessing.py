@@ -1,18 +1,111 @@
 
 import os
+import logging
+import importlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 
-from redcap_preprocessing import split_clinical_data_from_redcap
-from redcap_preprocessing import split_treatment_data_from_redcap
-from redcap_preprocessing import split_molecular_data_from_redcap
+from redcap_preprocessing import report
+from redcap_preprocessing.dataset import RedcapDataset
+from redcap_preprocessing.incremental import IncrementalRun
+from redcap_preprocessing.parallel import get_process_pool
+from redcap_preprocessing.readers import READER_ENGINES
+from redcap_preprocessing.columnar import OUTPUT_FORMATS
+from redcap_preprocessing.conversion_tables import get_conversion_table_path
+from redcap_preprocessing.result_cache import DEFAULT_CACHE_SIZE, ResultCache, get_modification_times, get_output_filenames
+from redcap_preprocessing.transform import TRANSFORM_MODES
+from redcap_preprocessing.writer import PatientFileWriter, open_writer
+
+logger = logging.getLogger(__name__)
+
+# modality -> module and function of its splitter, imported on first use. This
+# module still imports pandas, through dataset and readers: only the entry
+# points, see benchmark.COLD_START_MODULES, start without it
+SPLITTERS = {'clinical': ('redcap_preprocessing.split_clinical_data_from_redcap', 'split_clinical_data'),
+             'treatment': ('redcap_preprocessing.split_treatment_data_from_redcap', 'split_treatment_data'),
+             'molecular': ('redcap_preprocessing.split_molecular_data_from_redcap', 'split_molecular_data')}
+
+def get_splitter(modality: str):
+    """
+    Splitter of a modality, e.g. split_clinical_data for 'clinical'.
+    """
+
+    module_name, function_name = SPLITTERS[modality]
+
+    return getattr(importlib.import_module(module_name), function_name)
 
 def preprocess_redcap_data(redcap_filepath: str,
                            disease_type: str,
                            save_as_single_file: bool = False,
                            output_dir = None,
+                           transform_mode: str = 'vectorized',
+                           workers: int = 1,
+                           chunksize: int = None,
+                           archive_path: str = None,
+                           output_format: str = 'csv',
+                           incremental: bool = False,
+                           log_level = None,
+                           save_report: bool = False,
+                           run_report: report.RunReport = None,
+                           cache_dir: str = None,
+                           cache_size: int = DEFAULT_CACHE_SIZE,
+                           reader_engine: str = None,
                            ):
-    
+    """
+    Convert a REDCap export into the clinical, treatment and molecular
+    tables of orakloncology.
+
+    Returns the run report: duration, records per second, peak memory, time
+    spent in each stage, counters such as the rows read and written, and the
+    largest records.
+
+    Parameters
+    ----------
+    redcap_filepath: str
+        path to redcap data set
+    disease_type: str
+        'CRC' or 'PDAC'
+    output_dir: str
+        output directory, preprocessed_redcap_data next to the export by
+        default
+    log_level: int or str
+        optional level of the messages printed on stderr, e.g. 'DEBUG'. The
+        logging configuration of the application is used otherwise.
+    save_report: bool
+        whether the run report is written as run_report.json in output_dir
+    run_report: RunReport
+        optional report to collect into, e.g. to follow the progress of the
+        run from another thread
+    cache_dir: str
+        optional directory caching the *_PID_ALL outputs of the single file
+        runs. A run of the same export and conversion table with the same
+        output options copies them instead of converting the export again.
+    cache_size: int
+        size of the cached outputs beyond which the least recently used are
+        evicted, in bytes
+    reader_engine: str
+        'pandas' or 'pyarrow', the parser of the export, the pyarrow one if it
+        is installed. Both read the same table.
+    """
+
+    if log_level is not None:
+        report.configure_logging(log_level)
+
     # check that the disease type is valid
     assert disease_type in ['CRC', 'PDAC']
+    assert transform_mode in TRANSFORM_MODES
+    assert workers >= 1
+    assert chunksize is None or chunksize >= 1
+    # the archive holds the per patient files
+    assert archive_path is None or not save_as_single_file
+    assert output_format in OUTPUT_FORMATS
+    assert reader_engine is None or reader_engine in READER_ENGINES
+    # a streaming run appends to the consolidated tables, only csvs can be
+    assert chunksize is None or not save_as_single_file or output_format == 'csv'
+    # an incremental run keeps the outputs of the unchanged records in output_dir
+    assert not incremental or (chunksize is None and archive_path is None)
+    # the cached outputs are the consolidated *_PID_ALL files
+    assert cache_dir is None or (save_as_single_file and not incremental)
 
     if output_dir is None:
         output_dir = os.path.join(os.path.dirname(redcap_filepath), 'preprocessed_redcap_data')
@@ -20,47 +113,194 @@ def preprocess_redcap_data(redcap_filepath: str,
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    if disease_type == 'CRC':
-        conversion_table_filepath = os.path.join('conversion_table', 'redcap_CRC_conversion_table.csv')
-    elif disease_type == 'PDAC':
-        conversion_table_filepath = os.path.join('conversion_table', 'redcap_PDAC_conversion_table.csv')
+    conversion_table_filepath = get_conversion_table_filepath(disease_type)
 
-    utils_preprocess_redcap_data(redcap_filepath,
-                           conversion_table_filepath,
-                           output_dir,
-                           disease_type,
-                           save_as_single_file
-                           )
+    if run_report is None:
+        run_report = report.RunReport()
+
+    result_cache = ResultCache(cache_dir, cache_size) if cache_dir is not None else None
+    if result_cache is not None:
+        cache_key = get_cache_key(result_cache, redcap_filepath, disease_type, save_as_single_file, output_format)
+        output_filenames = get_output_filenames(disease_type, output_format)
+
+    with report.activate_report(run_report):
+
+        if result_cache is not None and result_cache.restore(cache_key, output_dir, output_filenames):
+            report.count('cache_hits')
+
+        else:
+            if result_cache is not None:
+                # the outputs of the previous runs in output_dir aren't cached
+                previous_outputs = get_modification_times(output_dir, output_filenames)
+
+            utils_preprocess_redcap_data(redcap_filepath,
+                                   conversion_table_filepath,
+                                   output_dir,
+                                   disease_type,
+                                   save_as_single_file,
+                                   transform_mode,
+                                   workers,
+                                   chunksize,
+                                   archive_path,
+                                   output_format,
+                                   incremental,
+                                   reader_engine
+                                   )
+
+            if result_cache is not None:
+                report.count('cache_misses')
+                written_outputs = [filename for filename, modification_time in get_modification_times(output_dir, output_filenames).items()
+                                   if previous_outputs.get(filename) != modification_time]
+                result_cache.store(cache_key, output_dir, written_outputs)
+
+    run_report.finish()
+    run_report_dict = run_report.to_dict()
+
+    logger.info('Preprocessed %d records in %.1f s (%.1f records/s).', run_report_dict['records'],
+                run_report_dict['seconds'], run_report_dict['records_per_second'] or 0)
+
+    if save_report:
+        run_report.write_json(os.path.join(output_dir, report.REPORT_FILENAME))
+
+    return run_report_dict
+
+
+def get_conversion_table_filepath(disease_type: str):
 
-    return 
+    # shipped with the package, whatever the working directory
+    return get_conversion_table_path(disease_type)
 
+def get_cache_key(result_cache: ResultCache,
+                  redcap_filepath: str,
+                  disease_type: str,
+                  save_as_single_file: bool = False,
+                  output_format: str = 'csv'):
+    """
+    Key of the cached outputs of a preprocess_redcap_data run.
+    """
+
+    return result_cache.get_key(redcap_filepath, disease_type, get_conversion_table_filepath(disease_type),
+                                save_as_single_file=save_as_single_file, output_format=output_format)
 
 def utils_preprocess_redcap_data(redcap_filepath,
                            conversion_table_filepath,
                            output_dir,
                            disease_type,
-                           save_as_single_file
+                           save_as_single_file,
+                           transform_mode = 'vectorized',
+                           workers = 1,
+                           chunksize = None,
+                           archive_path = None,
+                           output_format = 'csv',
+                           incremental = False,
+                           reader_engine = None
                            ):
     
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    split_clinical_data_from_redcap.split_clinical_data_from_redcap_directory(redcap_filepath,
-                                                        conversion_table_filepath,
-                                                        output_dir,
-                                                        disease_type,
-                                                        save_as_single_file)
-    
-    split_treatment_data_from_redcap.split_treatment_data_from_redcap(redcap_filepath,
-                                                        conversion_table_filepath,
-                                                        output_dir,
-                                                        disease_type,
-                                                        save_as_single_file)
-    
-    split_molecular_data_from_redcap.split_molecular_data_from_redcap(redcap_filepath,
-                                                        conversion_table_filepath,
-                                                        output_dir,
-                                                        disease_type,
-                                                        save_as_single_file)
-    
-    return None
\ No newline at end of file
+    # stream the export by batches of records instead of loading it at once
+    if chunksize is not None:
+        from redcap_preprocessing import streaming
+        streaming.preprocess_redcap_batches(redcap_filepath,
+                                            conversion_table_filepath,
+                                            output_dir,
+                                            disease_type,
+                                            save_as_single_file,
+                                            transform_mode,
+                                            chunksize,
+                                            workers,
+                                            archive_path,
+                                            output_format)
+        return None
+
+    # parse the export and the conversion table once for all the splitters
+    dataset = RedcapDataset.from_csv(redcap_filepath, conversion_table_filepath, disease_type, reader_engine=reader_engine)
+
+    report.count('records', dataset.redcap['record_id'].nunique())
+    report.count('rows_in', len(dataset.redcap))
+
+    # only the records changed since the previous run are converted
+    incremental_run = IncrementalRun(output_dir, dataset, conversion_table_filepath, save_as_single_file, output_format) if incremental else None
+
+    # the per patient files of all the splitters are written in the background
+    with open_writer(output_dir, save_as_single_file, archive_path, output_format) as writer:
+
+        if workers > 1:
+            split_data_in_parallel(dataset, output_dir, save_as_single_file, transform_mode, workers, writer, output_format,
+                                   incremental_run)
+        else:
+            for modality in SPLITTERS:
+                get_splitter(modality)(dataset,
+                                       output_dir,
+                                       save_as_single_file,
+                                       transform_mode,
+                                       writer=writer,
+                                       output_format=output_format,
+                                       **get_split_arguments(incremental_run, modality))
+
+    # the manifest is written once all the files are
+    if incremental_run is not None:
+        incremental_run.save()
+
+    return None
+
+def get_split_arguments(incremental_run: IncrementalRun,
+                        modality: str):
+
+    if incremental_run is None:
+        return {}
+
+    return incremental_run.get_split_arguments(modality)
+
+def split_data_in_parallel(dataset: RedcapDataset,
+                           output_dir: str,
+                           save_as_single_file: bool,
+                           transform_mode: str,
+                           workers: int,
+                           writer: PatientFileWriter = None,
+                           output_format: str = 'csv',
+                           incremental_run: IncrementalRun = None):
+    """
+    Run the clinical, treatment and molecular splitters concurrently, their
+    records being processed in shards by a shared process pool.
+
+    The outputs are the same as a serial run. The workers are not forked, see
+    parallel.get_process_pool: a script running with workers > 1 starts the
+    run under if __name__ == '__main__'.
+
+    Parameters
+    ----------
+    dataset: RedcapDataset
+        redcap data set and conversion table
+    output_dir: str
+        output directory
+    workers: int
+        number of processes
+    writer: PatientFileWriter
+        writer of the per patient files
+    output_format: str
+        'csv', 'parquet' or 'arrow'
+    incremental_run: IncrementalRun
+        optional selection of the records changed since the previous run
+    """
+
+    # built once before the splitters share them
+    dataset.get_cell_line_index()
+    dataset.get_clinical_enrichments()
+
+    with get_process_pool(workers) as executor, ThreadPoolExecutor(max_workers=3) as modality_executor:
+
+        # the splitters add to the report of the run from their threads
+        def submit(function, *args, **kwargs):
+            return modality_executor.submit(contextvars.copy_context().run, function, *args, **kwargs)
+
+        arguments = (dataset, output_dir, save_as_single_file, transform_mode, executor, None, writer, output_format)
+
+        futures = {modality: submit(get_splitter(modality), *arguments, **get_split_arguments(incremental_run, modality))
+                   for modality in ['clinical', 'molecular', 'treatment']}
+
+        for modality in SPLITTERS:
+            futures[modality].result()
+
+    return None
@@ -0,0 +1,317 @@
+import sys
+import json
+import time
+import heapq
+import logging
+import threading
+import contextlib
+import contextvars
+
+try:
+    import resource
+except ImportError:
+    # not available on windows
+    resource = None
+
+logger = logging.getLogger('redcap_preprocessing')
+
+# stages of a run, in pipeline order
+STAGES = ('encoding_detection',
+          'parsing',
+          'conversion_table_load',
+          'cell_line_lookup',
+          'enrichments',
+          'clinical_transform',
+          'treatment_transform',
+          'molecular_transform',
+          'date_formatting',
+          'writing')
+
+# number of records listed in the largest records of the report
+LARGEST_RECORDS = 10
+
+REPORT_FILENAME = 'run_report.json'
+
+# report of the run in progress in this context, if any
+_current_report = contextvars.ContextVar('run_report', default=None)
+
+def configure_logging(level = logging.INFO):
+    """
+    Print the messages of the package at the given level or above on
+    stderr. Applications configuring logging themselves don't need it.
+
+    Parameters
+    ----------
+    level: int or str
+        logging level, e.g. logging.DEBUG or 'WARNING'
+    """
+
+    if not any(getattr(handler, '_redcap_preprocessing', False) for handler in logger.handlers):
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(levelname)s %(name)s: %(message)s'))
+        handler._redcap_preprocessing = True
+        logger.addHandler(handler)
+
+    logger.setLevel(level)
+
+def get_peak_memory():
+    """
+    Peak resident memory of the process and its finished children since they
+    started, in bytes, None where it is not available.
+    """
+
+    if resource is None:
+        return None
+
+    peak_memory = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                      resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+    # kilobytes on linux, bytes on macos
+    if sys.platform != 'darwin':
+        peak_memory *= 1024
+
+    return peak_memory
+
+class RunReport:
+    """
+    Timers and counters of a preprocessing run.
+
+    The time spent in each stage, the counters, e.g. the rows read and
+    written, and the largest records are collected while the report is
+    active, see get_report. Stages running in several threads add up.
+
+    The records are converted a shard at a time, so their cost is given by
+    their rows in, cell lines and rows out rather than timed one by one.
+
+    The peak memory is the one of the process since it started, e.g. of an
+    app running many jobs. The peak before the run is recorded when the
+    report is created, and the increase of the peak during the run reported
+    next to it, 0 if the run stayed below an earlier peak.
+
+    Parameters
+    ----------
+    on_count: callable
+        optional function called without arguments after each count, e.g.
+        to save the progress of a job
+    """
+
+    def __init__(self, on_count=None):
+
+        self.on_count = on_count
+
+        self.start_time = time.perf_counter()
+        self.seconds = None
+        # peak memory of the process before the run
+        self.baseline_peak_memory = get_peak_memory()
+
+        # stage -> seconds, calls
+        self.stages = {}
+        # name -> value
+        self.counters = {}
+        # heap of (rows_out, rows_in, cell_lines, modality, record_id) of
+        # the largest records
+        self.largest_records = []
+
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - start)
+
+    def add_stage(self, name: str, seconds: float, calls: int = 1):
+
+        with self.lock:
+            stage_seconds, stage_calls = self.stages.get(name, (0.0, 0))
+            self.stages[name] = (stage_seconds + seconds, stage_calls + calls)
+
+    def count(self, name: str, value: int = 1):
+
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+        if self.on_count is not None:
+            self.on_count()
+
+    def add_record(self, modality: str, record_id, rows_in: int, cell_lines: int, rows_out: int):
+
+        # records processed so far, e.g. to follow the progress of a run
+        self.count(f'{modality}_records')
+        self.add_largest_record((rows_out, rows_in, cell_lines, modality, str(record_id)))
+
+    def add_largest_record(self, item: tuple):
+
+        with self.lock:
+            if len(self.largest_records) < LARGEST_RECORDS:
+                heapq.heappush(self.largest_records, item)
+            else:
+                heapq.heappushpop(self.largest_records, item)
+
+    def merge(self, report_dict: dict):
+        """
+        Add the timers and counters of a report of another process.
+
+        Parameters
+        ----------
+        report_dict: dict
+            partial report, as returned by get_state
+        """
+
+        for name, (seconds, calls) in report_dict['stages'].items():
+            self.add_stage(name, seconds, calls)
+
+        for name, value in report_dict['counters'].items():
+            self.count(name, value)
+
+        for item in report_dict['largest_records']:
+            self.add_largest_record(tuple(item))
+
+    def get_state(self):
+
+        with self.lock:
+            return {'stages': dict(self.stages),
+                    'counters': dict(self.counters),
+                    'largest_records': list(self.largest_records)}
+
+    def finish(self):
+
+        self.seconds = time.perf_counter() - self.start_time
+
+    def to_dict(self):
+        """
+        The report as plain data, ready to be written as JSON.
+        """
+
+        seconds = self.seconds if self.seconds is not None else time.perf_counter() - self.start_time
+
+        with self.lock:
+
+            stages = {name: {'seconds': self.stages[name][0], 'calls': self.stages[name][1]}
+                      for name in sorted(self.stages, key=lambda name: STAGES.index(name) if name in STAGES else len(STAGES))}
+
+            records = self.counters.get('records', 0)
+            peak_memory = get_peak_memory()
+            peak_memory_increase = None if peak_memory is None else peak_memory - self.baseline_peak_memory
+
+            return {'seconds': seconds,
+                    'records': records,
+                    'records_per_second': records / seconds if seconds > 0 else None,
+                    'peak_memory_mb': None if peak_memory is None else peak_memory / 2**20,
+                    'peak_memory_increase_mb': None if peak_memory_increase is None else peak_memory_increase / 2**20,
+                    'stages': stages,
+                    'counters': dict(sorted(self.counters.items())),
+                    'largest_records': [{'modality': modality, 'record_id': record_id,
+                                         'rows_in': rows_in, 'cell_lines': cell_lines, 'rows_out': rows_out}
+                                        for rows_out, rows_in, cell_lines, modality, record_id in sorted(self.largest_records, reverse=True)]}
+
+    def write_json(self, path: str):
+
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=1)
+
+@contextlib.contextmanager
+def activate_report(report: RunReport):
+    """
+    Make the report collect the timers and counters of the code run in this
+    context.
+    """
+
+    token = _current_report.set(report)
+    try:
+        yield report
+    finally:
+        _current_report.reset(token)
+
+def get_report():
+    """
+    Report of the run in progress, None outside of a run.
+    """
+
+    return _current_report.get()
+
+@contextlib.contextmanager
+def stage(name: str):
+    """
+    Time a stage of the run in progress, if any.
+
+    Parameters
+    ----------
+    name: str
+        one of STAGES
+    """
+
+    report = get_report()
+
+    if report is None:
+        yield
+        return
+
+    with report.stage(name):
+        yield
+
+def count(name: str, value: int = 1):
+
+    report = get_report()
+
+    if report is not None:
+        report.count(name, value)
+
+def add_record(modality: str, record_id, rows_in: int, cell_lines: int, rows_out: int):
+    """
+    Count a record converted by a splitter, with its size.
+
+    Parameters
+    ----------
+    modality: str
+        'clinical', 'treatment' or 'molecular'
+    rows_in: int
+        rows of the record in the export
+    cell_lines: int
+        cell lines the record is fanned out to
+    rows_out: int
+        rows written for the record, all its cell lines included
+    """
+
+    report = get_report()
+
+    if report is not None:
+        report.add_record(modality, record_id, rows_in, cell_lines, rows_out)
+
+def timed_iteration(iterable, name: str):
+    """
+    Iterate, timing the production of each item as a stage.
+
+    Parameters
+    ----------
+    iterable: iterable
+        e.g. the chunks of a csv reader
+    name: str
+        one of STAGES
+    """
+
+    iterator = iter(iterable)
+
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+def run_with_report(function, *args):
+    """
+    Run a function in a worker process with a report of its own, returned
+    along with the result so that the parent merges it, see run_shards.
+    """
+
+    worker_report = RunReport()
+
+    with activate_report(worker_report):
+        result = function(*args)
+
+    return result, worker_report.get_state()
@@ -0,0 +1,46 @@
+import pandas as pd
+
+# columns placed first in the consolidated *_PID_ALL.csv files
+FRONT_COLUMNS = ['record_id', 'cell_line_code', 'date_cell_line']
+
+class ResultBuilder:
+    """
+    Collect the per record outputs of a splitter and build the consolidated
+    table once, instead of growing it with pd.concat inside the loop.
+    """
+
+    def __init__(self):
+
+        self.frames = []
+
+    def __len__(self):
+
+        return sum(len(frame) for frame in self.frames)
+
+    def add(self, frame: pd.DataFrame):
+        """
+        Add the output of a single record and cell line.
+
+        Parameters
+        ----------
+        frame: pd.DataFrame
+            cleaned data of a record for one cell line
+        """
+
+        self.frames.append(frame)
+
+    def build(self):
+        """
+        Concatenate the collected outputs, with the record_id, cell_line_code
+        and date_cell_line columns in front.
+        """
+
+        if len(self.frames) == 0:
+            return pd.DataFrame()
+
+        result = pd.concat(self.frames)
+
+        # reorder the columns with record_id, cell_line_code and date_cell_line in front
+        other_columns = [column for column in result.columns if column not in FRONT_COLUMNS]
+
+        return result[FRONT_COLUMNS + other_columns]
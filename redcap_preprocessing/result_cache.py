@@ -0,0 +1,222 @@
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import logging
+
+from redcap_preprocessing import __version__
+from redcap_preprocessing.encoding import get_file_hash
+
+logger = logging.getLogger(__name__)
+
+# size of the cached outputs beyond which the least recently used are evicted
+DEFAULT_CACHE_SIZE = 2 * 2**30
+
+# prefixes of the output files, by disease type
+OUTPUT_PREFIXES = {'CRC': ('CLI_C_PID_', 'TTR_C_PID_', 'MOL_C_PID_'),
+                   'PDAC': ('CLI_P_PID_', 'TTR_P_PID_', 'MOL_P_PID_')}
+
+def get_output_filenames(disease_type: str,
+                         output_format: str = 'csv'):
+    """
+    Names of the consolidated *_PID_ALL output files, the only cached ones.
+
+    Parameters
+    ----------
+    disease_type: str
+        'CRC' or 'PDAC'
+    output_format: str
+        'csv', 'parquet' or 'arrow'
+    """
+
+    from redcap_preprocessing.columnar import OUTPUT_EXTENSIONS
+
+    return [f'{prefix}ALL{OUTPUT_EXTENSIONS[output_format]}' for prefix in OUTPUT_PREFIXES[disease_type]]
+
+def get_modification_times(output_dir: str, filenames: list):
+    """
+    Modification times of the files of output_dir among filenames, in
+    nanoseconds, to tell the files written by a run from the older ones.
+
+    Parameters
+    ----------
+    output_dir: str
+        output directory
+    filenames: list
+        names of the files
+    """
+
+    modification_times = {}
+
+    for filename in filenames:
+        try:
+            modification_times[filename] = os.stat(os.path.join(output_dir, filename)).st_mtime_ns
+        except FileNotFoundError:
+            continue
+
+    return modification_times
+
+def get_directory_size(path: str):
+
+    return sum(os.path.getsize(os.path.join(dirpath, filename))
+               for dirpath, _, filenames in os.walk(path) for filename in filenames)
+
+class ResultCache:
+    """
+    Outputs of the previous runs, keyed by the content of the export, the
+    disease type, the content of the conversion table, the version of the
+    package and the output options.
+
+    Only the consolidated *_PID_ALL outputs are cached, see
+    get_output_filenames. An entry is a directory of cache_dir named by its
+    key, complete once renamed in place, so several processes can share the
+    cache. The least
+    recently used entries are evicted beyond max_size bytes.
+
+    Parameters
+    ----------
+    cache_dir: str
+        directory of the cached outputs
+    max_size: int
+        size of the cached outputs beyond which the least recently used are
+        evicted, in bytes
+    """
+
+    def __init__(self,
+                 cache_dir: str,
+                 max_size: int = DEFAULT_CACHE_SIZE):
+
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def get_key(self,
+                redcap_filepath: str,
+                disease_type: str,
+                conversion_table_filepath: str,
+                **options):
+        """
+        Key of the outputs of a run.
+
+        Parameters
+        ----------
+        redcap_filepath: str
+            path to redcap data set
+        disease_type: str
+            'CRC' or 'PDAC'
+        conversion_table_filepath: str
+            path to redcap conversion table
+        options: dict
+            arguments of the run changing the outputs, e.g. output_format
+        """
+
+        key = {'redcap': get_file_hash(redcap_filepath),
+               'disease_type': disease_type,
+               'conversion_table': get_file_hash(conversion_table_filepath),
+               'version': __version__,
+               'options': options}
+
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get_entry_dir(self, key: str):
+
+        return os.path.join(self.cache_dir, key)
+
+    def contains(self, key: str):
+
+        return os.path.isdir(self.get_entry_dir(key))
+
+    def restore(self, key: str, output_dir: str, output_filenames: list = ()):
+        """
+        Copy the cached outputs to output_dir, and return whether there were
+        any.
+
+        The output_filenames missing from the entry, e.g. the MOL_*_PID_ALL of
+        an earlier run of another export when this one has no molecular
+        data, are removed from output_dir first. The other files of
+        output_dir are left untouched.
+
+        Parameters
+        ----------
+        key: str
+            key of the outputs, see get_key
+        output_dir: str
+            output directory
+        output_filenames: list
+            names of all the outputs of a run, see get_output_filenames
+        """
+
+        entry_dir = self.get_entry_dir(key)
+
+        try:
+            filenames = os.listdir(entry_dir)
+            for filename in set(output_filenames) - set(filenames):
+                if os.path.exists(os.path.join(output_dir, filename)):
+                    os.remove(os.path.join(output_dir, filename))
+            for filename in filenames:
+                shutil.copyfile(os.path.join(entry_dir, filename), os.path.join(output_dir, filename))
+            # most recently used
+            os.utime(entry_dir)
+        except FileNotFoundError:
+            # missing, or evicted by another process meanwhile
+            return False
+
+        logger.info('Restored %d cached outputs.', len(filenames))
+
+        return True
+
+    def store(self, key: str, output_dir: str, filenames: list):
+        """
+        Cache outputs, then evict the least recently used ones beyond the
+        size of the cache.
+
+        Parameters
+        ----------
+        key: str
+            key of the outputs, see get_key
+        output_dir: str
+            output directory
+        filenames: list
+            names of the output files written by the run in output_dir
+        """
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        tmp_dir = os.path.join(self.cache_dir, f'{key}.{uuid.uuid4().hex}.tmp')
+        os.makedirs(tmp_dir)
+
+        try:
+            for filename in filenames:
+                shutil.copyfile(os.path.join(output_dir, filename), os.path.join(tmp_dir, filename))
+            os.rename(tmp_dir, self.get_entry_dir(key))
+        except OSError:
+            # e.g. stored meanwhile by another process
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in
+        max_size.
+        """
+
+        entries = []
+
+        for key in os.listdir(self.cache_dir):
+            entry_dir = self.get_entry_dir(key)
+            if key.endswith('.tmp') or not os.path.isdir(entry_dir):
+                continue
+            try:
+                entries.append((os.stat(entry_dir).st_mtime, get_directory_size(entry_dir), entry_dir))
+            except FileNotFoundError:
+                continue
+
+        cache_size = sum(size for _, size, _ in entries)
+
+        # least recently used first
+        for _, size, entry_dir in sorted(entries):
+            if cache_size <= self.max_size:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            cache_size -= size
@@ -1,18 +1,29 @@
 import pandas as pd
 import numpy as np
 import os
-import chardet
-from redcap_preprocessing.utils import get_cell_line_code, get_content_matching_type_1, get_content_matching_type_2, get_content_matching_type_3, get_content_matching_type_4, add_content
-from redcap_preprocessing.utils import get_delimiter
-from redcap_preprocessing.utils import standardize_code
-from redcap_preprocessing.utils import format_dates
+import logging
+from concurrent.futures import Executor
+from redcap_preprocessing.utils import add_content
+from redcap_preprocessing.cell_line_index import fan_out_cell_lines
+from redcap_preprocessing.columnar import OUTPUT_FORMATS, get_output_path
+from redcap_preprocessing.conversion_plan import ConversionPlan
+from redcap_preprocessing.dataset import RedcapDataset
+from redcap_preprocessing.parallel import RECORDS_PER_SHARD, count_placeholders, get_placeholder_indexes, get_shards, run_shards
+from redcap_preprocessing.result_builder import ResultBuilder
+from redcap_preprocessing.split_state import SplitState
+from redcap_preprocessing.writer import PatientFileWriter, write_table_atomically
+from redcap_preprocessing.transform import TRANSFORM_MODES, transform_data
+from redcap_preprocessing.dates import format_dates
+from redcap_preprocessing import report
+
+logger = logging.getLogger(__name__)
 
 def get_single_patient_molecular_data(patient_molecular_data,
-                                      redcap_conversion_table):
+                                      conversion_plan):
 
     cleaned_patient_molecular_data = pd.DataFrame('',
                                                 index = patient_molecular_data.index,
-                                                columns = redcap_conversion_table['orakloncology_name'].unique(),)
+                                                columns = conversion_plan.columns,)
 
     # Select single therapy row
     for index, row in patient_molecular_data.iterrows():
@@ -20,39 +31,42 @@ def get_single_patient_molecular_data(patient_molecular_data,
         # loop through all the columns in the redcap table
         for column_name in cleaned_patient_molecular_data.columns:
 
-            matching_types = redcap_conversion_table[redcap_conversion_table['orakloncology_name'] == column_name]['matching_type'].unique()
+            for matching_type in conversion_plan.matching_types(column_name):
 
-            for matching_type in matching_types:
-
-                if matching_type == 1:
-
-                    content = get_content_matching_type_1(row, redcap_conversion_table, column_name)
-
-                if matching_type == 2:
-
-                    content = get_content_matching_type_2(row, redcap_conversion_table, column_name)
-
-                if matching_type == 3:
-
-                    content = get_content_matching_type_3(row, redcap_conversion_table, column_name)
-
-                if matching_type == 4:
-
-                    content = get_content_matching_type_4(row, redcap_conversion_table, column_name)
+                content = conversion_plan.get_content(row, column_name, matching_type)
                 
                 content= add_content(content, cleaned_patient_molecular_data.loc[index, column_name])
                 cleaned_patient_molecular_data.loc[index, column_name] = content
 
     return cleaned_patient_molecular_data
+
+def get_molecular_data(redcap_molecular_data,
+                       conversion_plan):
+    """
+    Preprocess the molecular rows of all the patients at once.
+
+    Vectorized equivalent of get_single_patient_molecular_data.
+
+    Parameters
+    ----------
+    redcap_molecular_data: pd.DataFrame
+        molecular rows of the redcap data set
+    conversion_plan: ConversionPlan
+        compiled conversion table between redcap and orakloncology
+    """
+
+    return transform_data(redcap_molecular_data, conversion_plan)
     
 def split_molecular_data_from_redcap(redcap_path: str,
                        redcap_conversion_table_path: str,
                        output_dir: str,
                        disease_type: str,
                        save_as_single_file: bool = False,
+                       transform_mode: str = 'vectorized',
+                       output_format: str = 'csv',
                        ):
     """
-    Get the treatment data from the redcap data set.
+    Get the molecular data from the redcap data set.
 
     Parameters
     ----------
@@ -62,137 +76,258 @@ def split_molecular_data_from_redcap(redcap_path: str,
         path to redcap CRC conversion table
     output_dir: str
         output directory
+    transform_mode: str
+        'vectorized' or 'reference' (row by row) conversion
+    output_format: str
+        'csv', 'parquet' or 'arrow'
     """
 
-    def detect_encoding(file_path):
-        with open(file_path, 'rb') as file:
-            result = chardet.detect(file.read())
-        return result['encoding']
-
-    file_encoding = detect_encoding(redcap_path)
-    print("Detected encoding:", file_encoding)
-
-    # detect the separator type and read the data
-    redcap_delimiter = get_delimiter(redcap_path)
-
-    # some of the redcap files are not encoded in unicode_escape
-    try:
-        redcap = pd.read_csv(redcap_path, delimiter=redcap_delimiter, encoding="unicode_escape")
-        # get the unique record ids
-        record_ids = redcap.record_id.unique()
-    except:
-        redcap = pd.read_csv(redcap_path, delimiter=redcap_delimiter, encoding=file_encoding)
-        # get the unique record ids
-        record_ids = redcap.record_id.unique()
-
-    # check that the table isn't empty
-    if len(redcap) == 0:
-        raise ValueError('The redcap table is empty.')
+    dataset = RedcapDataset.from_csv(redcap_path, redcap_conversion_table_path, disease_type)
+
+    return split_molecular_data(dataset, output_dir, save_as_single_file, transform_mode, output_format=output_format)
+
+def split_molecular_data(dataset: RedcapDataset,
+                         output_dir: str,
+                         save_as_single_file: bool = False,
+                         transform_mode: str = 'vectorized',
+                         executor: Executor = None,
+                         state: SplitState = None,
+                         writer: PatientFileWriter = None,
+                         output_format: str = 'csv',
+                         select_record = None,
+                         record_outputs: dict = None,
+                         ):
+    """
+    Get the molecular data from an already loaded redcap data set.
+
+    Parameters
+    ----------
+    dataset: RedcapDataset
+        redcap data set and conversion table
+    output_dir: str
+        output directory
+    transform_mode: str
+        'vectorized' or 'reference' (row by row) conversion
+    executor: Executor
+        optional process pool, the records are then processed in shards
+    state: SplitState
+        optional counters carried across the batches of a streaming run, the
+        consolidated table is then appended to
+    writer: PatientFileWriter
+        optional writer of the per patient files, shared with other splitters
+    output_format: str
+        'csv', 'parquet' or 'arrow'
+    select_record: callable
+        optional select_record(record_id, placeholder_index), only the records
+        for which it returns True are converted
+    record_outputs: dict
+        optional record_id -> filenames of the per patient files, or tables
+        if save_as_single_file. It is updated with the outputs of the
+        converted records, and gives the tables of the other records.
+    """
+
+    assert transform_mode in TRANSFORM_MODES
+    assert output_format in OUTPUT_FORMATS
+
+    # a single pass, its consolidated table is complete once written
+    owns_state = state is None
+    if owns_state:
+        state = SplitState()
+
+    # the per patient files are written in the background
+    if writer is None and not save_as_single_file:
+        with PatientFileWriter(output_dir, output_format=output_format) as writer:
+            return split_molecular_data(dataset, output_dir, save_as_single_file, transform_mode, executor, state, writer, output_format,
+                                        select_record, record_outputs)
+
+    redcap = dataset.redcap
+    disease_type = dataset.disease_type
+
+    # get the unique record ids
+    record_ids = list(redcap.record_id.unique())
     
     # verify that the output directory exists
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
     # column name mapping
-    conversion_table_delimiter = get_delimiter(redcap_conversion_table_path)
-    redcap_conversion_table = pd.read_csv(redcap_conversion_table_path, delimiter=conversion_table_delimiter)
-    redcap_conversion_table = redcap_conversion_table[redcap_conversion_table.data_type == 'molecular_profile']
-    redcap_conversion_table['redcap_name'] = redcap_conversion_table['redcap_name'].str.strip()
+    conversion_plan = dataset.get_conversion_plan('molecular_profile')
+
+    # cell line codes and rows of each record
+    cell_line_index = dataset.get_cell_line_index()
+
+    # select the molecular rows
+    if disease_type == 'CRC':
+        is_molecular_row = redcap['redcap_repeat_instrument'].isin(['molecular_profile']).to_numpy()
+    elif disease_type == 'PDAC':
+        is_molecular_row = redcap['redcap_repeat_instrument'].isna().to_numpy()
+
+    cell_lines = [cell_line_index.get_cell_line_code(record_id) for record_id in record_ids]
+    record_rows = [cell_line_index.get_rows(record_id, is_molecular_row) for record_id in record_ids]
+
+    # the records without molecular rows are skipped and use no placeholder
+    placeholder_counts = [count_placeholders(cell_line_code, date_cell_line) if len(rows) > 0 else 0
+                          for (cell_line_code, date_cell_line), rows in zip(cell_lines, record_rows)]
+    placeholder_indexes = get_placeholder_indexes(placeholder_counts, state.placeholder_index)
+    state.placeholder_index += sum(placeholder_counts)
+
+    # the records to convert, all of them unless e.g. an incremental run selects the changed ones
+    positions = [position for position, record_id in enumerate(record_ids)
+                 if select_record is None or select_record(record_id, placeholder_indexes[position])]
+
+    # a single shard when running serially
+    records_per_shard = RECORDS_PER_SHARD if executor is not None else max(len(positions), 1)
+
+    # the process pool sends the per patient tables back, as well as a serial
+    # run keeping the outputs by record
+    shard_writer = writer if executor is None and record_outputs is None else None
+
+    shard_arguments = [(redcap.iloc[np.concatenate([record_rows[position] for position in shard])],
+                        [record_ids[position] for position in shard],
+                        [cell_lines[position] for position in shard],
+                        [placeholder_indexes[position] for position in shard],
+                        conversion_plan,
+                        disease_type,
+                        shard_writer,
+                        save_as_single_file,
+                        transform_mode) for shard in get_shards(positions, records_per_shard)]
+
+    # outputs of the converted records
+    converted_outputs = {record_ids[position]: [] for position in positions}
+
+    for shard_results in run_shards(split_molecular_records, shard_arguments, executor):
+        for record_id, cleaned_single_patient_molecular_data_unique_cell_line, filename in shard_results:
+            if save_as_single_file:
+                converted_outputs[record_id].append(cleaned_single_patient_molecular_data_unique_cell_line)
+            else:
+                writer.write(cleaned_single_patient_molecular_data_unique_cell_line, filename, conversion_plan.get_column_kinds())
+                converted_outputs[record_id].append(filename)
+
+    if record_outputs is not None:
+        record_outputs.update(converted_outputs)
+    else:
+        record_outputs = converted_outputs
 
-    # recap dataframe
-    cleaned_patient_molecular_data = pd.DataFrame()
-    i = 0
+    if save_as_single_file:
 
-    # loop through all the record ids
-    for record_id in record_ids:
-
-        if True:
-
-            # get the cell line code
-            cell_line_code, date_cell_line = get_cell_line_code(disease_type, redcap, record_id)
-
-            if disease_type == 'CRC':
-                patient_molecular_data = redcap[(redcap.record_id == record_id) &
-                                                (redcap['redcap_repeat_instrument'].isin(['molecular_profile']))]
-            elif disease_type == 'PDAC':
-                patient_molecular_data = redcap[(redcap.record_id == record_id) &
-                                                (redcap['redcap_repeat_instrument'].isna())]
-
-            # get the single patient treatment data
-            cleaned_single_patient_molecular_data = get_single_patient_molecular_data(patient_molecular_data,
-                                                                                      redcap_conversion_table)
-
-            if len(cleaned_single_patient_molecular_data) > 0:
-
-                # TO IMPROVE
-                if 'CGR' in cell_line_code:
-                    cell_line_code = cell_line_code.replace('CGR', 'GR')
-                elif 'PGR' in cell_line_code:
-                    cell_line_code = cell_line_code.replace('PGR', 'GR')
-
-                extracted_cell_line_codes = cell_line_code.split(';')
-                extracted_cell_line_dates = date_cell_line.split(';')
-
-                # if multiple treatment lines are present, save twice under different names
-                for cell_line_code, cell_line_date in zip(extracted_cell_line_codes, extracted_cell_line_dates):
-
-                    # we had bugs when single patient had multiple cell lines
-                    # needed to correct this by running all the normalizations on a virgin table
-                    # for that patient
-                    cleaned_single_patient_molecular_data_unique_cell_line = cleaned_single_patient_molecular_data.copy()
-
-                    if len(cell_line_code)>0:
-                        cell_line_code = standardize_code(cell_line_code, 'GR')
-                    else:
-                        cell_line_code = 'XX' + f'{i:04d}'
-                        i += 1
-
-                    # add the cell line code and date
-                    cleaned_single_patient_molecular_data_unique_cell_line['cell_line_code'] = cell_line_code
-                    cleaned_single_patient_molecular_data_unique_cell_line['sister_cell_line_codes'] = ';'.join([element for element in extracted_cell_line_codes if element != cell_line_code])
-                    cleaned_single_patient_molecular_data_unique_cell_line['date_cell_line'] = cell_line_date
-                    cleaned_single_patient_molecular_data_unique_cell_line['record_id'] = record_id
-
-                    cleaned_single_patient_molecular_data_unique_cell_line = format_dates(cleaned_single_patient_molecular_data_unique_cell_line)
-
-                    if save_as_single_file:
-                        cleaned_patient_molecular_data = pd.concat([cleaned_patient_molecular_data, cleaned_single_patient_molecular_data_unique_cell_line])
-                    else:
-                        if disease_type == 'CRC':
-                            filename = f'{output_dir}/MOL_C_PID_{cell_line_code}_SID_0001.csv'
-                        elif disease_type == 'PDAC':
-                            filename = f'{output_dir}/MOL_P_PID_{cell_line_code}_SID_0001.csv'
-                        # save the data
-                        cleaned_single_patient_molecular_data_unique_cell_line.to_csv(filename, sep=';')
-
-        #except:
-        #    print(f'Error for {record_id}')
+        # recap dataframe, in the order of the records
+        cleaned_patient_molecular_data = ResultBuilder()
 
-    if save_as_single_file:
+        for record_id in record_ids:
+            for cleaned_single_patient_molecular_data_unique_cell_line in record_outputs.get(record_id, []):
+                cleaned_patient_molecular_data.add(cleaned_single_patient_molecular_data_unique_cell_line)
 
         if len(cleaned_patient_molecular_data) == 0:
-            print('The cleaned_patient_molecular_data is empty.')
+            logger.warning('The cleaned_patient_molecular_data is empty.')
             return None
 
-        # reorder the columns with record_id, cell_line_code and date_cell_line in front
-        all_columns = list(cleaned_patient_molecular_data.columns)
+        # materialize the consolidated table, record_id, cell_line_code and date_cell_line in front
+        cleaned_patient_molecular_data = cleaned_patient_molecular_data.build()
 
-        # Columns to be placed at the beginning
-        selected_columns = ['record_id', 'cell_line_code', 'date_cell_line']
+        if disease_type == 'CRC':
+            filename = f'{output_dir}/MOL_C_PID_ALL'
+        elif disease_type == 'PDAC':
+            filename = f'{output_dir}/MOL_P_PID_ALL'
+
+        if output_format == 'csv':
+            # appended to in a streaming run, renamed once complete
+            with report.stage('writing'):
+                cleaned_patient_molecular_data.to_csv(state.get_partial_path(get_output_path(filename, 'csv')), sep=';', mode='a' if state.rows_written > 0 else 'w', header=state.rows_written == 0)
+        else:
+            # the columnar files can't be appended to
+            assert state.rows_written == 0
+            write_table_atomically(cleaned_patient_molecular_data, get_output_path(filename, output_format), output_format, conversion_plan.get_column_kinds())
+        state.rows_written += len(cleaned_patient_molecular_data)
+        if owns_state:
+            state.commit()
+    return None
+
+def split_molecular_records(redcap_molecular_data: pd.DataFrame,
+                            record_ids: list,
+                            cell_lines: list,
+                            placeholder_indexes: list,
+                            conversion_plan: ConversionPlan,
+                            disease_type: str,
+                            writer: PatientFileWriter,
+                            save_as_single_file: bool,
+                            transform_mode: str,
+                            ):
+    """
+    Split the molecular data of a shard of records by cell line.
 
-        # Filter out the selected columns from all_columns
-        other_columns = [col for col in all_columns if col not in selected_columns]
+    The per cell line tables are written, or returned as (record_id, table,
+    filename) if save_as_single_file or there is no writer.
 
-        # Concatenate selected columns with other columns
-        new_column_order = selected_columns + other_columns
+    Parameters
+    ----------
+    redcap_molecular_data: pd.DataFrame
+        molecular rows of the records of the shard
+    record_ids: list
+        record ids of the shard
+    cell_lines: list
+        (cell_line_code, date_cell_line) of each record of the shard
+    placeholder_indexes: list
+        number of the first XX placeholder code of each record of the shard
+    conversion_plan: ConversionPlan
+        compiled conversion table between redcap and orakloncology
+    writer: PatientFileWriter
+        writer of the per patient files
+    """
 
-        # Reorder the DataFrame
-        cleaned_patient_molecular_data = cleaned_patient_molecular_data[new_column_order]
+    # record_id -> positions of its rows in the shard
+    patient_rows = redcap_molecular_data.groupby('record_id', sort=False).indices
+    record_rows = [patient_rows.get(record_id, np.array([], dtype=int)) for record_id in record_ids]
 
-        if disease_type == 'CRC':
-            filename = f'{output_dir}/MOL_C_PID_ALL.csv'
-        elif disease_type == 'PDAC':
-            filename = f'{output_dir}/MOL_P_PID_ALL.csv'
+    cleaned_patient_molecular_data = []
+    column_kinds = conversion_plan.get_column_kinds()
 
-        cleaned_patient_molecular_data.to_csv(filename, sep=';')
-    return None
\ No newline at end of file
+    # get the molecular data of the patients, in the order of the rows of the shard
+    if transform_mode == 'vectorized':
+        with report.stage('molecular_transform'):
+            cleaned_molecular_data = get_molecular_data(redcap_molecular_data, conversion_plan)
+    else:
+        with report.stage('molecular_transform'):
+            cleaned_molecular_data = [get_single_patient_molecular_data(redcap_molecular_data.iloc[rows],
+                                                                        conversion_plan) for rows in record_rows if len(rows) > 0]
+            cleaned_molecular_data = pd.concat(cleaned_molecular_data) if len(cleaned_molecular_data) > 0 else pd.DataFrame(columns=conversion_plan.columns)
+
+    # dates formatted once for all the cell lines of the records
+    cleaned_molecular_data = format_dates(cleaned_molecular_data)
+
+    # one table per cell line, the records with several cell lines repeated
+    cleaned_molecular_data, cell_line_table = fan_out_cell_lines(cleaned_molecular_data,
+                                                                 record_ids,
+                                                                 record_rows,
+                                                                 cell_lines,
+                                                                 placeholder_indexes)
+    report.count('molecular_rows_out', len(cleaned_molecular_data))
+
+    record_cell_lines = cell_line_table.groupby('position', sort=False).indices
+
+    # loop through all the record ids
+    for position, record_id in enumerate(record_ids):
+
+        record_cell_line_table = cell_line_table.iloc[record_cell_lines.get(position, [])]
+
+        if save_as_single_file and len(record_cell_line_table) > 0:
+            # all the cell lines of the record
+            cleaned_patient_molecular_data.append((record_id, cleaned_molecular_data.iloc[record_cell_line_table['start'].iloc[0]:record_cell_line_table['stop'].iloc[-1]], None))
+
+        elif not save_as_single_file:
+            for cell_line_code, start, stop in zip(record_cell_line_table['cell_line_code'], record_cell_line_table['start'], record_cell_line_table['stop']):
+
+                if disease_type == 'CRC':
+                    filename = f'MOL_C_PID_{cell_line_code}_SID_0001'
+                elif disease_type == 'PDAC':
+                    filename = f'MOL_P_PID_{cell_line_code}_SID_0001'
+                # save the data
+                if writer is not None:
+                    writer.write(cleaned_molecular_data.iloc[start:stop], filename, column_kinds)
+                else:
+                    cleaned_patient_molecular_data.append((record_id, cleaned_molecular_data.iloc[start:stop], filename))
+
+        # the size of the record rather than its time, the shard being converted at once
+        report.add_record('molecular', record_id, len(record_rows[position]), len(record_cell_line_table),
+                          int((record_cell_line_table['stop'] - record_cell_line_table['start']).sum()))
+
+    return cleaned_patient_molecular_data
@@ -0,0 +1,51 @@
+import os
+import threading
+
+class SplitState:
+    """
+    Counters of a splitter carried across the record batches of a streaming
+    run, so that the outputs are the same as a single pass over the data set.
+
+    The consolidated csv tables are appended to under a temporary name, and
+    renamed by commit once all the batches are written, so that an
+    interrupted run never leaves a truncated *_PID_ALL.csv.
+    """
+
+    def __init__(self):
+
+        # number of the next XX placeholder code
+        self.placeholder_index = 0
+
+        # rows already written to the consolidated *_PID_ALL table
+        self.rows_written = 0
+
+        # path of a consolidated table -> temporary path it is appended to
+        self.partial_paths = {}
+
+    def get_partial_path(self, path: str):
+
+        if path not in self.partial_paths:
+            self.partial_paths[path] = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+        return self.partial_paths[path]
+
+    def commit(self):
+        """
+        Rename the consolidated tables written so far to their final names.
+        """
+
+        for path, partial_path in self.partial_paths.items():
+            os.replace(partial_path, path)
+
+        self.partial_paths = {}
+
+    def discard(self):
+        """
+        Remove the consolidated tables of an interrupted run.
+        """
+
+        for partial_path in self.partial_paths.values():
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+        self.partial_paths = {}
@@ -1,20 +1,32 @@
 import pandas as pd
 import numpy as np
 import os
-import chardet
-
-from redcap_preprocessing.utils import get_cell_line_code, get_content_matching_type_1, get_content_matching_type_2, get_content_matching_type_3, get_content_matching_type_4, add_content
-from redcap_preprocessing.utils import get_delimiter
-from redcap_preprocessing.utils import standardize_code
-from redcap_preprocessing.utils import format_dates
+import logging
+from concurrent.futures import Executor
+
+from redcap_preprocessing.utils import add_content
+from redcap_preprocessing.cell_line_index import fan_out_cell_lines
+from redcap_preprocessing.columnar import OUTPUT_FORMATS, get_output_path
+from redcap_preprocessing.conversion_plan import ConversionPlan
+from redcap_preprocessing.dataset import RedcapDataset
+from redcap_preprocessing.enrichments import add_enrichments, get_modality_enrichments
+from redcap_preprocessing.parallel import RECORDS_PER_SHARD, count_placeholders, get_placeholder_indexes, get_shards, run_shards
+from redcap_preprocessing.result_builder import ResultBuilder
+from redcap_preprocessing.split_state import SplitState
+from redcap_preprocessing.writer import PatientFileWriter, write_table_atomically
+from redcap_preprocessing.transform import TRANSFORM_MODES, transform_data
+from redcap_preprocessing.dates import format_dates
+from redcap_preprocessing import report
+
+logger = logging.getLogger(__name__)
 
 def get_single_patient_treatment_data(patient_treatment_data,
-                                      redcap_CRC_conversion_table,
+                                      conversion_plan,
                                       disease_type,):
 
     cleaned_patient_treatment_data = pd.DataFrame('',
                                                 index = patient_treatment_data.index,
-                                                columns = redcap_CRC_conversion_table['orakloncology_name'].unique(),)
+                                                columns = conversion_plan.columns,)
     
     if disease_type == 'PDAC':
         slice_df = patient_treatment_data[patient_treatment_data['bras_essai_clinique_met'].isna()]
@@ -33,25 +45,9 @@ def get_single_patient_treatment_data(patient_treatment_data,
         # loop through all the columns in the redcap table
         for column_name in cleaned_patient_treatment_data.columns:
 
-            matching_types = redcap_CRC_conversion_table[redcap_CRC_conversion_table['orakloncology_name'] == column_name]['matching_type'].unique()
-
-            for matching_type in matching_types:
-
-                if matching_type == 1:
-
-                    content = get_content_matching_type_1(row, redcap_CRC_conversion_table, column_name)
-
-                if matching_type == 2:
-
-                    content = get_content_matching_type_2(row, redcap_CRC_conversion_table, column_name)
-
-                if matching_type == 3:
-
-                    content = get_content_matching_type_3(row, redcap_CRC_conversion_table, column_name)
+            for matching_type in conversion_plan.matching_types(column_name):
 
-                if matching_type == 4:
-
-                    content = get_content_matching_type_4(row, redcap_CRC_conversion_table, column_name)
+                content = conversion_plan.get_content(row, column_name, matching_type)
 
                 # special case for chemotherapy_type
                 if disease_type == 'CRC':
@@ -77,12 +73,72 @@ def get_single_patient_treatment_data(patient_treatment_data,
     cleaned_patient_treatment_data.loc[cleaned_patient_treatment_data['treatment_type'] == 'neo_adjuvant', 'stop_chemotherapy_cause'] = 'surgery'
 
     return cleaned_patient_treatment_data
+
+def get_treatment_data(redcap_treatment_data,
+                       conversion_plan,
+                       disease_type,):
+    """
+    Preprocess the treatment rows of all the patients at once.
+
+    Vectorized equivalent of get_single_patient_treatment_data.
+
+    Parameters
+    ----------
+    redcap_treatment_data: pd.DataFrame
+        treatment rows of the redcap data set
+    conversion_plan: ConversionPlan
+        compiled conversion table between redcap and orakloncology
+    disease_type: str
+        'CRC' or 'PDAC'
+    """
+
+    redcap_treatment_data = redcap_treatment_data.copy()
+
+    # free text replacing the 'other' and 'clinical_trial' chemotherapy types
+    if disease_type == 'PDAC':
+        redcap_treatment_data['bras_essai_clinique_met'] = redcap_treatment_data['bras_essai_clinique_met'].fillna('')
+        redcap_treatment_data['spe_autre_met'] = redcap_treatment_data['spe_autre_met'].fillna('')
+        chemotherapy_type_details = {'other': 'spe_autre_met', 'clinical_trial': 'bras_essai_clinique_met'}
+
+    elif disease_type == 'CRC':
+        redcap_treatment_data['other_iv'] = redcap_treatment_data['other_iv'].fillna('')
+        chemotherapy_type_details = {'other': 'other_iv'}
+
+    # special case for chemotherapy_type
+    # NB: targeted_therapy_type is never lowercased by the row by row path
+    def adjust_chemotherapy_type(data, column_name, content):
+
+        if column_name != 'chemotherapy_type':
+            return content
+
+        masks = {chemotherapy_type: content == chemotherapy_type for chemotherapy_type in chemotherapy_type_details}
+
+        for chemotherapy_type, redcap_name in chemotherapy_type_details.items():
+            mask = masks[chemotherapy_type]
+            if mask.any():
+                content[mask] = [detail.lower() for detail in data[redcap_name].to_numpy(dtype=object)[mask]]
+
+        return content
+
+    cleaned_treatment_data = transform_data(redcap_treatment_data,
+                                            conversion_plan,
+                                            adjust_content=adjust_chemotherapy_type)
+
+    # add treatment type
+    cleaned_treatment_data['treatment_type'] = redcap_treatment_data['redcap_repeat_instrument'].replace('ligne_mtastatique_de_traitement', 'metastatic').replace('hai_chemotherapy', 'hai').replace('', 'neo_adjuvant')
+
+    # if neo_adjuvant, change stop cause
+    cleaned_treatment_data.loc[cleaned_treatment_data['treatment_type'] == 'neo_adjuvant', 'stop_chemotherapy_cause'] = 'surgery'
+
+    return cleaned_treatment_data
     
 def split_treatment_data_from_redcap(redcap_path: str,
                        redcap_conversion_table_path: str,
                        output_dir: str,
                        disease_type: str,
                        save_as_single_file: bool = False,
+                       transform_mode: str = 'vectorized',
+                       output_format: str = 'csv',
                        ):
     """
     Get the treatment data from the redcap data set.
@@ -95,160 +151,273 @@ def split_treatment_data_from_redcap(redcap_path: str,
         path to redcap CRC conversion table
     output_dir: str
         output directory
+    transform_mode: str
+        'vectorized' or 'reference' (row by row) conversion
+    output_format: str
+        'csv', 'parquet' or 'arrow'
     """
 
-    def detect_encoding(file_path):
-        with open(file_path, 'rb') as file:
-            result = chardet.detect(file.read())
-        return result['encoding']
-
-    file_encoding = detect_encoding(redcap_path)
-    print("Detected encoding:", file_encoding)
-
-    # detect the separator type and read the data
-    redcap_delimiter = get_delimiter(redcap_path)
-    redcap = pd.read_csv(redcap_path, delimiter=redcap_delimiter, encoding="unicode_escape")
-
-    # some of the redcap files are not encoded in unicode_escape
-    try:
-        redcap = pd.read_csv(redcap_path, delimiter=redcap_delimiter, encoding="unicode_escape")
-        # get the unique record ids
-        record_ids = redcap.record_id.unique()
-    except:
-        redcap = pd.read_csv(redcap_path, delimiter=redcap_delimiter, encoding=file_encoding)
-        # get the unique record ids
-        record_ids = redcap.record_id.unique()
-
-    # Read in the data
-    redcap['redcap_repeat_instrument'] = redcap['redcap_repeat_instrument'].fillna('')
-
-    # check that the table isn't empty
-    if len(redcap) == 0:
-        raise ValueError('The redcap table is empty.')
+    dataset = RedcapDataset.from_csv(redcap_path, redcap_conversion_table_path, disease_type)
+
+    return split_treatment_data(dataset, output_dir, save_as_single_file, transform_mode, output_format=output_format)
+
+def split_treatment_data(dataset: RedcapDataset,
+                         output_dir: str,
+                         save_as_single_file: bool = False,
+                         transform_mode: str = 'vectorized',
+                         executor: Executor = None,
+                         state: SplitState = None,
+                         writer: PatientFileWriter = None,
+                         output_format: str = 'csv',
+                         select_record = None,
+                         record_outputs: dict = None,
+                         ):
+    """
+    Get the treatment data from an already loaded redcap data set.
+
+    Parameters
+    ----------
+    dataset: RedcapDataset
+        redcap data set and conversion table
+    output_dir: str
+        output directory
+    transform_mode: str
+        'vectorized' or 'reference' (row by row) conversion
+    executor: Executor
+        optional process pool, the records are then processed in shards
+    state: SplitState
+        optional counters carried across the batches of a streaming run, the
+        consolidated table is then appended to
+    writer: PatientFileWriter
+        optional writer of the per patient files, shared with other splitters
+    output_format: str
+        'csv', 'parquet' or 'arrow'
+    select_record: callable
+        optional select_record(record_id, placeholder_index), only the records
+        for which it returns True are converted
+    record_outputs: dict
+        optional record_id -> filenames of the per patient files, or tables
+        if save_as_single_file. It is updated with the outputs of the
+        converted records, and gives the tables of the other records.
+    """
+
+    assert transform_mode in TRANSFORM_MODES
+    assert output_format in OUTPUT_FORMATS
+
+    # a single pass, its consolidated table is complete once written
+    owns_state = state is None
+    if owns_state:
+        state = SplitState()
+
+    # the per patient files are written in the background
+    if writer is None and not save_as_single_file:
+        with PatientFileWriter(output_dir, output_format=output_format) as writer:
+            return split_treatment_data(dataset, output_dir, save_as_single_file, transform_mode, executor, state, writer, output_format,
+                                        select_record, record_outputs)
+
+    redcap = dataset.redcap
+    disease_type = dataset.disease_type
+
+    # get the unique record ids
+    record_ids = list(redcap.record_id.unique())
+
+    # select the treatment rows, the neo adjuvant treatment has no instrument
+    redcap_repeat_instrument = redcap['redcap_repeat_instrument'].astype(object).fillna('')
+    is_treatment_row = redcap_repeat_instrument.isin(['','ligne_mtastatique_de_traitement', 'hai_chemotherapy']).to_numpy()
+    redcap_treatment_data = redcap.assign(redcap_repeat_instrument=redcap_repeat_instrument)
     
     # verify that the output directory exists
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
     # column name mapping
-    conversion_table_delimiter = get_delimiter(redcap_conversion_table_path)
-    redcap_CRC_conversion_table = pd.read_csv(redcap_conversion_table_path, delimiter=conversion_table_delimiter)    
-    redcap_CRC_conversion_table = redcap_CRC_conversion_table[redcap_CRC_conversion_table.data_type == 'treatment']
-    redcap_CRC_conversion_table['redcap_name'] = redcap_CRC_conversion_table['redcap_name'].str.strip()
-
-    # recap dataframe
-    cleaned_patient_treatment_data = pd.DataFrame()
-    # index for patients w/o cell lines
-    i = 0
-
-    # loop through all the record ids
-    for record_id in record_ids:
-
-        if True:
-
-            # get the cell line code
-            cell_line_code, date_cell_line = get_cell_line_code(disease_type, redcap, record_id)
-
-            # select the patient data
-            patient_treatment_data = redcap[(redcap.record_id == record_id) &
-                                            (redcap['redcap_repeat_instrument'].isin(['','ligne_mtastatique_de_traitement', 'hai_chemotherapy']))]
-            
-            # test if there is any data, otherwise skip
-            if len(patient_treatment_data) > 0:
-
-                # get the single patient treatment data
-                cleaned_single_patient_treatment_data = get_single_patient_treatment_data(patient_treatment_data,
-                                                                                    redcap_CRC_conversion_table,
-                                                                                    disease_type)
-                # TO IMPROVE
-                if 'CGR' in cell_line_code:
-                    cell_line_code = cell_line_code.replace('CGR', 'GR')
-                elif 'PGR' in cell_line_code:
-                    cell_line_code = cell_line_code.replace('PGR', 'GR')
-
-                extracted_cell_line_codes = cell_line_code.split(';')
-                extracted_cell_line_dates = date_cell_line.split(';')
-
-
-
-                # if multiple treatment lines are present, save twice under different names
-                for cell_line_code, cell_line_date in zip(extracted_cell_line_codes, extracted_cell_line_dates):
-                    
-                    # we had bugs when single patient had multiple cell lines
-                    # needed to correct this by running all the normalizations on a virgin table
-                    # for that patient
-                    cleaned_single_patient_treatment_data_unique_cell_line = cleaned_single_patient_treatment_data.copy()
-
-                    if len(cell_line_code)>0:
-                        cell_line_code = standardize_code(cell_line_code, 'GR')
-                    else:
-                        cell_line_code = 'XX' + f'{i:04d}'
-                        i += 1
-
-                    # add the cell line code and date
-                    cleaned_single_patient_treatment_data_unique_cell_line['cell_line_code'] = cell_line_code
-                    cleaned_single_patient_treatment_data_unique_cell_line['sister_cell_line_codes'] = ';'.join([element for element in extracted_cell_line_codes if element != cell_line_code])
-                    cleaned_single_patient_treatment_data_unique_cell_line['date_cell_line'] = cell_line_date
-                    cleaned_single_patient_treatment_data_unique_cell_line['record_id'] = record_id
-
-                    cleaned_single_patient_treatment_data_unique_cell_line = format_dates(cleaned_single_patient_treatment_data_unique_cell_line)
-
-                    if save_as_single_file:
-                        cleaned_patient_treatment_data = pd.concat([cleaned_patient_treatment_data, cleaned_single_patient_treatment_data_unique_cell_line])
-                    else:
-                        # create a file name
-                        if disease_type == 'CRC':
-                            filename = f'{output_dir}/TTR_C_PID_{cell_line_code}_SID_0001.csv'
-                        elif disease_type == 'PDAC':
-                            filename = f'{output_dir}/TTR_P_PID_{cell_line_code}_SID_0001.csv'
-                        cleaned_single_patient_treatment_data_unique_cell_line.to_csv(filename, sep=';')
-
-        #except:
-        #    print(f'Error for {record_id}')
+    conversion_plan = dataset.get_conversion_plan('treatment')
+
+    # cell line codes and rows of each record
+    cell_line_index = dataset.get_cell_line_index()
+
+    cell_lines = [cell_line_index.get_cell_line_code(record_id) for record_id in record_ids]
+    record_rows = [cell_line_index.get_rows(record_id, is_treatment_row) for record_id in record_ids]
+
+    # the records without treatment rows are skipped and use no placeholder
+    placeholder_counts = [count_placeholders(cell_line_code, date_cell_line) if len(rows) > 0 else 0
+                          for (cell_line_code, date_cell_line), rows in zip(cell_lines, record_rows)]
+    placeholder_indexes = get_placeholder_indexes(placeholder_counts, state.placeholder_index)
+    state.placeholder_index += sum(placeholder_counts)
+
+    # the records to convert, all of them unless e.g. an incremental run selects the changed ones
+    positions = [position for position, record_id in enumerate(record_ids)
+                 if select_record is None or select_record(record_id, placeholder_indexes[position])]
+
+    # a single shard when running serially
+    records_per_shard = RECORDS_PER_SHARD if executor is not None else max(len(positions), 1)
+
+    # clinical columns joined to the treatment rows, e.g. the date of death
+    clinical_enrichments = dataset.get_clinical_enrichments()
+
+    # the process pool sends the per patient tables back, as well as a serial
+    # run keeping the outputs by record
+    shard_writer = writer if executor is None and record_outputs is None else None
+
+    shard_arguments = [(redcap_treatment_data.iloc[np.concatenate([record_rows[position] for position in shard])],
+                        [record_ids[position] for position in shard],
+                        [cell_lines[position] for position in shard],
+                        [placeholder_indexes[position] for position in shard],
+                        conversion_plan,
+                        disease_type,
+                        shard_writer,
+                        save_as_single_file,
+                        transform_mode,
+                        get_modality_enrichments(clinical_enrichments, 'treatment', [record_ids[position] for position in shard]))
+                       for shard in get_shards(positions, records_per_shard)]
+
+    # outputs of the converted records
+    converted_outputs = {record_ids[position]: [] for position in positions}
+
+    for shard_results in run_shards(split_treatment_records, shard_arguments, executor):
+        for record_id, cleaned_single_patient_treatment_data_unique_cell_line, filename in shard_results:
+            if save_as_single_file:
+                converted_outputs[record_id].append(cleaned_single_patient_treatment_data_unique_cell_line)
+            else:
+                writer.write(cleaned_single_patient_treatment_data_unique_cell_line, filename, conversion_plan.get_column_kinds())
+                converted_outputs[record_id].append(filename)
+
+    if record_outputs is not None:
+        record_outputs.update(converted_outputs)
+    else:
+        record_outputs = converted_outputs
 
     if save_as_single_file:
 
-        # reorder the columns with record_id, cell_line_code and date_cell_line in front
-        all_columns = list(cleaned_patient_treatment_data.columns)
+        # recap dataframe, in the order of the records
+        cleaned_patient_treatment_data = ResultBuilder()
 
-        # Columns to be placed at the beginning
-        selected_columns = ['record_id', 'cell_line_code', 'date_cell_line']
+        for record_id in record_ids:
+            for cleaned_single_patient_treatment_data_unique_cell_line in record_outputs.get(record_id, []):
+                cleaned_patient_treatment_data.add(cleaned_single_patient_treatment_data_unique_cell_line)
 
-        # Filter out the selected columns from all_columns
-        other_columns = [col for col in all_columns if col not in selected_columns]
+        if len(cleaned_patient_treatment_data) == 0:
+            logger.warning('The cleaned_patient_treatment_data is empty.')
+            return None
 
-        # Concatenate selected columns with other columns
-        new_column_order = selected_columns + other_columns
+        # materialize the consolidated table, record_id, cell_line_code and date_cell_line in front
+        cleaned_patient_treatment_data = cleaned_patient_treatment_data.build()
 
-        # Reorder the DataFrame
-        cleaned_patient_treatment_data = cleaned_patient_treatment_data[new_column_order]
+        # rows numbered after the ones of the previous batches
+        cleaned_patient_treatment_data.index = pd.RangeIndex(state.rows_written, state.rows_written + len(cleaned_patient_treatment_data))
 
-        # go and get the date of death from clincial data frame
         if disease_type == 'CRC':
-            clinical_data = pd.read_csv(f'{output_dir}/CLI_C_PID_ALL.csv', sep=';')
+            filename = f'{output_dir}/TTR_C_PID_ALL'
         elif disease_type == 'PDAC':
-            clinical_data = pd.read_csv(f'{output_dir}/CLI_P_PID_ALL.csv', sep=';')
+            filename = f'{output_dir}/TTR_P_PID_ALL'
+
+        if output_format == 'csv':
+            # appended to in a streaming run, renamed once complete
+            with report.stage('writing'):
+                cleaned_patient_treatment_data.to_csv(state.get_partial_path(get_output_path(filename, 'csv')), sep=';', mode='a' if state.rows_written > 0 else 'w', header=state.rows_written == 0)
+        else:
+            # the columnar files can't be appended to
+            assert state.rows_written == 0
+            write_table_atomically(cleaned_patient_treatment_data, get_output_path(filename, output_format), output_format, conversion_plan.get_column_kinds())
+        state.rows_written += len(cleaned_patient_treatment_data)
+        if owns_state:
+            state.commit()
+    return None
 
-        # do something cleaner for data coming from multiple modalities
-        cleaned_patient_treatment_data = add_death_date(cleaned_patient_treatment_data, clinical_data)
+def split_treatment_records(redcap_treatment_data: pd.DataFrame,
+                            record_ids: list,
+                            cell_lines: list,
+                            placeholder_indexes: list,
+                            conversion_plan: ConversionPlan,
+                            disease_type: str,
+                            writer: PatientFileWriter,
+                            save_as_single_file: bool,
+                            transform_mode: str,
+                            enrichments: pd.DataFrame = None,
+                            ):
+    """
+    Split the treatment data of a shard of records by cell line.
 
-        if disease_type == 'CRC':
-            filename = f'{output_dir}/TTR_C_PID_ALL.csv'
-        elif disease_type == 'PDAC':
-            filename = f'{output_dir}/TTR_P_PID_ALL.csv'
+    The per cell line tables are written, or returned as (record_id, table,
+    filename) if save_as_single_file or there is no writer.
 
-        cleaned_patient_treatment_data.to_csv(filename, sep=';')
-    return None
+    Parameters
+    ----------
+    redcap_treatment_data: pd.DataFrame
+        treatment rows of the records of the shard
+    record_ids: list
+        record ids of the shard
+    cell_lines: list
+        (cell_line_code, date_cell_line) of each record of the shard
+    placeholder_indexes: list
+        number of the first XX placeholder code of each record of the shard
+    conversion_plan: ConversionPlan
+        compiled conversion table between redcap and orakloncology
+    writer: PatientFileWriter
+        writer of the per patient files
+    enrichments: pd.DataFrame
+        optional clinical columns of the records of the shard, indexed by
+        record_id, added to their tables
+    """
 
+    # record_id -> positions of its rows in the shard
+    patient_rows = redcap_treatment_data.groupby('record_id', sort=False).indices
+    record_rows = [patient_rows.get(record_id, np.array([], dtype=int)) for record_id in record_ids]
+
+    cleaned_patient_treatment_data = []
+    column_kinds = conversion_plan.get_column_kinds()
+
+    # get the treatment data of the patients, in the order of the rows of the shard
+    if transform_mode == 'vectorized':
+        with report.stage('treatment_transform'):
+            cleaned_treatment_data = get_treatment_data(redcap_treatment_data,
+                                                        conversion_plan,
+                                                        disease_type)
+    else:
+        with report.stage('treatment_transform'):
+            cleaned_treatment_data = [get_single_patient_treatment_data(redcap_treatment_data.iloc[rows],
+                                                                        conversion_plan,
+                                                                        disease_type) for rows in record_rows if len(rows) > 0]
+            cleaned_treatment_data = pd.concat(cleaned_treatment_data) if len(cleaned_treatment_data) > 0 else pd.DataFrame(columns=conversion_plan.columns)
+
+    # dates formatted once for all the cell lines of the records
+    cleaned_treatment_data = format_dates(cleaned_treatment_data)
+
+    # one table per cell line, the records with several cell lines repeated
+    cleaned_treatment_data, cell_line_table = fan_out_cell_lines(cleaned_treatment_data,
+                                                                 record_ids,
+                                                                 record_rows,
+                                                                 cell_lines,
+                                                                 placeholder_indexes)
+    cleaned_treatment_data = add_enrichments(cleaned_treatment_data, enrichments)
+    report.count('treatment_rows_out', len(cleaned_treatment_data))
+
+    record_cell_lines = cell_line_table.groupby('position', sort=False).indices
 
-def add_death_date(treatment_data, clinical_data):
-    
-    # get the death date
-    death_date = clinical_data[['record_id', 'date_death']]
+    # loop through all the record ids
+    for position, record_id in enumerate(record_ids):
 
-    # merge the data
-    treatment_data = pd.merge(treatment_data, death_date, on='record_id', how='left')
+        record_cell_line_table = cell_line_table.iloc[record_cell_lines.get(position, [])]
 
+        if save_as_single_file and len(record_cell_line_table) > 0:
+            # all the cell lines of the record
+            cleaned_patient_treatment_data.append((record_id, cleaned_treatment_data.iloc[record_cell_line_table['start'].iloc[0]:record_cell_line_table['stop'].iloc[-1]], None))
 
+        elif not save_as_single_file:
+            for cell_line_code, start, stop in zip(record_cell_line_table['cell_line_code'], record_cell_line_table['start'], record_cell_line_table['stop']):
 
-    return treatment_data
\ No newline at end of file
+                # create a file name
+                if disease_type == 'CRC':
+                    filename = f'TTR_C_PID_{cell_line_code}_SID_0001'
+                elif disease_type == 'PDAC':
+                    filename = f'TTR_P_PID_{cell_line_code}_SID_0001'
+                if writer is not None:
+                    writer.write(cleaned_treatment_data.iloc[start:stop], filename, column_kinds)
+                else:
+                    cleaned_patient_treatment_data.append((record_id, cleaned_treatment_data.iloc[start:stop], filename))
+
+        # the size of the record rather than its time, the shard being converted at once
+        report.add_record('treatment', record_id, len(record_rows[position]), len(record_cell_line_table),
+                          int((record_cell_line_table['stop'] - record_cell_line_table['start']).sum()))
+
+    return cleaned_patient_treatment_data
@@ -0,0 +1,269 @@
+import os
+
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+
+from redcap_preprocessing import report
+from redcap_preprocessing import split_clinical_data_from_redcap
+from redcap_preprocessing import split_treatment_data_from_redcap
+from redcap_preprocessing import split_molecular_data_from_redcap
+from redcap_preprocessing.columns import check_redcap_columns, compact_redcap, get_compact_dtypes, get_redcap_columns
+from redcap_preprocessing.conversion_tables import load_conversion_table
+from redcap_preprocessing.dataset import RedcapDataset, get_redcap_encoding
+from redcap_preprocessing.parallel import get_process_pool
+from redcap_preprocessing.split_state import SplitState
+from redcap_preprocessing.utils import get_delimiter
+from redcap_preprocessing.writer import open_writer
+
+# number of rows of the export read at once
+DEFAULT_CHUNKSIZE = 10000
+
+def merge_dtypes(dtypes: set):
+    """
+    Type of a column holding values of all the given types, as pandas infers
+    it: float64 for numbers, object otherwise.
+    """
+
+    if len(dtypes) == 1:
+        return next(iter(dtypes))
+
+    if all(is_numeric_dtype(dtype) and not is_bool_dtype(dtype) for dtype in dtypes):
+        return 'float64'
+
+    return 'object'
+
+def widen_dtypes(chunk: pd.DataFrame,
+                 redcap_dtypes: dict):
+    """
+    Widen the column types of the previous chunks to hold the values of a
+    chunk, e.g. an integer column with missing values.
+
+    Parameters
+    ----------
+    chunk: pd.DataFrame
+        chunk of the export, its types inferred by the parser
+    redcap_dtypes: dict
+        column -> type of the previous chunks, updated in place
+    """
+
+    for column, dtype in chunk.dtypes.items():
+        redcap_dtypes[column] = merge_dtypes({redcap_dtypes.get(column, dtype), dtype})
+
+def to_text(values: pd.Series):
+    """
+    Numbers or booleans as text, the missing values being kept.
+
+    The text may differ from the one in the export, e.g. '54.0' for a 54
+    read in a column of floats by an earlier chunk.
+    """
+
+    return values.map(str, na_action='ignore').astype(object)
+
+def cast_chunk(chunk: pd.DataFrame,
+               redcap_dtypes: dict):
+    """
+    Cast the columns of a chunk to the types of the export so far, see
+    widen_dtypes.
+
+    Parameters
+    ----------
+    chunk: pd.DataFrame
+        chunk of the export
+    redcap_dtypes: dict
+        column -> type
+    """
+
+    casts = {column: redcap_dtypes[column] for column, dtype in chunk.dtypes.items() if redcap_dtypes[column] != dtype}
+
+    if len(casts) == 0:
+        return chunk
+
+    chunk = chunk.copy()
+
+    for column, redcap_dtype in casts.items():
+        # a column of text read as numbers by an earlier chunk
+        if redcap_dtype == 'object':
+            chunk[column] = to_text(chunk[column])
+        else:
+            chunk[column] = chunk[column].astype(redcap_dtype)
+
+    return chunk
+
+def read_redcap_batches(redcap_path: str,
+                        chunksize: int = DEFAULT_CHUNKSIZE,
+                        cache_dir: str = None,
+                        columns: list = None):
+    """
+    Read the redcap export in chunks, and yield batches of complete records.
+
+    The rows of the last record of a chunk are kept until the next chunk, so
+    the memory used is bounded by the chunk size and the largest record.
+    The export has to be grouped by record_id, as REDCap exports are.
+
+    The export is parsed once: the column types are the ones of the first
+    chunk, widened by the next ones, see widen_dtypes. The batches already
+    yielded keep their types, e.g. a column of numbers becoming text.
+
+    Parameters
+    ----------
+    redcap_path: str
+        path to redcap data set
+    chunksize: int
+        number of rows read at once
+    cache_dir: str
+        optional directory where the detected encodings are cached
+    columns: list
+        optional columns to read, checked against the header before the
+        export is parsed
+    """
+
+    redcap_delimiter = get_delimiter(redcap_path)
+    file_encoding = get_redcap_encoding(redcap_path, cache_dir)
+
+    usecols = None
+    if columns is not None:
+        header = pd.read_csv(redcap_path, delimiter=redcap_delimiter, encoding=file_encoding, nrows=0)
+        check_redcap_columns(header.columns, columns)
+        columns = set(columns)
+        usecols = lambda column: column in columns
+
+    # the types of the first chunk, widened by the next ones, see widen_dtypes
+    redcap_dtypes = {}
+
+    completed_record_ids = set()
+    pending_rows = None
+    is_empty = True
+
+    chunks = pd.read_csv(redcap_path, delimiter=redcap_delimiter, encoding=file_encoding,
+                         chunksize=chunksize, usecols=usecols)
+
+    for chunk in report.timed_iteration(chunks, 'parsing'):
+
+        widen_dtypes(chunk, redcap_dtypes)
+        chunk = cast_chunk(chunk, redcap_dtypes)
+
+        if pending_rows is not None:
+            chunk = pd.concat([cast_chunk(pending_rows, redcap_dtypes), chunk])
+
+        # the last record may continue in the next chunk
+        last_record_id = chunk['record_id'].iloc[-1]
+        if last_record_id != last_record_id:
+            is_last_record = chunk['record_id'].isna()
+        else:
+            is_last_record = chunk['record_id'] == last_record_id
+
+        batch = chunk[~is_last_record]
+        pending_rows = chunk[is_last_record]
+
+        if len(batch) > 0:
+            check_record_ids(batch, completed_record_ids)
+            is_empty = False
+            yield batch
+
+    if pending_rows is not None and len(pending_rows) > 0:
+        check_record_ids(pending_rows, completed_record_ids)
+        is_empty = False
+        yield pending_rows
+
+    # check that the table isn't empty
+    if is_empty:
+        raise ValueError('The redcap table is empty.')
+
+def check_record_ids(batch: pd.DataFrame,
+                     completed_record_ids: set):
+
+    record_ids = set(batch['record_id'].dropna().unique())
+
+    if not completed_record_ids.isdisjoint(record_ids):
+        raise ValueError('The redcap export is not grouped by record_id, it can not be streamed.')
+
+    completed_record_ids.update(record_ids)
+
+def preprocess_redcap_batches(redcap_filepath: str,
+                              conversion_table_filepath: str,
+                              output_dir: str,
+                              disease_type: str,
+                              save_as_single_file: bool = False,
+                              transform_mode: str = 'vectorized',
+                              chunksize: int = DEFAULT_CHUNKSIZE,
+                              workers: int = 1,
+                              archive_path: str = None,
+                              output_format: str = 'csv'):
+    """
+    Run the clinical, treatment and molecular splitters on the export batch
+    by batch, writing the outputs as they are produced.
+
+    The outputs are the same as processing the whole export at once when the
+    export is sorted by record_id, otherwise the clinical records are taken
+    in sorted order within each batch.
+
+    Parameters
+    ----------
+    redcap_filepath: str
+        path to redcap data set
+    conversion_table_filepath: str
+        path to redcap conversion table
+    output_dir: str
+        output directory
+    disease_type: str
+        'CRC' or 'PDAC'
+    chunksize: int
+        number of rows read at once
+    workers: int
+        number of processes the records of each batch are sharded across
+    archive_path: str
+        optional archive holding the per patient files
+    output_format: str
+        'csv', 'parquet' or 'arrow'
+    """
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    with report.stage('conversion_table_load'):
+        compiled_table = load_conversion_table(conversion_table_filepath)
+    redcap_conversion_table = compiled_table.redcap_conversion_table
+
+    # only the columns used by the splitters are read
+    redcap_columns = get_redcap_columns(redcap_conversion_table, disease_type)
+    compact_dtypes = get_compact_dtypes(redcap_conversion_table)
+
+    # compiled once for all the batches
+    conversion_plans = dict(compiled_table.conversion_plans)
+
+    clinical_state = SplitState()
+    treatment_state = SplitState()
+    molecular_state = SplitState()
+
+    executor = get_process_pool(workers) if workers > 1 else None
+
+    try:
+        with open_writer(output_dir, save_as_single_file, archive_path, output_format) as writer:
+
+            for batch in read_redcap_batches(redcap_filepath, chunksize, columns=redcap_columns):
+
+                report.count('records', batch['record_id'].nunique())
+                report.count('rows_in', len(batch))
+
+                dataset = RedcapDataset(compact_redcap(batch, compact_dtypes), redcap_conversion_table, disease_type,
+                                        conversion_plans=conversion_plans)
+
+                split_clinical_data_from_redcap.split_clinical_data(dataset, output_dir, save_as_single_file,
+                                                                    transform_mode, executor, clinical_state, writer, output_format)
+
+                split_treatment_data_from_redcap.split_treatment_data(dataset, output_dir, save_as_single_file,
+                                                                      transform_mode, executor, treatment_state, writer, output_format)
+
+                split_molecular_data_from_redcap.split_molecular_data(dataset, output_dir, save_as_single_file,
+                                                                      transform_mode, executor, molecular_state, writer, output_format)
+
+        # the consolidated tables are complete
+        for state in [clinical_state, treatment_state, molecular_state]:
+            state.commit()
+    finally:
+        for state in [clinical_state, treatment_state, molecular_state]:
+            state.discard()
+        if executor is not None:
+            executor.shutdown()
+
+    return None
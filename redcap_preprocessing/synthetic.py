@@ -0,0 +1,356 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from redcap_preprocessing.cell_line_index import CELL_LINE_COLUMNS, ORGANOID_INSTRUMENTS
+from redcap_preprocessing.columns import CHEMOTHERAPY_TYPE_DETAIL_COLUMNS, SPECIAL_COLUMNS
+from redcap_preprocessing.conversion_tables import get_conversion_table_path, load_conversion_table
+
+# the base row of a record has no repeat instrument
+BASE_INSTRUMENT = ''
+
+METASTATIC_INSTRUMENT = 'ligne_mtastatique_de_traitement'
+HAI_INSTRUMENT = 'hai_chemotherapy'
+MOLECULAR_INSTRUMENT = 'molecular_profile'
+PATHOLOGY_INSTRUMENT = 'pathology'
+
+# repeat instruments of a record: instrument -> probabilities of 0, 1, 2... instances
+INSTRUMENT_INSTANCES = {METASTATIC_INSTRUMENT: [0.2, 0.3, 0.25, 0.15, 0.1],
+                        HAI_INSTRUMENT: [0.7, 0.3],
+                        MOLECULAR_INSTRUMENT: [0.3, 0.5, 0.2],
+                        PATHOLOGY_INSTRUMENT: [0.4, 0.4, 0.2]}
+
+ORGANOID_INSTANCES = [0.2, 0.6, 0.2]
+
+# rows holding the fields of a data type, when the prototype doesn't tell
+DATA_TYPE_INSTRUMENTS = {'clinical-profile': [BASE_INSTRUMENT],
+                         'treatment': [METASTATIC_INSTRUMENT, HAI_INSTRUMENT],
+                         'molecular_profile': {'CRC': [MOLECULAR_INSTRUMENT],
+                                               'PDAC': [BASE_INSTRUMENT]}}
+
+# share of the empty fields of a row holding them
+MISSING_RATE = 0.3
+
+# share of the PDAC records without cell line names
+MISSING_CELL_LINE_RATE = 0.15
+
+FREE_TEXT = ['FOLFOX', 'FOLFIRI', 'Bevacizumab', 'Autre protocole', 'Essai clinique é', 'Non renseigné']
+
+DATE_PATTERNS = {'%d/%m/%Y': re.compile(r'^\d{2}/\d{2}/\d{4}$'),
+                 '%Y-%m-%d': re.compile(r'^\d{4}-\d{2}-\d{2}$')}
+
+class SyntheticSchema:
+    """
+    Columns of a synthetic REDCap export, with the rows and the values of
+    each of them.
+
+    The columns and the values are taken from the prototype export when it
+    has them, otherwise from the conversion table: the options of the type 3
+    rules, 0 and 1 for the type 2 checkboxes, dates for the date fields and
+    free text or numbers for the others.
+
+    Parameters
+    ----------
+    disease_type: str
+        'CRC' or 'PDAC'
+    prototype_path: str
+        path to a real export, e.g. data/prototype_redcap.csv in the
+        repository, None to only use the conversion table
+    conversion_table_path: str
+        optional path to the conversion table
+    """
+
+    def __init__(self,
+                 disease_type: str,
+                 prototype_path: str,
+                 conversion_table_path: str = None):
+
+        assert disease_type in ['CRC', 'PDAC']
+
+        if conversion_table_path is None:
+            conversion_table_path = get_conversion_table_path(disease_type)
+
+        self.disease_type = disease_type
+        self.organoid_instrument = ORGANOID_INSTRUMENTS[disease_type]
+        self.cell_line_columns = CELL_LINE_COLUMNS[disease_type]
+
+        redcap_conversion_table = load_conversion_table(conversion_table_path).redcap_conversion_table
+
+        prototype = None
+        if prototype_path is not None:
+            prototype = pd.read_csv(prototype_path, sep=None, engine='python', encoding='utf-8-sig')
+            # an export of the other disease type
+            if self.organoid_instrument not in set(prototype['redcap_repeat_instrument']):
+                prototype = None
+
+        # all the columns of the prototype export are kept, even if unused
+        self.columns = SPECIAL_COLUMNS + ['redcap_repeat_instance']
+        if prototype is not None:
+            self.columns += list(prototype.columns)
+        self.columns += list(redcap_conversion_table['redcap_name']) + CHEMOTHERAPY_TYPE_DETAIL_COLUMNS[disease_type] + self.cell_line_columns
+        self.columns = list(dict.fromkeys(self.columns))
+
+        # redcap_name -> rules of the conversion table
+        rules = {redcap_name: rows for redcap_name, rows in redcap_conversion_table.groupby('redcap_name')}
+
+        # column -> instruments of the rows holding it, and its values
+        self.instruments = {}
+        self.values = {}
+
+        for column in self.columns:
+
+            if column in SPECIAL_COLUMNS + ['redcap_repeat_instance'] + self.cell_line_columns:
+                continue
+
+            column_rules = rules.get(column)
+            prototype_values = prototype[column].dropna() if prototype is not None and column in prototype.columns else None
+
+            self.instruments[column] = self.get_instruments(column, column_rules, prototype, prototype_values)
+            self.values[column] = self.get_values(column, column_rules, prototype_values)
+
+    def get_instruments(self, column, column_rules, prototype, prototype_values):
+
+        if column in CHEMOTHERAPY_TYPE_DETAIL_COLUMNS[self.disease_type]:
+            return [METASTATIC_INSTRUMENT]
+
+        # the prototype shows the rows holding the column
+        if prototype_values is not None and len(prototype_values) > 0:
+            instruments = prototype.loc[prototype_values.index, 'redcap_repeat_instrument'].fillna(BASE_INSTRUMENT)
+            return sorted(set(instruments))
+
+        if column_rules is None:
+            return [BASE_INSTRUMENT]
+
+        data_type = column_rules['data_type'].iloc[0]
+        instruments = DATA_TYPE_INSTRUMENTS[data_type]
+
+        if isinstance(instruments, dict):
+            instruments = instruments[self.disease_type]
+
+        return instruments
+
+    def get_values(self, column, column_rules, prototype_values):
+
+        matching_types = set() if column_rules is None else set(column_rules['matching_type'])
+
+        # the PDAC table has a checkbox rule on a date field
+        if matching_types == {2} and 'date' not in column.lower():
+            return [0, 1]
+
+        if matching_types == {3}:
+            return list(column_rules['redcap_options'].dropna().unique())
+
+        date_format = None
+        if prototype_values is not None and len(prototype_values) > 0:
+            date_format = get_date_format(prototype_values)
+            if date_format is None:
+                return list(prototype_values.unique())
+
+        if date_format is not None or 'date' in column.lower() or (column_rules is not None and column_rules['orakloncology_name'].str.contains('date').any()):
+            return DateValues(date_format or '%d/%m/%Y')
+
+        if 4 in matching_types or column in CHEMOTHERAPY_TYPE_DETAIL_COLUMNS[self.disease_type]:
+            return FREE_TEXT
+
+        return list(range(0, 100))
+
+class DateValues:
+    """
+    Random dates between 1950 and 2024, in a given format.
+    """
+
+    def __init__(self, date_format: str):
+
+        self.date_format = date_format
+
+    def sample(self, rng: np.random.Generator, size: int):
+
+        days = rng.integers(0, (pd.Timestamp('2024-12-31') - pd.Timestamp('1950-01-01')).days, size)
+        dates = pd.Timestamp('1950-01-01') + pd.to_timedelta(days, unit='D')
+
+        return dates.strftime(self.date_format).to_numpy(dtype=object)
+
+def get_date_format(values: pd.Series):
+
+    values = values.astype(str)
+
+    for date_format, pattern in DATE_PATTERNS.items():
+        if values.str.match(pattern).all():
+            return date_format
+
+    return None
+
+def sample_instances(rng: np.random.Generator,
+                     probabilities: list,
+                     size: int):
+
+    return rng.choice(len(probabilities), size=size, p=probabilities)
+
+def generate_redcap_export(disease_type: str,
+                           n_records: int,
+                           prototype_path: str,
+                           seed: int = 0,
+                           first_record_id: int = 1,
+                           schema: SyntheticSchema = None):
+    """
+    Generate a synthetic REDCap export, grouped by record_id as the real
+    ones.
+
+    Every record has a base row, and repeat rows for its metastatic lines,
+    HAI chemotherapies, molecular profiles, pathologies and organoids. The
+    organoid rows hold the cell line names, numbered across the records.
+
+    Parameters
+    ----------
+    disease_type: str
+        'CRC' or 'PDAC'
+    n_records: int
+        number of records
+    prototype_path: str
+        path to a real export, None to only use the conversion table, see
+        SyntheticSchema
+    seed: int
+        seed of the random generator
+    first_record_id: int
+        record_id of the first record, to generate an export in blocks
+    schema: SyntheticSchema
+        optional schema, built from the conversion table and the prototype
+        export otherwise, prototype_path being then ignored
+    """
+
+    if schema is None:
+        schema = SyntheticSchema(disease_type, prototype_path)
+
+    rng = np.random.default_rng([seed, first_record_id])
+
+    # instruments of the rows of each record, in the order of a REDCap export
+    instance_counts = {instrument: sample_instances(rng, probabilities, n_records)
+                       for instrument, probabilities in INSTRUMENT_INSTANCES.items()}
+    instance_counts[schema.organoid_instrument] = sample_instances(rng, ORGANOID_INSTANCES, n_records)
+
+    record_ids = np.arange(first_record_id, first_record_id + n_records)
+
+    row_record_ids = [record_ids]
+    row_instruments = [np.full(n_records, BASE_INSTRUMENT, dtype=object)]
+    row_instances = [np.full(n_records, np.nan)]
+    row_ranks = [np.zeros(n_records, dtype=int)]
+
+    for rank, (instrument, counts) in enumerate(instance_counts.items(), start=1):
+        for instance in range(1, counts.max() + 1 if n_records > 0 else 1):
+            has_instance = counts >= instance
+            row_record_ids.append(record_ids[has_instance])
+            row_instruments.append(np.full(has_instance.sum(), instrument, dtype=object))
+            row_instances.append(np.full(has_instance.sum(), float(instance)))
+            row_ranks.append(np.full(has_instance.sum(), rank))
+
+    row_record_ids = np.concatenate(row_record_ids)
+    row_instruments = np.concatenate(row_instruments)
+    row_instances = np.concatenate(row_instances)
+    row_ranks = np.concatenate(row_ranks)
+
+    # the rows of a record are contiguous, the base row first and the
+    # instances of each instrument in order
+    order = np.lexsort((row_instances, row_ranks, row_record_ids))
+    row_record_ids = row_record_ids[order]
+    row_instruments = row_instruments[order]
+    row_instances = row_instances[order]
+
+    n_rows = len(row_record_ids)
+
+    columns = {'record_id': row_record_ids,
+               'redcap_repeat_instrument': np.where(row_instruments == BASE_INSTRUMENT, np.nan, row_instruments),
+               'redcap_repeat_instance': row_instances}
+
+    for column in schema.columns:
+
+        if column in columns or column not in schema.values:
+            continue
+
+        values = np.full(n_rows, np.nan, dtype=object)
+
+        is_held = np.isin(row_instruments, schema.instruments[column])
+        pool = schema.values[column]
+
+        # the checkboxes are always filled on the rows of their instrument
+        if pool != [0, 1]:
+            is_held &= rng.random(n_rows) >= MISSING_RATE
+
+        if isinstance(pool, DateValues):
+            values[is_held] = pool.sample(rng, is_held.sum())
+        elif len(pool) > 0:
+            values[is_held] = np.array(pool, dtype=object)[rng.integers(0, len(pool), is_held.sum())]
+
+        columns[column] = values
+
+    # cell line names, numbered across the records
+    cell_line_column, date_cell_line_column = schema.cell_line_columns
+    is_organoid = row_instruments == schema.organoid_instrument
+    prefix = 'CGR' if disease_type == 'CRC' else 'PGR'
+
+    cell_line_numbers = np.arange(first_record_id * 2, first_record_id * 2 + is_organoid.sum())
+    cell_line_names = np.array([f'{prefix}{number:04d}' for number in cell_line_numbers], dtype=object)
+
+    # all the organoids of a record are named, or none
+    if disease_type == 'PDAC':
+        is_unnamed = rng.random(n_records) < MISSING_CELL_LINE_RATE
+        cell_line_names[is_unnamed[row_record_ids[is_organoid] - first_record_id]] = np.nan
+
+    columns[cell_line_column] = np.full(n_rows, np.nan, dtype=object)
+    columns[cell_line_column][is_organoid] = cell_line_names
+    columns[date_cell_line_column] = np.full(n_rows, np.nan, dtype=object)
+    columns[date_cell_line_column][is_organoid] = DateValues('%d/%m/%Y').sample(rng, is_organoid.sum())
+
+    return pd.DataFrame({column: columns[column] for column in schema.columns if column in columns})
+
+def write_redcap_export(path: str,
+                        disease_type: str,
+                        n_records: int,
+                        prototype_path: str,
+                        seed: int = 0,
+                        records_per_block: int = 5000,
+                        schema: SyntheticSchema = None):
+    """
+    Write a synthetic REDCap export as a ';' separated csv with a BOM, as
+    the prototype export, generating it in blocks of records.
+
+    Parameters
+    ----------
+    path: str
+        path of the export
+    disease_type: str
+        'CRC' or 'PDAC'
+    n_records: int
+        number of records
+    prototype_path: str
+        path to a real export, None to only use the conversion table, see
+        SyntheticSchema
+    seed: int
+        seed of the random generator
+    records_per_block: int
+        number of records generated at once
+    schema: SyntheticSchema
+        optional schema, built from the conversion table and the prototype
+        export otherwise, prototype_path being then ignored
+    """
+
+    if schema is None:
+        schema = SyntheticSchema(disease_type, prototype_path)
+
+    n_rows = 0
+
+    with open(path, 'w', encoding='utf-8-sig', newline='') as file:
+
+        for first_record in range(0, max(n_records, 1), records_per_block):
+
+            block = generate_redcap_export(disease_type,
+                                           min(records_per_block, n_records - first_record),
+                                           prototype_path,
+                                           seed,
+                                           first_record + 1,
+                                           schema)
+
+            block.to_csv(file, sep=';', index=False, header=first_record == 0)
+            n_rows += len(block)
+
+    return n_rows
@@ -0,0 +1,184 @@
+import numpy as np
+import pandas as pd
+
+from redcap_preprocessing.utils import add_content
+
+# 'vectorized' evaluates each rule on whole columns, 'reference' keeps the
+# original row by row implementation of the splitters
+TRANSFORM_MODES = ('vectorized', 'reference')
+
+def get_row_values(data: pd.DataFrame):
+    """
+    Cast the data the way iterrows does, so that the vectorized path sees the
+    same python values as the row by row path.
+
+    Parameters
+    ----------
+    data: pd.DataFrame
+        redcap data set
+    """
+
+    # iterrows upcasts the rows of an all-numeric table to a common dtype
+    if len(data.columns) > 0 and not (data.dtypes == object).any():
+        data = data.astype(data.values.dtype)
+
+    return data
+
+def get_column_values(data: pd.DataFrame,
+                      redcap_name: str):
+
+    return data[redcap_name].to_numpy(dtype=object, copy=True)
+
+def join_content(content, has_content, mask, text):
+    """
+    Append text to the content of the masked rows, with the semantics of
+    ';'.join over the list of matched options.
+
+    Parameters
+    ----------
+    content: np.ndarray
+        joined content so far, modified in place
+    has_content: np.ndarray
+        rows that already received an element, modified in place
+    mask: np.ndarray
+        rows for which text should be appended
+    text: str or np.ndarray
+        option appended to all masked rows, or one element per row
+    """
+
+    if not mask.any():
+        return
+
+    append = mask & has_content
+    first = mask & ~has_content
+
+    if isinstance(text, np.ndarray):
+        content[append] = content[append] + ';' + text[append]
+        content[first] = text[first]
+    else:
+        # same error as ';'.join would raise
+        if not isinstance(text, str):
+            raise TypeError(f'sequence item: expected str instance, {type(text).__name__} found')
+        content[append] = content[append] + (';' + text)
+        content[first] = text
+
+    has_content |= mask
+
+def get_content_values(data: pd.DataFrame,
+                       conversion_plan,
+                       column_name: str,
+                       matching_type: int):
+    """
+    Evaluate the rules of one matching type for all the rows at once.
+
+    Parameters
+    ----------
+    data: pd.DataFrame
+        redcap data set
+    conversion_plan: ConversionPlan
+        compiled conversion table between redcap and orakloncology
+    column_name: str
+        orakloncology column name
+    matching_type: int
+        matching type of the rules to apply
+    """
+
+    rules = conversion_plan.get_rules(column_name, matching_type)
+
+    # type 1 is a plain column copy
+    if matching_type == 1:
+        return get_column_values(data, rules[0].redcap_name)
+
+    content = np.full(len(data), '', dtype=object)
+    has_content = np.zeros(len(data), dtype=bool)
+
+    for rule in rules:
+
+        values = get_column_values(data, rule.redcap_name)
+
+        # checkbox columns
+        if matching_type == 2:
+            join_content(content, has_content, values == 1, rule.orakloncology_option)
+
+        # single choice columns
+        elif matching_type == 3:
+            join_content(content, has_content, values == rule.redcap_option, rule.orakloncology_option)
+
+        # free text, keep all non nan values
+        elif matching_type == 4:
+            mask = values == values
+            text = np.full(len(data), '', dtype=object)
+            text[mask] = values[mask].astype(str).astype(object)
+            join_content(content, has_content, mask, text)
+
+    return content
+
+def add_content_values(content, prior_content):
+    """
+    Vectorized version of utils.add_content.
+
+    Parameters
+    ----------
+    content: np.ndarray
+        new content of the column
+    prior_content: np.ndarray
+        content of the column so far
+    """
+
+    prior_is_empty = (prior_content == '') | (prior_content != prior_content)
+    content_is_empty = (content == '') | (content != content)
+
+    combined_content = np.where(prior_is_empty, content, prior_content)
+
+    # only a few cells receive content from several rules, use the scalar
+    # implementation there to keep its exact behaviour
+    both = ~prior_is_empty & ~content_is_empty
+    if both.any():
+        combined_content[both] = [add_content(new, prior) for new, prior in zip(content[both], prior_content[both])]
+
+    return combined_content
+
+def transform_data(data: pd.DataFrame,
+                   conversion_plan,
+                   combine_contents: bool = True,
+                   adjust_content = None):
+    """
+    Convert redcap rows to orakloncology columns, one column at a time.
+
+    Parameters
+    ----------
+    data: pd.DataFrame
+        redcap data set
+    conversion_plan: ConversionPlan
+        compiled conversion table between redcap and orakloncology
+    combine_contents: bool
+        merge the contents of the successive matching types with add_content,
+        otherwise the last matching type wins
+    adjust_content: callable
+        optional function (data, column_name, content) -> content applied to
+        the content of each matching type before it is merged
+    """
+
+    data = get_row_values(data)
+
+    cleaned_data = {}
+
+    for column_name in conversion_plan.columns:
+
+        column_content = np.full(len(data), '', dtype=object)
+
+        for matching_type in conversion_plan.matching_types(column_name):
+
+            content = get_content_values(data, conversion_plan, column_name, matching_type)
+
+            if adjust_content is not None:
+                content = adjust_content(data, column_name, content)
+
+            if combine_contents:
+                column_content = add_content_values(content, column_content)
+            else:
+                column_content = content
+
+        cleaned_data[column_name] = column_content
+
+    return pd.DataFrame(cleaned_data, index=data.index, columns=conversion_plan.columns)
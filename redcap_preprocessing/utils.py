@@ -1,9 +1,11 @@
 
+import csv
+import logging
+
 import pandas as pd
 import numpy as np
-import csv
-from dateutil import parser
-from datetime import datetime
+
+logger = logging.getLogger(__name__)
 
 def standardize_code(code, prefix='GR'):
 
@@ -28,7 +30,7 @@ def get_cell_line_code(disease_type: str,
         prefix = 'PGR'
 
     if len(cell_line_code) == 0:
-        print(f'There are no PDO cell lines for record_id {record_id}.')
+        logger.debug('There are no PDO cell lines for record_id %s.', record_id)
         return '', ''
     else:
         # reformat cell line codes
@@ -51,7 +53,7 @@ def get_cell_line_code_CRC(redcap: pd.DataFrame,
                           (redcap['redcap_repeat_instrument'] == 'organoides')]
         
     if len(selected_row) == 0:
-        print(f'There are no PDO cell lines for record_id {record_id}.')
+        logger.debug('There are no PDO cell lines for record_id %s.', record_id)
         cell_line_code, date_cell_line = '', ''
     else:
         cell_line_code = ';'.join(selected_row['nom_lign_e'].unique())
@@ -75,10 +77,10 @@ def get_cell_line_code_PDAC(redcap: pd.DataFrame,
                           (redcap['redcap_repeat_instrument'] == 'organodes')]
         
     if len(selected_row) == 0:
-        print(f'There are no PDO cell lines for record_id {record_id}.')
+        logger.debug('There are no PDO cell lines for record_id %s.', record_id)
         cell_line_code, date_cell_line = '', ''
     elif selected_row['namepdo'].isna().all():
-        print(f'There are no PDO cell lines for record_id {record_id}.')
+        logger.debug('There are no PDO cell lines for record_id %s.', record_id)
         cell_line_code, date_cell_line = '', ''
     else:
         cell_line_code = ';'.join(selected_row['namepdo'].unique())
@@ -86,68 +88,6 @@ def get_cell_line_code_PDAC(redcap: pd.DataFrame,
 
     return cell_line_code, date_cell_line
 
-def get_content_matching_type_1(single_patient_clinical_row,
-                                redcap_CRC_conversion_table,
-                                column_name,
-                                ):
-    
-    assert column_name in redcap_CRC_conversion_table.orakloncology_name.values, 'column name not found in conversion table'
-    assert len(redcap_CRC_conversion_table[(redcap_CRC_conversion_table.orakloncology_name == column_name)&(redcap_CRC_conversion_table.matching_type == 1)]['redcap_name']) == 1, 'multiple redcap names found for column name in a type 1 match'
-
-    redcap_column_name = redcap_CRC_conversion_table[(redcap_CRC_conversion_table.orakloncology_name == column_name)&(redcap_CRC_conversion_table.matching_type == 1)]['redcap_name'].values[0]
-    content = single_patient_clinical_row[redcap_column_name]
-
-    return content
-
-def get_content_matching_type_2(single_patient_clinical_row,
-                                redcap_CRC_conversion_table,
-                                column_name,
-                                ):
-    
-    content = []
-    redcap_column_rows = redcap_CRC_conversion_table[(redcap_CRC_conversion_table.orakloncology_name == column_name)&(redcap_CRC_conversion_table.matching_type == 2)]
-
-    for index, row in redcap_column_rows.iterrows():
-
-        if single_patient_clinical_row[row['redcap_name']] == 1:
-            content.append(row['orakloncology_options'])
-
-    return ';'.join(content)
-
-def get_content_matching_type_3(single_patient_clinical_row,
-                                redcap_CRC_conversion_table,
-                                column_name,
-                                ):
-    
-    content = []
-    redcap_column_rows = redcap_CRC_conversion_table[(redcap_CRC_conversion_table.orakloncology_name == column_name)&(redcap_CRC_conversion_table.matching_type == 3)]
-
-    for index, row in redcap_column_rows.iterrows():
-
-        if row['redcap_options'] == single_patient_clinical_row[row['redcap_name']]:
-            content.append(row['orakloncology_options'])
-
-    return ';'.join(content)
-
-def get_content_matching_type_4(single_patient_clinical_row,
-                                redcap_CRC_conversion_table,
-                                column_name,
-                                ):
-    
-    content = []
-    redcap_column_rows = redcap_CRC_conversion_table[(redcap_CRC_conversion_table.orakloncology_name == column_name)&(redcap_CRC_conversion_table.matching_type == 4)]
-
-    for index, row in redcap_column_rows.iterrows():
-        
-        # test if not nan, then add to content
-        if single_patient_clinical_row[row['redcap_name']] == single_patient_clinical_row[row['redcap_name']]:
-            content.append(single_patient_clinical_row[row['redcap_name']])
-
-    # convert all list elements to string
-    content = [str(i) for i in content]
-    
-    return ';'.join(content)
-
 def add_content(content, prior_content):
 
     # test if empty str
@@ -174,58 +114,18 @@ def add_content(content, prior_content):
             return prior_content + ';' + content
         
         else:
-            print(content)
+            logger.warning('Could not add the content %r of type %s.', content, type(content).__name__)
 
 
 def get_delimiter(csv_path):
 
-    with open(csv_path, 'r') as file:
+    # the delimiter is found whatever the encoding of the accents
+    with open(csv_path, 'r', encoding='utf-8', errors='replace') as file:
         sample = file.read(1024)
 
     sniffer = csv.Sniffer()
 
     return sniffer.sniff(sample).delimiter
 
-def normalize_date(date_str):
-
-    if date_str != date_str:
-        return ''
-    elif date_str == 'nan':
-        return ''
-    elif date_str == 'NaT':
-        return ''
-    elif date_str == '0000-00-00':
-        return ''
-    elif date_str == '':
-        return ''
-    elif date_str == 'None':
-        return ''
-    elif date_str == None:
-        return ''
-    
-    date_str = date_str.split(';')[0]
-    date_str = date_str.replace(';', '').replace(' ', '')
-    
-    try:
-        # Try to parse the date from YYYY-MM-DD format
-        date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-    except ValueError:
-        # Fallback: Try to parse the date from DD/MM/YYYY if the initial format fails
-        date_obj = datetime.strptime(date_str, '%d/%m/%Y')
-
-    # Convert the date object to DD/MM/YYYY format
-    new_date_str = date_obj.strftime('%d/%m/%Y')
-    
-    return new_date_str
-
-def format_dates(df):
-
-    for column in df.columns:
-
-        if 'date' in column.lower():
-
-            print(f'Formatting dates in column {column}')
-            print(df[column])
-            df[column] = df[column].apply(normalize_date)
-
-    return df
\ No newline at end of file
+# kept here for the scripts importing them from utils
+from redcap_preprocessing.dates import normalize_date, format_dates
@@ -0,0 +1,139 @@
+import os
+import re
+import time
+import uuid
+import shutil
+import logging
+
+from redcap_preprocessing.jobs import load_job_status
+
+logger = logging.getLogger(__name__)
+
+# workspaces untouched for longer are removed, in seconds
+DEFAULT_WORKSPACE_TTL = 24 * 3600
+
+# directory of the outputs in a workspace
+OUTPUT_DIRNAME = 'preprocessed_redcap_data'
+
+# status of the job of a workspace, readable from any process
+JOB_STATUS_FILENAME = 'job.json'
+
+# the workspace ids are uuid4 hex strings, nothing else is a workspace
+WORKSPACE_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+# the workspace of a queued or running job is kept, unless untouched for this
+# many ttls, e.g. when the app process running it was killed
+ACTIVE_WORKSPACE_TTLS = 7
+
+class WorkspaceStore:
+    """
+    Isolated directories of the jobs of the web app, one per upload, so that
+    concurrent jobs, possibly of several app processes sharing root_dir, don't
+    overwrite each other.
+
+    A workspace holds the upload, the outputs in OUTPUT_DIRNAME and the job
+    status. It is removed by cleanup once untouched for longer than ttl and
+    its job is done or failed.
+
+    Parameters
+    ----------
+    root_dir: str
+        directory of the workspaces
+    ttl: float
+        lifetime of an untouched workspace, in seconds
+    """
+
+    def __init__(self,
+                 root_dir: str,
+                 ttl: float = DEFAULT_WORKSPACE_TTL):
+
+        self.root_dir = root_dir
+        self.ttl = ttl
+
+    def create(self):
+        """
+        Create a workspace, and return its id.
+        """
+
+        workspace_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.root_dir, workspace_id, OUTPUT_DIRNAME))
+
+        return workspace_id
+
+    def get_path(self, workspace_id: str, *parts):
+        """
+        Path in a workspace, None if the id is not a workspace id or the
+        workspace doesn't exist.
+
+        Parameters
+        ----------
+        workspace_id: str
+            id returned by create, usually from a url
+        parts: str
+            path relative to the workspace
+        """
+
+        if not WORKSPACE_ID_PATTERN.match(workspace_id):
+            return None
+
+        workspace_dir = os.path.join(self.root_dir, workspace_id)
+        if not os.path.isdir(workspace_dir):
+            return None
+
+        return os.path.join(workspace_dir, *parts)
+
+    def get_output_dir(self, workspace_id: str):
+
+        return self.get_path(workspace_id, OUTPUT_DIRNAME)
+
+    def cleanup(self, now: float = None):
+        """
+        Remove the workspaces untouched for longer than the ttl, and return
+        their ids. The workspaces of the queued and running jobs are kept,
+        see ACTIVE_WORKSPACE_TTLS.
+
+        The modification time of a workspace is updated when a file is added
+        to it, e.g. when the status of its job changes.
+
+        Parameters
+        ----------
+        now: float
+            current time, as returned by time.time
+        """
+
+        if now is None:
+            now = time.time()
+
+        if not os.path.isdir(self.root_dir):
+            return []
+
+        removed_ids = []
+
+        for workspace_id in os.listdir(self.root_dir):
+
+            if not WORKSPACE_ID_PATTERN.match(workspace_id):
+                continue
+
+            workspace_dir = os.path.join(self.root_dir, workspace_id)
+
+            try:
+                age = now - os.stat(workspace_dir).st_mtime
+            except FileNotFoundError:
+                # removed by another process
+                continue
+
+            if age <= self.ttl:
+                continue
+
+            # a long job doesn't change its status while it runs
+            job_status = load_job_status(os.path.join(workspace_dir, JOB_STATUS_FILENAME))
+            if job_status is not None and job_status.get('status') in ['queued', 'running'] and age <= ACTIVE_WORKSPACE_TTLS * self.ttl:
+                continue
+
+            shutil.rmtree(workspace_dir, ignore_errors=True)
+            removed_ids.append(workspace_id)
+
+        if len(removed_ids) > 0:
+            logger.info('Removed %d expired workspaces.', len(removed_ids))
+
+        return removed_ids
@@ -0,0 +1,270 @@
+import io
+import os
+import time
+import tarfile
+import zipfile
+import threading
+import contextlib
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from redcap_preprocessing import report
+from redcap_preprocessing.columnar import OUTPUT_FORMATS, get_output_path, render_table, write_table
+
+# threads writing the per patient files
+DEFAULT_IO_WORKERS = 8
+
+# archive formats, by file extension
+ARCHIVE_MODES = {'.zip': 'zip',
+                 '.tar': 'w',
+                 '.tar.gz': 'w:gz',
+                 '.tgz': 'w:gz'}
+
+def get_archive_mode(archive_path: str):
+
+    for extension, archive_mode in ARCHIVE_MODES.items():
+        if archive_path.endswith(extension):
+            return archive_mode
+
+    raise ValueError(f'Unknown archive format for {archive_path}, expected one of {list(ARCHIVE_MODES)}.')
+
+def write_atomically(path: str, content: bytes):
+
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+    with open(tmp_path, 'wb') as file:
+        file.write(content)
+    os.replace(tmp_path, path)
+
+def write_table_atomically(frame: pd.DataFrame,
+                           path: str,
+                           output_format: str = 'csv',
+                           column_kinds: dict = None):
+    """
+    Write a table through a temporary file renamed once complete, so that a
+    partial file is never visible.
+
+    Parameters
+    ----------
+    frame: pd.DataFrame
+        table to write
+    path: str
+        path of the file
+    output_format: str
+        one of OUTPUT_FORMATS
+    column_kinds: dict
+        column name -> 'list' or 'category', for the columnar formats
+    """
+
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+    try:
+        with report.stage('writing'):
+            with open(tmp_path, 'wb') as file:
+                write_table(frame, file, output_format, column_kinds)
+            os.replace(tmp_path, path)
+        report.count('files_written')
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def render_table_timed(frame: pd.DataFrame,
+                       output_format: str = 'csv',
+                       column_kinds: dict = None):
+
+    with report.stage('writing'):
+        content = render_table(frame, output_format, column_kinds)
+    report.count('files_written')
+
+    return content
+
+class PatientFileWriter:
+    """
+    Write the per patient files in a bounded thread pool, off the thread
+    doing the conversion.
+
+    The files are written atomically in output_dir, or packed in a single zip
+    or tar archive if archive_path is given. At most max_pending files are
+    queued, write blocks beyond that.
+
+    Parameters
+    ----------
+    output_dir: str
+        directory of the per patient files
+    archive_path: str
+        optional .zip, .tar, .tar.gz or .tgz archive holding the files instead
+    output_format: str
+        one of OUTPUT_FORMATS
+    io_workers: int
+        number of writing threads
+    max_pending: int
+        maximum number of queued files
+    """
+
+    def __init__(self,
+                 output_dir: str,
+                 archive_path: str = None,
+                 output_format: str = 'csv',
+                 io_workers: int = DEFAULT_IO_WORKERS,
+                 max_pending: int = None):
+
+        assert output_format in OUTPUT_FORMATS
+
+        self.output_dir = output_dir
+        self.archive_path = archive_path
+        self.output_format = output_format
+        self.max_pending = max_pending if max_pending is not None else 4 * io_workers
+
+        self.executor = ThreadPoolExecutor(max_workers=io_workers)
+        # (filename, future) in submission order
+        self.pending = deque()
+        self.lock = threading.Lock()
+
+        self.archive = None
+        if archive_path is not None:
+            self.open_archive()
+
+    def open_archive(self):
+
+        archive_mode = get_archive_mode(self.archive_path)
+
+        # the archive is renamed once complete
+        self.archive_tmp_path = f'{self.archive_path}.{os.getpid()}.tmp'
+        self.archive_time = time.time()
+
+        if archive_mode == 'zip':
+            self.archive = zipfile.ZipFile(self.archive_tmp_path, 'w', compression=zipfile.ZIP_DEFLATED)
+        else:
+            self.archive = tarfile.open(self.archive_tmp_path, archive_mode)
+
+    def add_to_archive(self, filename: str, content: bytes):
+
+        if isinstance(self.archive, zipfile.ZipFile):
+            zip_info = zipfile.ZipInfo(filename, date_time=time.localtime(self.archive_time)[:6])
+            zip_info.compress_type = zipfile.ZIP_DEFLATED
+            self.archive.writestr(zip_info, content)
+        else:
+            tar_info = tarfile.TarInfo(filename)
+            tar_info.size = len(content)
+            tar_info.mtime = self.archive_time
+            self.archive.addfile(tar_info, io.BytesIO(content))
+
+    def write(self,
+              frame: pd.DataFrame,
+              filename: str,
+              column_kinds: dict = None):
+        """
+        Queue a per patient table.
+
+        Parameters
+        ----------
+        frame: pd.DataFrame
+            table to write, not modified afterwards
+        filename: str
+            name of the file without extension, relative to output_dir or in
+            the archive
+        column_kinds: dict
+            column name -> 'list' or 'category', for the columnar formats
+        """
+
+        filename = get_output_path(filename, self.output_format)
+
+        with self.lock:
+
+            # the writing threads time the writes in the report of the run
+            run = contextvars.copy_context().run
+
+            if self.archive is None:
+                future = self.executor.submit(run, write_table_atomically, frame, os.path.join(self.output_dir, filename),
+                                                   self.output_format, column_kinds)
+            else:
+                future = self.executor.submit(run, render_table_timed, frame, self.output_format, column_kinds)
+
+            self.pending.append((filename, future))
+
+            while len(self.pending) > self.max_pending:
+                self.flush_one()
+
+    def flush_one(self):
+
+        filename, future = self.pending.popleft()
+
+        # raises the error of the writing thread, if any
+        content = future.result()
+
+        # the archive entries are added in submission order
+        if self.archive is not None:
+            self.add_to_archive(filename, content)
+
+    def close(self):
+        """
+        Wait for the queued files, and complete the archive.
+        """
+
+        with self.lock:
+
+            try:
+                while len(self.pending) > 0:
+                    self.flush_one()
+            finally:
+                self.executor.shutdown()
+
+            if self.archive is not None:
+                self.archive.close()
+                self.archive = None
+                os.replace(self.archive_tmp_path, self.archive_path)
+
+    def abort(self):
+        """
+        Drop the queued files and the incomplete archive.
+        """
+
+        with self.lock:
+
+            for _, future in self.pending:
+                future.cancel()
+            self.pending.clear()
+            self.executor.shutdown()
+
+            if self.archive is not None:
+                self.archive.close()
+                self.archive = None
+                os.remove(self.archive_tmp_path)
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+def open_writer(output_dir: str,
+                save_as_single_file: bool,
+                archive_path: str = None,
+                output_format: str = 'csv'):
+    """
+    Writer of the per patient files shared by the splitters, or an empty
+    context when the data is saved as single files.
+
+    Parameters
+    ----------
+    output_dir: str
+        output directory
+    archive_path: str
+        optional archive holding the per patient files
+    output_format: str
+        one of OUTPUT_FORMATS
+    """
+
+    if save_as_single_file:
+        return contextlib.nullcontext()
+
+    return PatientFileWriter(output_dir, archive_path, output_format)
@@ -1,29 +1,249 @@
+import io
 import os
+import re
+import csv
+import sys
+import json
+import fnmatch
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
-import datetime
 
-def normalize_dates(folder_dir):
+from redcap_preprocessing.dates import normalize_date_series
+from redcap_preprocessing.encoding import detect_encoding
+from redcap_preprocessing.writer import write_atomically
+
+logger = logging.getLogger(__name__)
+
+# per patient files of the old preprocessing, clinical and treatment
+LEGACY_PATTERNS = ('CL_*.csv', 'TR_*.csv')
+
+# the old clinical files have timestamps, e.g. 1954-06-22 00:00:00
+LEGACY_TIMESTAMP = re.compile(r'^(\d{4}-\d{2}-\d{2})[ T]\d{2}:\d{2}:\d{2}$')
+
+# the checkpoint is saved every so many files
+CHECKPOINT_INTERVAL = 500
+
+# files sent to a worker at once
+FILES_PER_TASK = 64
+
+def find_files(root_dir: str,
+               patterns: tuple = LEGACY_PATTERNS):
+    """
+    Paths of the files of a directory tree matching one of the patterns,
+    sorted.
+
+    Parameters
+    ----------
+    root_dir: str
+        root of the directory tree
+    patterns: tuple
+        file name patterns, e.g. 'CL_*.csv'
+    """
+
+    paths = []
+
+    for dirpath, dirnames, filenames in os.walk(root_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if any(fnmatch.fnmatch(filename, pattern) for pattern in patterns):
+                paths.append(os.path.join(dirpath, filename))
+
+    return paths
+
+def normalize_legacy_dates(dates: pd.Series):
+    """
+    Normalize a series of dates to DD/MM/YYYY as the preprocessing does,
+    the old timestamps included.
+
+    Parameters
+    ----------
+    dates: pd.Series
+        dates, as strings
+    """
+
+    dates = dates.str.replace(LEGACY_TIMESTAMP, r'\1', regex=True)
+
+    return normalize_date_series(dates)[0]
+
+def normalize_table(table: pd.DataFrame):
+    """
+    Normalize the dates of a per patient table, in the columns with 'date'
+    in their name, or in the rows for the old clinical files, which have a
+    single column of values indexed by field name.
+
+    Parameters
+    ----------
+    table: pd.DataFrame
+        table read as strings, modified in place
+    """
+
+    for column in table.columns:
+        if 'date' in str(column).lower():
+            table[column] = normalize_legacy_dates(table[column])
+
+    if len(table.columns) == 1:
+        is_date_row = table.index.astype(str).str.lower().str.contains('date', regex=False)
+        if is_date_row.any():
+            table.loc[is_date_row, table.columns[0]] = normalize_legacy_dates(table.loc[is_date_row, table.columns[0]])
+
+    return table
+
+def normalize_file(path: str):
+    """
+    Normalize the dates of a per patient file, rewritten atomically if any of
+    them changed, and return 'changed', 'unchanged' or 'failed'.
+
+    Parameters
+    ----------
+    path: str
+        path of the file
+    """
+
+    try:
+        with open(path, 'rb') as file:
+            content = file.read()
+
+        if content.startswith(b'\xef\xbb\xbf'):
+            encoding = 'utf-8-sig'
+        else:
+            try:
+                content.decode('utf-8')
+                encoding = 'utf-8'
+            except UnicodeDecodeError:
+                encoding = detect_encoding(path)
+
+        text = content.decode(encoding)
+
+        try:
+            delimiter = csv.Sniffer().sniff(text[:1024], delimiters=';,\t').delimiter
+        except csv.Error:
+            delimiter = ','
+
+        table = pd.read_csv(io.StringIO(text), sep=delimiter, index_col=0, dtype=str, keep_default_na=False)
+        normalized_table = normalize_table(table.copy())
+
+        if normalized_table.equals(table):
+            return 'unchanged'
+
+        line_terminator = '\r\n' if b'\r\n' in content else '\n'
+        write_atomically(path, normalized_table.to_csv(sep=delimiter, lineterminator=line_terminator).encode(encoding))
+
+    except Exception as error:
+        logger.warning('Could not normalize the dates of %s: %s', path, error)
+        return 'failed'
+
+    return 'changed'
+
+def read_checkpoint(checkpoint_path: str):
+    """
+    Relative path -> (modification time, size) of the files already
+    normalized, empty if there is no checkpoint.
+    """
+
+    try:
+        with open(checkpoint_path) as file:
+            return {relative_path: tuple(file_stat) for relative_path, file_stat in json.load(file)['files'].items()}
+    except FileNotFoundError:
+        return {}
+
+def write_checkpoint(checkpoint_path: str, files: dict):
+
+    write_atomically(checkpoint_path, json.dumps({'files': files}).encode('utf-8'))
+
+def get_file_stat(path: str):
+
+    file_stat = os.stat(path)
+
+    return (file_stat.st_mtime_ns, file_stat.st_size)
+
+def normalize_dates(folder_dir: str,
+                    patterns: tuple = LEGACY_PATTERNS,
+                    workers: int = 1,
+                    checkpoint_path: str = None):
+    """
+    Normalize the dates of the per patient files of a directory tree to
+    DD/MM/YYYY, as the preprocessing does, and return the number of files
+    changed, unchanged, skipped and failed.
+
+    A file is only rewritten if one of its dates changed. With a checkpoint,
+    the files normalized by a previous run and not modified since are
+    skipped, so that an interrupted run can be resumed.
+
+    Parameters
+    ----------
+    folder_dir: str
+        root of the directory tree
+    patterns: tuple
+        names of the files to normalize, the old clinical and treatment files
+        by default
+    workers: int
+        number of processes
+    checkpoint_path: str
+        optional json file of the files already normalized
+    """
+
+    assert workers >= 1
+
+    checkpoint = read_checkpoint(checkpoint_path) if checkpoint_path is not None else {}
+
+    counts = {'changed': 0, 'unchanged': 0, 'skipped': 0, 'failed': 0}
+
+    paths = []
+    for path in find_files(folder_dir, patterns):
+        if checkpoint.get(os.path.relpath(path, folder_dir)) == get_file_stat(path):
+            counts['skipped'] += 1
+        else:
+            paths.append(path)
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+
+    try:
+        results = executor.map(normalize_file, paths, chunksize=FILES_PER_TASK) if executor is not None else map(normalize_file, paths)
+
+        for processed, (path, status) in enumerate(zip(paths, results), start=1):
+
+            counts[status] += 1
+
+            # the failed files are tried again on resume
+            if status != 'failed':
+                checkpoint[os.path.relpath(path, folder_dir)] = get_file_stat(path)
 
-    for filename in os.listdir(folder_dir):
+            if checkpoint_path is not None and processed % CHECKPOINT_INTERVAL == 0:
+                write_checkpoint(checkpoint_path, checkpoint)
+    finally:
+        if checkpoint_path is not None:
+            write_checkpoint(checkpoint_path, checkpoint)
+        if executor is not None:
+            executor.shutdown()
 
-        single_patient_data = pd.read_csv(os.path.join(folder_dir, filename))
+    logger.info('Normalized the dates of %d files: %d changed, %d unchanged, %d skipped, %d failed.',
+                sum(counts.values()), counts['changed'], counts['unchanged'], counts['skipped'], counts['failed'])
 
-        for column_name in single_patient_data.columns:
+    return counts
 
-            if 'date' in column_name:
+def main(argv: list = None):
+    """
+    Normalize the dates of the old per patient files, e.g.
 
-                single_patient_data[column_name] = single_patient_data[column_name].apply(normalize_date)
+        python -m redcap_processing.normalize_dates data --workers 8 --checkpoint normalize_dates.json
+    """
 
-    return None
+    parser = argparse.ArgumentParser(description='Normalize the dates of per patient files to DD/MM/YYYY.')
+    parser.add_argument('folder_dir', help='root of the directory tree')
+    parser.add_argument('--pattern', nargs='+', default=list(LEGACY_PATTERNS), help='names of the files to normalize')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes')
+    parser.add_argument('--checkpoint', help='json file of the files already normalized, to resume a run')
+    args = parser.parse_args(argv)
 
-def normalize_date(date):
+    logging.basicConfig(level=logging.INFO)
 
-    # if date is a string
-    if isinstance(date, str):
+    counts = normalize_dates(args.folder_dir, tuple(args.pattern), args.workers, args.checkpoint)
+    print(json.dumps(counts))
 
-        return datetime.strptime(date, '%d/%m/%Y')
-    
-    # if date is a datetime object
-    elif isinstance(date, datetime):
+    return counts
 
-        return date.strptime(date, '%d/%m/%Y')
\ No newline at end of file
+if __name__ == '__main__':
+    main(sys.argv[1:])
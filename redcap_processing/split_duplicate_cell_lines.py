@@ -1,44 +1,62 @@
 import os
-import pandas as pd
 import re
-from redcap_preprocessing.utils import standardize_code
-
-
-filename = "CL_C_PID_CGR0002 ;CGR0060 _SID_0001"
+import logging
 
+import pandas as pd
 
-def change_single_duplicate_cell_line():
+from redcap_preprocessing.cell_line_index import get_cell_line_table
+from redcap_preprocessing.utils import get_delimiter
 
-    return
+logger = logging.getLogger(__name__)
 
+# e.g. "CL_C_PID_CGR0002 ;CGR0060 _SID_0001.csv", written by the old
+# preprocessing for the patients with several cell lines
+DUPLICATE_CELL_LINES_FILENAME = re.compile(r'^(?P<prefix>.*_PID_)(?P<cell_line_codes>[^_]*;[^_]*)(?P<suffix>_SID_.*\.csv)$')
 
 def split_duplicate_cell_lines(path_to_files):
+    """
+    Split the old per patient files named after several cell lines into one
+    file per cell line, as the preprocessing now writes them.
 
-    # if two cell lines are present in the file, split the file in two and duplicate the contents.
-
-    for filename in os.listdir(path_to_files):
+    The cell_line_code and sister_cell_line_codes columns, if any, are set as
+    in the preprocessing, see cell_line_index.get_cell_line_table. The
+    original files are left in place.
 
-        if '.csv' in filename:
+    Parameters
+    ----------
+    path_to_files: str
+        directory of the per patient files
+    """
 
-            extracted_elements = re.findall(r"GR\d+", filename)
+    for filename in sorted(os.listdir(path_to_files)):
 
-            if len(extracted_elements) > 1:
+        match = DUPLICATE_CELL_LINES_FILENAME.match(filename)
+        if match is None:
+            continue
 
-                parts = filename.split(";")
-                common_parts = parts[0].rsplit('_', 1)[0]
+        file_path = os.path.join(path_to_files, filename)
+        delimiter = get_delimiter(file_path)
 
-                # read in the file
-                data_file = pd.read_csv(os.path.join(path_to_files, filename))
+        # read in the file
+        data_file = pd.read_csv(file_path, sep=delimiter, index_col=0, dtype=str, keep_default_na=False)
 
-                for cell_line in extracted_elements:
+        cell_line_codes = ';'.join(code.strip() for code in match['cell_line_codes'].split(';'))
+        # the dates are not in the file names
+        cell_line_table = get_cell_line_table([(cell_line_codes, ';' * cell_line_codes.count(';'))], [0])
 
-                    cell_line = standardize_code(cell_line, 'GR')
+        for cell_line_code, sister_cell_line_codes in zip(cell_line_table['cell_line_code'], cell_line_table['sister_cell_line_codes']):
 
-                    # create a new file name
-                    new_filename = filename.replace(extracted_elements[0], cell_line)
-                    print(new_filename)
+            # create a new file name
+            new_filename = f"{match['prefix']}{cell_line_code}{match['suffix']}"
 
-                    # write the file
-                    #data_file.to_csv(os.path.join(path_to_files, new_filename), index=False)
+            single_cell_line_data = data_file.copy()
+            if 'cell_line_code' in single_cell_line_data.columns:
+                single_cell_line_data['cell_line_code'] = cell_line_code
+            if 'sister_cell_line_codes' in single_cell_line_data.columns:
+                single_cell_line_data['sister_cell_line_codes'] = sister_cell_line_codes
 
+            # write the file
+            single_cell_line_data.to_csv(os.path.join(path_to_files, new_filename), sep=delimiter)
+            logger.info('Split %s into %s.', filename, new_filename)
 
+    return None
@@ -10,10 +10,17 @@ setup(
     name='redcappreprocessing',
     version='0.1',
     packages=find_packages(),
+    # conversion tables, see redcap_preprocessing.conversion_tables
+    package_data={'redcap_preprocessing': ['tables/*.csv']},
     install_requires=read_requirements(),
+    extras_require={
+        # parquet and arrow output formats, multithreaded parsing of the exports
+        'columnar': ['pyarrow'],
+    },
     entry_points={
         'console_scripts': [
             'start-myapp=redcap_preprocessing.app:run',
+            'redcap-preprocess=redcap_preprocessing.cli:main',
         ],
     },
     author='Gustave Ronteix',
@@ -0,0 +1,85 @@
+import os
+import time
+
+import pytest
+
+import app as web_app
+from redcap_preprocessing.jobs import JobQueue
+from redcap_preprocessing.workspaces import WorkspaceStore
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(web_app, 'workspaces', WorkspaceStore(str(tmp_path / 'uploads')))
+    monkeypatch.setitem(web_app.app.config, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(web_app, 'job_queue', JobQueue(workers=2))
+
+    yield web_app.app.test_client()
+
+    web_app.job_queue.shutdown()
+
+
+def upload(client, disease_type):
+
+    with open('data/prototype_redcap.csv', 'rb') as file:
+        response = client.post('/', data={'file': (file, 'redcap.csv'), 'analysis_type': disease_type},
+                               content_type='multipart/form-data')
+
+    assert response.status_code == 302
+
+    return response.headers['Location'].rsplit('/', 1)[1]
+
+
+def wait_for(client, job_id):
+
+    for _ in range(100):
+        job_status = client.get(f'/jobs/{job_id}/status').get_json()
+        if job_status['status'] in ['done', 'failed']:
+            return job_status
+        time.sleep(0.1)
+
+    raise TimeoutError(job_id)
+
+
+def test_concurrent_uploads(client):
+
+    job_ids = [upload(client, 'CRC'), upload(client, 'CRC')]
+    assert job_ids[0] != job_ids[1]
+
+    for job_id in job_ids:
+        assert wait_for(client, job_id)['status'] == 'done'
+        assert client.get(f'/jobs/{job_id}').status_code == 200
+        assert client.get(f'/jobs/{job_id}/files/CLI_C_PID_ALL.csv').status_code == 200
+
+    # the status is read from the workspace when the job ran in another process
+    web_app.job_queue.remove(job_ids)
+    assert client.get(f'/jobs/{job_ids[0]}/status').get_json()['status'] == 'done'
+
+    assert client.get('/jobs/unknown/status').status_code == 404
+    assert client.get(f'/jobs/{job_ids[0]}/files/..%2Fjob.json').status_code == 404
+
+
+def test_cached_upload(client):
+
+    assert wait_for(client, upload(client, 'CRC'))['status'] == 'done'
+
+    # the same export is served from the cache, in the background too
+    job_id = upload(client, 'CRC')
+    job_status = wait_for(client, job_id)
+
+    assert job_status['status'] == 'done'
+    assert job_status['report']['counters'] == {'cache_hits': 1}
+    assert client.get(f'/jobs/{job_id}/files/TTR_C_PID_ALL.csv').status_code == 200
+
+
+def test_rejected_upload(client, tmp_path):
+
+    with open('data/prototype_redcap.csv', 'rb') as file:
+        response = client.post('/', data={'file': (file, 'redcap.csv'), 'analysis_type': 'LUNG'},
+                               content_type='multipart/form-data')
+
+    assert response.status_code == 400
+
+    # no workspace was created for the rejected upload
+    assert not (tmp_path / 'uploads').exists() or os.listdir(tmp_path / 'uploads') == []
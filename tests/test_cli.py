@@ -0,0 +1,68 @@
+import json
+import shutil
+
+import pandas as pd
+import pytest
+
+from redcap_preprocessing import cli
+from redcap_preprocessing.cli import detect_disease_type, expand_exports, get_output_dirs, main
+from redcap_preprocessing.synthetic import write_redcap_export
+
+
+def test_detect_disease_type(tmp_path, monkeypatch):
+
+    assert detect_disease_type('data/prototype_redcap.csv') == 'CRC'
+
+    write_redcap_export(str(tmp_path / 'pdac.csv'), 'PDAC', 10, 'data/prototype_redcap.csv', seed=1)
+    assert detect_disease_type(str(tmp_path / 'pdac.csv')) == 'PDAC'
+
+    # the cell lines found after the first chunks
+    monkeypatch.setattr(cli, 'DETECTION_CHUNKSIZE', 2)
+    assert detect_disease_type('data/prototype_redcap.csv') == 'CRC'
+
+    # no cell lines
+    redcap = pd.read_csv('data/prototype_redcap.csv', sep=';')
+    redcap[redcap['redcap_repeat_instrument'] != 'organoides'].to_csv(tmp_path / 'no_cell_lines.csv', sep=';', index=False)
+    with pytest.raises(ValueError, match='no disease type'):
+        detect_disease_type(str(tmp_path / 'no_cell_lines.csv'))
+
+
+def test_expand_exports(tmp_path):
+
+    for name in ['b.csv', 'a.csv']:
+        shutil.copy('data/prototype_redcap.csv', tmp_path / name)
+
+    assert expand_exports([str(tmp_path / 'b.csv'), str(tmp_path / '*.csv')]) == [str(tmp_path / 'b.csv'), str(tmp_path / 'a.csv')]
+
+    with pytest.raises(ValueError):
+        expand_exports([str(tmp_path / '*.txt')])
+
+    # the exports of the same name get their own directories
+    assert get_output_dirs(['site_1/export.csv', 'site_2/export.csv'], 'out') == ['out/export', 'out/export_2']
+
+
+def test_main(tmp_path, capsys):
+
+    exports_dir = tmp_path / 'exports'
+    exports_dir.mkdir()
+    shutil.copy('data/prototype_redcap.csv', exports_dir / 'crc.csv')
+    write_redcap_export(str(exports_dir / 'pdac.csv'), 'PDAC', 10, 'data/prototype_redcap.csv', seed=1)
+
+    output_dir = tmp_path / 'out'
+    assert main([str(exports_dir / '*.csv'), '--output-dir', str(output_dir), '--single-file', '--json', str(tmp_path / 'summaries.json')]) == 0
+
+    assert (output_dir / 'crc' / 'CLI_C_PID_ALL.csv').exists()
+    assert (output_dir / 'pdac' / 'CLI_P_PID_ALL.csv').exists()
+
+    with open(tmp_path / 'summaries.json') as file:
+        summaries = json.load(file)
+
+    assert [(summary['disease_type'], summary['status']) for summary in summaries] == [('CRC', 'done'), ('PDAC', 'done')]
+    assert summaries[0]['report']['counters']['records'] == 2
+
+    # the summary table
+    assert 'crc.csv' in capsys.readouterr().out
+
+    # a failed export
+    (exports_dir / 'empty.csv').write_text('record_id;redcap_repeat_instrument\n')
+    assert main([str(exports_dir / 'empty.csv'), '--disease', 'CRC', '--output-dir', str(output_dir)]) == 1
@@ -0,0 +1,53 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+from redcap_preprocessing.columnar import read_table, to_arrow_table
+from redcap_preprocessing.redcap_preprocessing import preprocess_redcap_data
+
+pa = pytest.importorskip('pyarrow')
+
+
+def test_to_arrow_table():
+
+    frame = pd.DataFrame({'record_id': [1, 2],
+                          'date_birth': ['31/01/2020', ''],
+                          'date_other': ['31/01/2020', 'unknown'],
+                          'sex': ['man', ''],
+                          'medical_history': ['diabetes;hypertension', ''],
+                          'weight': [70.5, ''],
+                          'sister_cell_line_codes': ['', 'GR0002']},
+                         index=[5, 6])
+
+    table = to_arrow_table(frame, {'sex': 'category', 'medical_history': 'list'})
+
+    assert table.column_names == list(frame.columns)
+    assert table.schema.field('date_birth').type == pa.date32()
+    # the unparsed dates are kept as text
+    assert table.schema.field('date_other').type == pa.string()
+    assert pa.types.is_dictionary(table.schema.field('sex').type)
+    assert table.schema.field('medical_history').type == pa.list_(pa.string())
+    assert table.schema.field('weight').type == pa.float64()
+
+    assert table.column('date_birth').to_pylist() == [datetime.date(2020, 1, 31), None]
+    assert table.column('sex').to_pylist() == ['man', None]
+    assert table.column('medical_history').to_pylist() == [['diabetes', 'hypertension'], None]
+    assert table.column('sister_cell_line_codes').to_pylist() == [None, ['GR0002']]
+
+
+@pytest.mark.parametrize('output_format', ['parquet', 'arrow'])
+def test_columnar_output_format(tmp_path, output_format):
+
+    preprocess_redcap_data('data/prototype_redcap.csv', 'CRC', True, str(tmp_path / 'csv'))
+    preprocess_redcap_data('data/prototype_redcap.csv', 'CRC', True, str(tmp_path / output_format), output_format=output_format)
+
+    for modality in ['CLI', 'TTR', 'MOL']:
+
+        csv_table = read_table(str(tmp_path / 'csv' / f'{modality}_C_PID_ALL.csv'), 'csv')
+        columnar_table = read_table(str(tmp_path / output_format / f'{modality}_C_PID_ALL.{output_format}'), output_format)
+
+        # the csv index is not kept
+        assert list(columnar_table.columns) == list(csv_table.columns[1:])
+        assert list(columnar_table['cell_line_code']) == list(csv_table['cell_line_code'])
+        assert list(columnar_table['date_cell_line']) == list(csv_table['date_cell_line'])
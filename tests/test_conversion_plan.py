@@ -0,0 +1,57 @@
+import pytest
+import pandas as pd
+
+from redcap_preprocessing.conversion_plan import ConversionPlan
+
+
+def test_conversion_plan_from_csv():
+
+    conversion_table = pd.read_csv('redcap_preprocessing/tables/redcap_CRC_conversion_table.csv', sep=';')
+    conversion_table = conversion_table[conversion_table.data_type == 'treatment']
+
+    conversion_plan = ConversionPlan.from_csv('redcap_preprocessing/tables/redcap_CRC_conversion_table.csv', 'treatment')
+
+    # columns and matching types keep the order of the conversion table
+    assert conversion_plan.columns == list(conversion_table['orakloncology_name'].unique())
+    assert conversion_plan.matching_types('chemotherapy_type') == [3, 2]
+
+    # redcap names are stripped
+    for column_rules in conversion_plan.rules.values():
+        for rules in column_rules.values():
+            for rule in rules:
+                assert rule.redcap_name == rule.redcap_name.strip()
+
+
+def test_conversion_plan_get_content():
+
+    conversion_table = pd.DataFrame({'matching_type': [1, 2, 2, 3, 3, 4, 4],
+                                     'redcap_name': ['dob', 'site___1', 'site___2', 'sexe', 'sexe', 'mut_1', 'mut_2'],
+                                     'redcap_options': [None, None, None, 1, 2, None, None],
+                                     'orakloncology_name': ['date_birth', 'site', 'site', 'sex', 'sex', 'mutations', 'mutations'],
+                                     'orakloncology_options': [None, 'liver', 'lung', 'man', 'woman', None, None]})
+    conversion_plan = ConversionPlan(conversion_table)
+
+    row = pd.Series({'dob': '1954-06-22', 'site___1': 1, 'site___2': 1, 'sexe': 2, 'mut_1': 'KRAS', 'mut_2': float('nan')})
+
+    assert conversion_plan.get_content(row, 'date_birth', 1) == '1954-06-22'
+    assert conversion_plan.get_content(row, 'site', 2) == 'liver;lung'
+    assert conversion_plan.get_content(row, 'sex', 3) == 'woman'
+    assert conversion_plan.get_content(row, 'mutations', 4) == 'KRAS'
+
+
+def test_conversion_plan_validation():
+
+    conversion_table = pd.DataFrame({'matching_type': [1, 1],
+                                     'redcap_name': ['dob', 'dod'],
+                                     'redcap_options': [None, None],
+                                     'orakloncology_name': ['date_birth', 'date_birth'],
+                                     'orakloncology_options': [None, None]})
+
+    with pytest.raises(ValueError):
+        ConversionPlan(conversion_table)
+
+    conversion_table['matching_type'] = [5, 5]
+    conversion_table['orakloncology_name'] = ['date_birth', 'date_diagnosis']
+
+    with pytest.raises(ValueError):
+        ConversionPlan(conversion_table)
@@ -0,0 +1,71 @@
+import os
+import logging
+
+import pytest
+
+from redcap_preprocessing import conversion_tables
+from redcap_preprocessing.conversion_tables import get_conversion_table_path, load_conversion_table
+
+HEADER = 'matching_type;redcap_name;redcap_options;orakloncology_name;orakloncology_options;data_type\n'
+
+
+def write_conversion_table(path, rules):
+
+    path.write_text(HEADER + ''.join(f'{rule}\n' for rule in rules))
+
+    return str(path)
+
+
+def test_packaged_conversion_tables(tmp_path, monkeypatch, caplog):
+
+    # found whatever the working directory
+    monkeypatch.chdir(tmp_path)
+    # compiled again, not reused from another test
+    monkeypatch.setattr(conversion_tables, '_compiled_tables', {})
+
+    for disease_type in ['CRC', 'PDAC']:
+        with caplog.at_level(logging.WARNING, logger='redcap_preprocessing'):
+            compiled_table = load_conversion_table(get_conversion_table_path(disease_type))
+        # the known quirks of the packaged tables are not warned about
+        assert caplog.text == ''
+        assert set(compiled_table.conversion_plans) == {'clinical-profile', 'treatment', 'molecular_profile'}
+        # the trailing spaces of the redcap names are stripped
+        assert 'date_chir_premiere' in set(compiled_table.redcap_conversion_table['redcap_name'])
+
+
+def test_compiled_table_cache(tmp_path):
+
+    conversion_table_path = write_conversion_table(tmp_path / 'table.csv', ['3;sexe;1;sex;man;clinical-profile'])
+
+    compiled_table = load_conversion_table(conversion_table_path)
+    assert load_conversion_table(conversion_table_path) is compiled_table
+
+    # touched but not changed
+    os.utime(conversion_table_path, (0, 0))
+    assert load_conversion_table(conversion_table_path) is compiled_table
+
+    # changed
+    write_conversion_table(tmp_path / 'table.csv', ['3;sexe;1;sex;man;clinical-profile', '3;sexe;2;sex;woman;clinical-profile'])
+    changed_table = load_conversion_table(conversion_table_path)
+    assert changed_table.conversion_plans['clinical-profile'].get_rules('sex', 3)[1].orakloncology_option == 'woman'
+
+
+def test_conversion_table_validation(tmp_path, caplog):
+
+    with pytest.raises(ValueError, match='Unknown matching types 5'):
+        load_conversion_table(write_conversion_table(tmp_path / 'unknown.csv', ['5;sexe;1;sex;man;clinical-profile']))
+
+    with pytest.raises(ValueError, match='Multiple type 1 rules for the columns date_birth'):
+        load_conversion_table(write_conversion_table(tmp_path / 'type_1.csv', ['1;dob;;date_birth;;clinical-profile',
+                                                                               '1;ddn;;date_birth;;clinical-profile']))
+
+    warned_path = write_conversion_table(tmp_path / 'warned.csv', ['3;sexe ;1;sex;man;clinical-profile',
+                                                                   '3;sexe;1;sex;man;clinical-profile'])
+
+    with caplog.at_level(logging.WARNING, logger='redcap_preprocessing'):
+        load_conversion_table(warned_path)
+    assert "1 redcap_name with leading or trailing spaces: 'sexe '" in caplog.text
+    assert '1 duplicated rules for the columns sex' in caplog.text
+
+    with pytest.raises(ValueError, match='leading or trailing spaces'):
+        load_conversion_table(warned_path, strict=True)
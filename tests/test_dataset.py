@@ -0,0 +1,120 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+from redcap_preprocessing.cell_line_index import fan_out_cell_lines, get_cell_line_table
+from redcap_preprocessing.columns import get_redcap_columns
+from redcap_preprocessing.dataset import RedcapDataset, read_redcap
+from redcap_preprocessing.utils import get_cell_line_code
+
+
+def test_redcap_dataset_from_csv():
+
+    dataset = RedcapDataset.from_csv('data/prototype_redcap.csv',
+                                     'redcap_preprocessing/tables/redcap_CRC_conversion_table.csv',
+                                     'CRC')
+
+    # the BOM of the export must not end up in the first column name
+    assert dataset.redcap.columns[0] == 'record_id'
+    assert dataset.delimiter == ';'
+    assert len(dataset.redcap) == 22
+
+    # conversion plans are compiled once
+    assert dataset.get_conversion_plan('treatment') is dataset.get_conversion_plan('treatment')
+    assert 'chemotherapy_type' in dataset.get_conversion_plan('treatment').columns
+
+
+def test_redcap_dataset_disease_type():
+
+    with pytest.raises(AssertionError):
+        RedcapDataset.from_csv('data/prototype_redcap.csv',
+                               'redcap_preprocessing/tables/redcap_CRC_conversion_table.csv',
+                               'NSCLC')
+
+
+def test_cell_line_index():
+
+    dataset = RedcapDataset.from_csv('data/prototype_redcap.csv',
+                                     'redcap_preprocessing/tables/redcap_CRC_conversion_table.csv',
+                                     'CRC')
+    redcap = dataset.redcap
+    cell_line_index = dataset.get_cell_line_index()
+
+    for record_id in redcap.record_id.unique():
+
+        assert cell_line_index.get_cell_line_code(record_id) == get_cell_line_code('CRC', redcap, record_id)
+        assert list(cell_line_index.get_rows(record_id)) == list(np.flatnonzero(redcap.record_id == record_id))
+
+    assert cell_line_index.get_cell_line_code(26) == ('CGR0069', '25/05/2023')
+
+    is_treatment_row = (redcap['redcap_repeat_instrument'] == 'hai_chemotherapy').to_numpy()
+    assert len(cell_line_index.get_rows(26, is_treatment_row)) == 1
+
+
+def test_get_cell_line_table():
+
+    cell_lines = [('CGR3;CGR0004', '26/03/2020;1969-11-10'),
+                  ('', ''),
+                  ('PGR12;', '01/02/2021;'),
+                  ('CGR0005;CGR0006', '01/01/2020')]
+
+    cell_line_table = get_cell_line_table(cell_lines, [0, 0, 1, 2])
+
+    # exploded in lockstep, the code without a date dropped
+    assert list(cell_line_table['position']) == [0, 0, 1, 2, 2, 3]
+    assert list(cell_line_table['cell_line_code']) == ['GR0003', 'GR0004', 'XX0000', 'GR0012', 'XX0001', 'GR0005']
+    assert list(cell_line_table['date_cell_line']) == ['26/03/2020', '10/11/1969', '', '01/02/2021', '', '01/01/2020']
+    # compared with the codes as extracted
+    assert list(cell_line_table['sister_cell_line_codes']) == ['GR3;GR0004', 'GR3', '', 'GR12;', 'GR12;', 'GR0006']
+
+    # as in the clinical tables
+    cell_line_table = get_cell_line_table(cell_lines, [0, 0, 1, 2], standardize_sister_codes=True)
+    assert list(cell_line_table['sister_cell_line_codes']) == ['GR0003;GR0004', 'GR0003', 'GR0000', 'GR0012;GR0000', 'GR0012;GR0000', 'GR0006']
+
+
+def test_fan_out_cell_lines():
+
+    data = pd.DataFrame({'line_number': ['1', '2', '1']}, index=[10, 11, 12])
+
+    fanned_out_data, cell_line_table = fan_out_cell_lines(data,
+                                                          [7, 8, 9],
+                                                          [np.array([0, 1]), np.array([], dtype=int), np.array([2])],
+                                                          [('CGR0001;CGR0002', '01/01/2020;02/01/2020'), ('CGR0003', ''), ('', '')],
+                                                          [0, 0, 0])
+
+    # the rows of the first record once per cell line, the record without rows skipped
+    assert list(fanned_out_data.index) == [10, 11, 10, 11, 12]
+    assert list(fanned_out_data.columns) == ['line_number', 'cell_line_code', 'sister_cell_line_codes', 'date_cell_line', 'record_id']
+    assert list(fanned_out_data['cell_line_code']) == ['GR0001', 'GR0001', 'GR0002', 'GR0002', 'XX0000']
+    assert list(fanned_out_data['record_id']) == [7, 7, 7, 7, 9]
+
+    assert list(cell_line_table['position']) == [0, 0, 2]
+    assert list(cell_line_table['start']) == [0, 2, 4]
+    assert list(cell_line_table['stop']) == [2, 4, 5]
+
+
+def test_redcap_dataset_columns():
+
+    dataset = RedcapDataset.from_csv('data/prototype_redcap.csv',
+                                     'redcap_preprocessing/tables/redcap_CRC_conversion_table.csv',
+                                     'CRC')
+    redcap, _, _ = read_redcap('data/prototype_redcap.csv')
+
+    # only the columns used by the conversion table and the splitters are read
+    assert set(dataset.redcap.columns) == set(get_redcap_columns(dataset.redcap_conversion_table, 'CRC'))
+    assert len(dataset.redcap.columns) < len(redcap.columns)
+
+    assert dataset.redcap['redcap_repeat_instrument'].dtype == 'category'
+    assert dataset.redcap['atcd_onco___1'].dtype == 'float32'
+    pd.testing.assert_series_equal(dataset.redcap['atcd_onco___1'] == 1, redcap['atcd_onco___1'] == 1)
+
+
+def test_redcap_dataset_missing_columns(tmp_path):
+
+    redcap, _, _ = read_redcap('data/prototype_redcap.csv')
+    redcap.drop(columns=['sexe', 'nom_lign_e']).to_csv(tmp_path / 'redcap.csv', sep=';', index=False)
+
+    with pytest.raises(ValueError, match='nom_lign_e, sexe'):
+        RedcapDataset.from_csv(str(tmp_path / 'redcap.csv'),
+                               'redcap_preprocessing/tables/redcap_CRC_conversion_table.csv',
+                               'CRC')
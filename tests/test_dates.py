@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+
+from redcap_preprocessing.dates import normalize_date, normalize_date_series, format_dates
+
+def test_normalize_date_series():
+
+    dates = pd.Series(['2020-01-31', '31/01/2020', '2020-01-31;2021-02-01', np.nan, None,
+                       'nan', 'NaT', '0000-00-00', 'None', '', '2020-1-5', '1500-03-04'])
+
+    normalized_dates, unparseable_dates = normalize_date_series(dates)
+
+    assert list(normalized_dates) == [normalize_date(date) for date in dates]
+    assert list(normalized_dates[:3]) == ['31/01/2020'] * 3
+    assert normalized_dates[10] == '05/01/2020'
+    assert normalized_dates[11] == '04/03/1500'
+    assert unparseable_dates == []
+
+def test_format_dates_unparseable():
+
+    df = pd.DataFrame({'date_birth': ['2020-01-31', 'unknown', 'unknown'],
+                       'sex': ['M', 'F', 'M']})
+
+    unparseable_dates = {}
+    df = format_dates(df, unparseable_dates)
+
+    assert list(df['date_birth']) == ['31/01/2020', 'unknown', 'unknown']
+    assert list(df['sex']) == ['M', 'F', 'M']
+    assert unparseable_dates == {'date_birth': ['unknown']}
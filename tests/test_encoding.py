@@ -0,0 +1,81 @@
+import pytest
+
+from redcap_preprocessing import encoding
+
+
+def test_detect_encoding(tmp_path):
+
+    content = 'record_id;nom\n1;Hôpital Européen\n'
+
+    utf8_path = tmp_path / 'utf8.csv'
+    utf8_path.write_bytes(content.encode('utf-8'))
+    assert encoding.detect_encoding(str(utf8_path)) == 'utf-8'
+
+    bom_path = tmp_path / 'bom.csv'
+    bom_path.write_bytes(content.encode('utf-8-sig'))
+    assert encoding.detect_encoding(str(bom_path)) == 'utf-8-sig'
+
+    cp1252_path = tmp_path / 'cp1252.csv'
+    cp1252_path.write_bytes(content.encode('cp1252'))
+    assert encoding.detect_encoding(str(cp1252_path)) == 'cp1252'
+
+
+def test_detect_encoding_cache(tmp_path, monkeypatch):
+
+    file_path = tmp_path / 'export.csv'
+    file_path.write_bytes('record_id;nom\n2;Clinique Générale\n'.encode('cp1252'))
+    cache_dir = tmp_path / 'cache'
+
+    assert encoding.detect_encoding(str(file_path), str(cache_dir)) == 'cp1252'
+    assert (cache_dir / encoding.ENCODING_CACHE_FILENAME).exists()
+
+    # neither the in memory nor the on disk cache should run the detection again
+    def guess_encoding(file_path, sample=None):
+        raise AssertionError('the encoding should come from the cache')
+
+    monkeypatch.setattr(encoding, 'guess_encoding', guess_encoding)
+
+    assert encoding.detect_encoding(str(file_path), str(cache_dir)) == 'cp1252'
+
+    encoding._encoding_cache.clear()
+    assert encoding.detect_encoding(str(file_path), str(cache_dir)) == 'cp1252'
+
+
+def test_detect_encoding_sample(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(encoding, 'SAMPLE_SIZE', 64)
+
+    decoded_files = []
+    can_decode = encoding.can_decode
+
+    def count_can_decode(file_path, file_encoding):
+        decoded_files.append(file_path)
+        return can_decode(file_path, file_encoding)
+
+    monkeypatch.setattr(encoding, 'can_decode', count_can_decode)
+
+    # accents at both ends, the end sample starting within a character
+    file_path = tmp_path / 'accents.csv'
+    file_path.write_bytes(('record_id;nom\n' + '1;Hôpital Européen\n' * 20 + '2;Cli').encode('utf-8'))
+    assert encoding.FileSample(str(file_path)).tail[:1] == 'ô'.encode('utf-8')[1:]
+    assert encoding.detect_encoding(str(file_path)) == 'utf-8'
+    # only the samples are decoded
+    assert decoded_files == []
+
+    # ascii at both ends, cp1252 in the middle
+    file_path = tmp_path / 'middle.csv'
+    file_path.write_bytes(('record_id;nom\n' + '1;Clinique\n' * 10 + '2;Générale\n' + '3;Clinique\n' * 10).encode('cp1252'))
+    assert encoding.detect_encoding(str(file_path)) == 'cp1252'
+    # the whole file is decoded
+    assert decoded_files == [str(file_path)] * 3
+
+
+def test_encoding_cache_key(tmp_path):
+
+    file_path = tmp_path / 'export.csv'
+    file_path.write_bytes('record_id;nom\n1;Hôpital\n'.encode('utf-8'))
+    assert encoding.detect_encoding(str(file_path)) == 'utf-8'
+
+    # rewritten in another encoding, same size
+    file_path.write_bytes('record_id;nom\n1;Hôpitaux\n'.encode('cp1252'))
+    assert encoding.detect_encoding(str(file_path)) == 'cp1252'
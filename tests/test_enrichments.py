@@ -0,0 +1,63 @@
+import pandas as pd
+
+from redcap_preprocessing.dataset import RedcapDataset
+from redcap_preprocessing.enrichments import add_enrichments, get_modality_enrichments
+from redcap_preprocessing.split_treatment_data_from_redcap import split_treatment_data
+from redcap_preprocessing.synthetic import write_redcap_export
+
+
+def test_clinical_enrichments():
+
+    dataset = RedcapDataset.from_csv('data/prototype_redcap.csv',
+                                     'redcap_preprocessing/tables/redcap_CRC_conversion_table.csv',
+                                     'CRC')
+
+    clinical_enrichments = dataset.get_clinical_enrichments()
+
+    # built once, one row per record
+    assert clinical_enrichments is dataset.get_clinical_enrichments()
+    assert list(clinical_enrichments.columns) == ['date_death']
+    assert clinical_enrichments.index.is_unique
+
+    # as in the clinical table
+    assert clinical_enrichments.loc[26, 'date_death'] == '18/05/2022'
+
+    # no columns for the molecular data
+    assert get_modality_enrichments(clinical_enrichments, 'molecular') is None
+
+    treatment_enrichments = get_modality_enrichments(clinical_enrichments, 'treatment', [26])
+    data = pd.DataFrame({'record_id': [26, 26], 'chemotherapy_type': ['a', 'b']})
+    assert list(add_enrichments(data, treatment_enrichments)['date_death']) == ['18/05/2022', '18/05/2022']
+
+
+def test_treatment_without_clinical_outputs(tmp_path):
+
+    redcap_path = str(tmp_path / 'redcap.csv')
+    write_redcap_export(redcap_path, 'CRC', 40, 'data/prototype_redcap.csv', seed=3)
+
+    dataset = RedcapDataset.from_csv(redcap_path, 'redcap_preprocessing/tables/redcap_CRC_conversion_table.csv', 'CRC')
+    date_death = dataset.get_clinical_enrichments()['date_death']
+
+    # the clinical outputs are not written
+    single_file_dir = tmp_path / 'single_file'
+    single_file_dir.mkdir()
+    split_treatment_data(dataset, str(single_file_dir), save_as_single_file=True)
+    assert [path.name for path in single_file_dir.iterdir()] == ['TTR_C_PID_ALL.csv']
+
+    treatment = pd.read_csv(single_file_dir / 'TTR_C_PID_ALL.csv', sep=';', index_col=0, dtype={'date_death': str})
+    assert len(treatment) > 0
+    assert list(treatment.index) == list(range(len(treatment)))
+    # missing dates are written as empty fields
+    assert list(treatment['date_death'].fillna('')) == list(treatment['record_id'].map(date_death))
+    # the rows of the records with several cell lines are not repeated
+    assert not treatment.duplicated().any()
+
+    # the per patient tables have the date of death too
+    per_patient_dir = tmp_path / 'per_patient'
+    per_patient_dir.mkdir()
+    split_treatment_data(dataset, str(per_patient_dir))
+
+    for path in per_patient_dir.iterdir():
+        patient_treatment = pd.read_csv(path, sep=';', index_col=0, dtype={'date_death': str})
+        assert patient_treatment.columns[-1] == 'date_death'
+        assert list(patient_treatment['date_death'].fillna('')) == list(patient_treatment['record_id'].map(date_death))
@@ -0,0 +1,24 @@
+import sys
+
+import pytest
+
+from redcap_preprocessing.benchmark import COLD_START_MODULES, measure_import
+from redcap_preprocessing.redcap_preprocessing import SPLITTERS, get_splitter
+
+
+@pytest.mark.parametrize('module', COLD_START_MODULES)
+def test_cold_start(module):
+
+    result = measure_import(module)
+
+    # pandas and the splitters are imported by the first run, not by the
+    # entry points
+    assert result['heavy_modules'] == []
+    assert result['seconds'] < COLD_START_MODULES[module]
+
+
+def test_get_splitter():
+
+    for modality, (module_name, function_name) in SPLITTERS.items():
+        splitter = get_splitter(modality)
+        assert splitter is getattr(sys.modules[module_name], function_name)
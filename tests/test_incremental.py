@@ -0,0 +1,92 @@
+import os
+import json
+import logging
+
+import numpy as np
+import pandas as pd
+
+from redcap_preprocessing import incremental
+from redcap_preprocessing.dataset import read_redcap
+from redcap_preprocessing.incremental import MANIFEST_FILENAME, OUTPUTS_FILENAME, table_from_dict, table_to_dict
+from redcap_preprocessing.redcap_preprocessing import preprocess_redcap_data
+
+
+def read_outputs(output_dir):
+
+    return {filename: (output_dir / filename).read_bytes() for filename in os.listdir(output_dir)
+            if filename not in [MANIFEST_FILENAME, OUTPUTS_FILENAME]}
+
+
+def test_incremental_unchanged_export(tmp_path, caplog):
+
+    preprocess_redcap_data('data/prototype_redcap.csv', 'CRC', False, str(tmp_path), incremental=True)
+    mtimes = {filename: os.stat(tmp_path / filename).st_mtime_ns for filename in read_outputs(tmp_path)}
+    caplog.clear()
+
+    with caplog.at_level(logging.INFO, logger='redcap_preprocessing'):
+        preprocess_redcap_data('data/prototype_redcap.csv', 'CRC', False, str(tmp_path), incremental=True)
+
+    # no record converted, no file rewritten
+    assert 'Incremental run: 0 clinical, 0 treatment, 0 molecular records converted.' in caplog.text
+    assert {filename: os.stat(tmp_path / filename).st_mtime_ns for filename in read_outputs(tmp_path)} == mtimes
+
+
+def test_incremental_same_outputs(tmp_path):
+
+    redcap, _, _ = read_redcap('data/prototype_redcap.csv')
+    record_ids = list(redcap['record_id'].unique())
+
+    redcap.to_csv(tmp_path / 'redcap.csv', sep=';', index=False)
+    # the first record is deleted, the second one changed
+    changed_redcap = redcap[redcap['record_id'] != record_ids[0]].copy()
+    changed_redcap.loc[changed_redcap.index[0], 'sexe'] = 2
+    changed_redcap.to_csv(tmp_path / 'changed_redcap.csv', sep=';', index=False)
+
+    for save_as_single_file in [False, True]:
+
+        incremental_dir = tmp_path / f'incremental_{save_as_single_file}'
+        full_dir = tmp_path / f'full_{save_as_single_file}'
+
+        preprocess_redcap_data(str(tmp_path / 'redcap.csv'), 'CRC', save_as_single_file, str(incremental_dir), incremental=True)
+        preprocess_redcap_data(str(tmp_path / 'changed_redcap.csv'), 'CRC', save_as_single_file, str(incremental_dir), incremental=True)
+        preprocess_redcap_data(str(tmp_path / 'changed_redcap.csv'), 'CRC', save_as_single_file, str(full_dir))
+
+        # the files of the deleted record are removed
+        assert read_outputs(incremental_dir) == read_outputs(full_dir)
+
+        with open(incremental_dir / MANIFEST_FILENAME) as file:
+            manifest = json.load(file)
+        assert sorted(manifest['records']) == [str(record_id) for record_id in record_ids[1:]]
+
+
+def test_incremental_package_version(tmp_path, caplog, monkeypatch):
+
+    preprocess_redcap_data('data/prototype_redcap.csv', 'CRC', True, str(tmp_path), incremental=True)
+
+    # the tables of the records are saved as data, not pickled
+    with open(tmp_path / OUTPUTS_FILENAME) as file:
+        assert set(json.load(file)) == set(incremental.MODALITIES)
+
+    # another version of the package converts everything again
+    monkeypatch.setattr(incremental, '__version__', 'upgraded')
+    caplog.clear()
+
+    with caplog.at_level(logging.INFO, logger='redcap_preprocessing'):
+        preprocess_redcap_data('data/prototype_redcap.csv', 'CRC', True, str(tmp_path), incremental=True)
+
+    assert 'Incremental run: 0 clinical' not in caplog.text
+
+
+def test_table_to_dict():
+
+    table = pd.DataFrame({'record_id': [3, 3],
+                          'age_diagnosis': ['61', 61.0],
+                          'cell_line_code': [np.nan, None]},
+                         index=pd.Index([4, 7]))
+
+    restored = table_from_dict(json.loads(json.dumps(table_to_dict(table))))
+
+    pd.testing.assert_frame_equal(restored, table)
+    # the text and the number are written differently
+    assert [type(value) for value in restored['age_diagnosis']] == [str, float]
+    assert restored.to_csv(sep=';') == table.to_csv(sep=';')
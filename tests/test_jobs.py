@@ -0,0 +1,45 @@
+import os
+
+from redcap_preprocessing import jobs
+from redcap_preprocessing.jobs import Job, JobQueue, load_job_status
+
+
+def test_job_queue(tmp_path):
+
+    job_queue = JobQueue(workers=2)
+
+    job = job_queue.submit('data/prototype_redcap.csv', 'CRC', str(tmp_path / 'done'), save_as_single_file=True)
+    failed_job = job_queue.submit(str(tmp_path / 'missing.csv'), 'CRC', str(tmp_path / 'failed'))
+
+    assert job_queue.get(job.job_id) is job
+    assert job_queue.get('unknown') is None
+
+    job_queue.shutdown()
+
+    assert job.to_dict()['status'] == 'done'
+    assert job.get_progress() == 1.0
+    assert job.report['records'] == 2
+    assert os.path.exists(tmp_path / 'done' / 'CLI_C_PID_ALL.csv')
+
+    assert failed_job.status == 'failed'
+    assert failed_job.error is not None
+
+
+def test_job_progress_saved(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(jobs, 'PROGRESS_SAVE_INTERVAL', 3600.0)
+
+    status_path = str(tmp_path / 'job.json')
+    job = Job('data/prototype_redcap.csv', 'CRC', str(tmp_path / 'outputs'), status_path=status_path)
+
+    # not saved while queued
+    job.run_report.count('records', 4)
+    assert load_job_status(status_path)['progress'] == 0.0
+
+    job.status = 'running'
+    job.run_report.count('clinical_records', 3)
+    assert load_job_status(status_path)['progress'] == 0.25
+
+    # at most once per interval
+    job.run_report.count('treatment_records', 3)
+    assert load_job_status(status_path)['progress'] == 0.25
@@ -0,0 +1,44 @@
+import shutil
+
+from redcap_processing.normalize_dates import find_files, normalize_dates
+
+
+def test_normalize_dates(tmp_path):
+
+    shutil.copytree('data', tmp_path / 'data')
+    shutil.copy('data/prototype_redcap.csv', tmp_path / 'data' / 'clinical_data' / 'CL_C_PID_GR0002_SID_0001.txt')
+
+    # the old clinical and treatment files only
+    assert [path.split('/')[-1] for path in find_files(str(tmp_path / 'data'))] == ['CL_C_PID_GR0001_SID_0001.csv',
+                                                                                     'CL_C_PID_GR0069_SID_0001.csv',
+                                                                                     'TR_C_PID_CGR0001_SID_0001.csv',
+                                                                                     'TR_C_PID_CGR0069_SID_0001.csv']
+
+    treatment_path = tmp_path / 'data' / 'treatment_data' / 'TR_C_PID_CGR0001_SID_0001.csv'
+    treatment_mtime = treatment_path.stat().st_mtime_ns
+
+    checkpoint_path = str(tmp_path / 'checkpoint.json')
+    counts = normalize_dates(str(tmp_path / 'data'), workers=2, checkpoint_path=checkpoint_path)
+
+    assert counts == {'changed': 2, 'unchanged': 2, 'skipped': 0, 'failed': 0}
+
+    # only the timestamps of the clinical files changed
+    with open('data/clinical_data/CL_C_PID_GR0001_SID_0001.csv') as file:
+        expected_content = file.read().replace('1954-06-22 00:00:00', '22/06/1954')
+    with open(tmp_path / 'data' / 'clinical_data' / 'CL_C_PID_GR0001_SID_0001.csv') as file:
+        assert file.read() == expected_content
+
+    # the treatment files already had normalized dates
+    assert treatment_path.stat().st_mtime_ns == treatment_mtime
+
+    # resumed from the checkpoint
+    assert normalize_dates(str(tmp_path / 'data'), checkpoint_path=checkpoint_path) == {'changed': 0, 'unchanged': 0, 'skipped': 4, 'failed': 0}
+
+    # the modified files are normalized again
+    with open(treatment_path, 'a') as file:
+        file.write('6;hai_chemotherapy;;;;;;;;;2021-07-01;;;;;;;;CGR0001;24/06/2019\n')
+
+    assert normalize_dates(str(tmp_path / 'data'), checkpoint_path=checkpoint_path) == {'changed': 1, 'unchanged': 0, 'skipped': 3, 'failed': 0}
+
+    with open(treatment_path) as file:
+        assert file.read().splitlines()[-1] == '6;hai_chemotherapy;;;;;;;;;01/07/2021;;;;;;;;CGR0001;24/06/2019'
@@ -0,0 +1,55 @@
+import os
+
+from redcap_preprocessing.cell_line_index import get_cell_line_table
+from redcap_preprocessing.parallel import count_placeholders, get_placeholder_indexes, get_shards
+from redcap_preprocessing.redcap_preprocessing import preprocess_redcap_data
+
+
+def test_get_shards():
+
+    assert count_placeholders('', '') == 1
+    assert count_placeholders('CGR0001;;', '2020-01-01;2020-02-01;2020-03-01') == 2
+    assert count_placeholders('GR0001', '2020-01-01') == 0
+    # the codes without a date are dropped
+    assert count_placeholders(';;CGR0001', '2020-01-01') == 1
+
+    # the placeholders of each record follow the serial numbering
+    assert get_placeholder_indexes([1, 0, 2, 1, 0]) == [0, 1, 1, 3, 4]
+    assert get_placeholder_indexes([1, 0, 2], placeholder_index=5) == [5, 6, 6]
+
+    assert get_shards([0, 1, 3, 4, 6], records_per_shard=2) == [[0, 1], [3, 4], [6]]
+
+
+def test_sharded_placeholders():
+
+    # empty codes, fewer dates than codes
+    cell_lines = [(';;', '2020-01-01'), ('CGR0001;', '2020-02-01;2020-03-01'), (';', '2020-04-01')]
+
+    placeholder_counts = [count_placeholders(cell_line_code, date_cell_line) for cell_line_code, date_cell_line in cell_lines]
+    placeholder_indexes = get_placeholder_indexes(placeholder_counts)
+
+    serial = get_cell_line_table(cell_lines, placeholder_indexes)
+    sharded = [get_cell_line_table([cell_line], [placeholder_index])
+               for cell_line, placeholder_index in zip(cell_lines, placeholder_indexes)]
+
+    assert list(serial['cell_line_code']) == ['XX0000', 'GR0001', 'XX0001', 'XX0002']
+    assert [code for table in sharded for code in table['cell_line_code']] == list(serial['cell_line_code'])
+
+
+def test_workers_same_outputs(tmp_path):
+
+    for save_as_single_file in [False, True]:
+
+        serial_dir = tmp_path / f'serial_{save_as_single_file}'
+        parallel_dir = tmp_path / f'parallel_{save_as_single_file}'
+
+        preprocess_redcap_data('data/prototype_redcap.csv', 'CRC', save_as_single_file, str(serial_dir))
+        preprocess_redcap_data('data/prototype_redcap.csv', 'CRC', save_as_single_file, str(parallel_dir), workers=2)
+
+        filenames = sorted(os.listdir(serial_dir))
+
+        assert len(filenames) > 0
+        assert sorted(os.listdir(parallel_dir)) == filenames
+
+        for filename in filenames:
+            assert (serial_dir / filename).read_bytes() == (parallel_dir / filename).read_bytes()
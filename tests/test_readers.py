@@ -0,0 +1,58 @@
+import pandas as pd
+import pytest
+
+from redcap_preprocessing.dataset import read_redcap
+from redcap_preprocessing.readers import READER_ENGINES, read_csv_table
+
+
+def test_read_csv_table_engines():
+
+    columns = ['record_id', 'redcap_repeat_instrument', 'date_diag', 'not_a_column']
+
+    for selected_columns in [None, columns]:
+        tables = [read_csv_table('data/prototype_redcap.csv', ';', 'utf-8-sig', selected_columns, engine) for engine in READER_ENGINES]
+        # the same table as the pandas parser, missing values and types included
+        pd.testing.assert_frame_equal(tables[0], tables[1])
+
+    assert list(tables[0].columns) == [column for column in pd.read_csv('data/prototype_redcap.csv', sep=';', encoding='utf-8-sig', nrows=0).columns
+                                       if column in columns]
+
+
+@pytest.mark.parametrize('engine', READER_ENGINES)
+def test_read_csv_table_types(tmp_path, engine):
+
+    file_path = tmp_path / 'export.csv'
+    file_path.write_text('record_id;date;heure;vide;flag;nom\n'
+                         '1;2021-03-01;10:00;;True;"Hôpital\nEuropéen"\n'
+                         '2;NA;;;;\n', encoding='utf-8')
+
+    table = read_csv_table(str(file_path), ';', 'utf-8', engine=engine)
+
+    # dates and times are kept as written
+    assert list(table['date'].fillna('')) == ['2021-03-01', '']
+    assert list(table['heure'].fillna('')) == ['10:00', '']
+    assert table['vide'].dtype == float
+    assert table['nom'][0] == 'Hôpital\nEuropéen'
+    assert pd.isna(table['nom'][1]) and pd.isna(table['flag'][1])
+
+
+@pytest.mark.parametrize('engine', READER_ENGINES)
+def test_read_redcap_accents(tmp_path, engine):
+
+    content = 'record_id;nom\n1;Hôpital Européen\n2;Clinique Générale\n'
+
+    # utf-8 without BOM was read as unicode_escape, mangling the accents
+    utf8_path = tmp_path / 'utf8.csv'
+    utf8_path.write_bytes(content.encode('utf-8'))
+
+    redcap, file_encoding, delimiter = read_redcap(str(utf8_path), reader_engine=engine)
+    assert file_encoding == 'utf-8'
+    assert list(redcap['nom']) == ['Hôpital Européen', 'Clinique Générale']
+
+    # transcoded to utf-8 before parsing
+    cp1252_path = tmp_path / 'cp1252.csv'
+    cp1252_path.write_bytes(content.encode('cp1252'))
+
+    redcap, file_encoding, delimiter = read_redcap(str(cp1252_path), reader_engine=engine)
+    assert file_encoding == 'cp1252'
+    assert list(redcap['nom']) == ['Hôpital Européen', 'Clinique Générale']
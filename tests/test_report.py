@@ -0,0 +1,63 @@
+import os
+import json
+
+from redcap_preprocessing.report import REPORT_FILENAME, RunReport, LARGEST_RECORDS, activate_report, stage
+from redcap_preprocessing.redcap_preprocessing import preprocess_redcap_data
+
+
+def test_run_report(tmp_path):
+
+    run_report = preprocess_redcap_data('data/prototype_redcap.csv', 'CRC', True, str(tmp_path), save_report=True)
+
+    assert run_report['records'] == 2
+    assert run_report['counters']['rows_in'] == 22
+    assert run_report['records_per_second'] > 0
+
+    for stage_name in ['parsing', 'conversion_table_load', 'cell_line_lookup', 'clinical_transform',
+                       'treatment_transform', 'molecular_transform', 'date_formatting', 'writing']:
+        assert run_report['stages'][stage_name]['calls'] > 0
+
+    # the rows of the consolidated table
+    with open(tmp_path / 'CLI_C_PID_ALL.csv') as file:
+        assert run_report['counters']['clinical_rows_out'] == len(file.readlines()) - 1
+
+    assert 0 < len(run_report['largest_records']) <= LARGEST_RECORDS
+    rows_out = [record['rows_out'] for record in run_report['largest_records']]
+    assert rows_out == sorted(rows_out, reverse=True)
+    # the clinical table has a row per cell line
+    clinical_records = [record for record in run_report['largest_records'] if record['modality'] == 'clinical']
+    assert sum(record['rows_out'] for record in clinical_records) == run_report['counters']['clinical_rows_out']
+    assert all(record['rows_out'] == record['cell_lines'] and record['rows_in'] == 1 for record in clinical_records)
+
+    # the peak of the process, and its increase during the run
+    assert 0 <= run_report['peak_memory_increase_mb'] <= run_report['peak_memory_mb']
+
+    with open(tmp_path / REPORT_FILENAME) as file:
+        assert json.load(file)['records'] == 2
+
+
+def test_run_report_parallel(tmp_path):
+
+    serial_report = preprocess_redcap_data('data/prototype_redcap.csv', 'CRC', False, str(tmp_path / 'serial'))
+    parallel_report = preprocess_redcap_data('data/prototype_redcap.csv', 'CRC', False, str(tmp_path / 'parallel'), workers=2)
+
+    # the counters of the worker processes and writing threads are merged
+    assert parallel_report['counters'] == serial_report['counters']
+    assert parallel_report['counters']['files_written'] == len(os.listdir(tmp_path / 'serial'))
+    assert not os.path.exists(tmp_path / 'serial' / REPORT_FILENAME)
+
+
+def test_stage_without_report():
+
+    # nothing is collected outside of a run
+    with stage('parsing'):
+        pass
+
+    run_report = RunReport()
+    with activate_report(run_report):
+        with stage('parsing'):
+            pass
+        with stage('parsing'):
+            pass
+
+    assert run_report.to_dict()['stages']['parsing']['calls'] == 2
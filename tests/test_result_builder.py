@@ -0,0 +1,33 @@
+import pandas as pd
+
+from redcap_preprocessing.result_builder import ResultBuilder
+from redcap_preprocessing import split_clinical_data_from_redcap
+
+
+def test_result_builder():
+
+    result_builder = ResultBuilder()
+    assert len(result_builder.build()) == 0
+
+    result_builder.add(pd.DataFrame({'sex': ['man'], 'record_id': [1], 'date_cell_line': ['01/01/2020'], 'cell_line_code': ['GR0001']}, index=[1]))
+    result_builder.add(pd.DataFrame({'sex': ['woman'], 'record_id': [2], 'date_cell_line': [''], 'cell_line_code': ['XX0000']}, index=[2]))
+
+    result = result_builder.build()
+
+    assert len(result_builder) == 2
+    assert list(result.columns) == ['record_id', 'cell_line_code', 'date_cell_line', 'sex']
+    assert list(result['record_id']) == [1, 2]
+
+
+def test_split_clinical_data_as_single_file(tmp_path):
+
+    split_clinical_data_from_redcap.split_clinical_data_from_redcap_directory('data/prototype_redcap.csv',
+                                                                              'redcap_preprocessing/tables/redcap_CRC_conversion_table.csv',
+                                                                              str(tmp_path),
+                                                                              'CRC',
+                                                                              save_as_single_file=True)
+
+    clinical_data = pd.read_csv(tmp_path / 'CLI_C_PID_ALL.csv', sep=';')
+
+    assert list(clinical_data['cell_line_code']) == ['GR0069', 'GR0001']
+    assert list(clinical_data.columns[1:4]) == ['record_id', 'cell_line_code', 'date_cell_line']
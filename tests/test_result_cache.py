@@ -0,0 +1,71 @@
+import os
+
+from redcap_preprocessing.redcap_preprocessing import preprocess_redcap_data
+from redcap_preprocessing.result_cache import ResultCache
+
+
+def read_outputs(output_dir):
+
+    return {filename: (output_dir / filename).read_bytes() for filename in os.listdir(output_dir)}
+
+
+def test_result_cache(tmp_path):
+
+    cache_dir = str(tmp_path / 'cache')
+
+    first_report = preprocess_redcap_data('data/prototype_redcap.csv', 'CRC', True, str(tmp_path / 'first'), cache_dir=cache_dir)
+    second_report = preprocess_redcap_data('data/prototype_redcap.csv', 'CRC', True, str(tmp_path / 'second'), cache_dir=cache_dir)
+
+    assert first_report['counters']['cache_misses'] == 1
+    assert second_report['counters'] == {'cache_hits': 1}
+    assert read_outputs(tmp_path / 'second') == read_outputs(tmp_path / 'first')
+    assert sorted(read_outputs(tmp_path / 'second')) == ['CLI_C_PID_ALL.csv', 'MOL_C_PID_ALL.csv', 'TTR_C_PID_ALL.csv']
+
+    # the output options are part of the key
+    parquet_report = preprocess_redcap_data('data/prototype_redcap.csv', 'CRC', True, str(tmp_path / 'parquet'), cache_dir=cache_dir, output_format='parquet')
+    assert parquet_report['counters']['cache_misses'] == 1
+
+
+def test_result_cache_stale_outputs(tmp_path):
+
+    cache_dir = str(tmp_path / 'cache')
+
+    # per patient output of an earlier run
+    (tmp_path / 'first').mkdir()
+    (tmp_path / 'first' / 'CLI_C_PID_0001.csv').write_bytes(b'stale')
+
+    preprocess_redcap_data('data/prototype_redcap.csv', 'CRC', True, str(tmp_path / 'first'), cache_dir=cache_dir)
+    preprocess_redcap_data('data/prototype_redcap.csv', 'CRC', True, str(tmp_path / 'second'), cache_dir=cache_dir)
+
+    # only the *_PID_ALL outputs written by the first run are served
+    assert sorted(read_outputs(tmp_path / 'second')) == ['CLI_C_PID_ALL.csv', 'MOL_C_PID_ALL.csv', 'TTR_C_PID_ALL.csv']
+
+    # an export without molecular data, after an earlier run of another one
+    (entry_name,) = os.listdir(cache_dir)
+    os.remove(os.path.join(cache_dir, entry_name, 'MOL_C_PID_ALL.csv'))
+    (tmp_path / 'third').mkdir()
+    (tmp_path / 'third' / 'MOL_C_PID_ALL.csv').write_bytes(b'stale')
+    (tmp_path / 'third' / 'notes.txt').write_bytes(b'kept')
+
+    preprocess_redcap_data('data/prototype_redcap.csv', 'CRC', True, str(tmp_path / 'third'), cache_dir=cache_dir)
+
+    assert sorted(read_outputs(tmp_path / 'third')) == ['CLI_C_PID_ALL.csv', 'TTR_C_PID_ALL.csv', 'notes.txt']
+
+
+def test_result_cache_eviction(tmp_path):
+
+    (tmp_path / 'outputs').mkdir()
+    (tmp_path / 'outputs' / 'CLI_C_PID_ALL.csv').write_bytes(b'0' * 100)
+
+    result_cache = ResultCache(str(tmp_path / 'cache'), max_size=250)
+
+    for key in ['first', 'second', 'third']:
+        result_cache.store(key, str(tmp_path / 'outputs'), ['CLI_C_PID_ALL.csv'])
+        # the first entry is used again, the second one is the least recently used
+        if key == 'second':
+            os.utime(result_cache.get_entry_dir('first'), (0, 0))
+            os.utime(result_cache.get_entry_dir('second'), (0, 0))
+            assert result_cache.restore('first', str(tmp_path / 'outputs'))
+
+    assert sorted(os.listdir(tmp_path / 'cache')) == ['first', 'third']
+    assert not result_cache.restore('second', str(tmp_path / 'outputs'))
@@ -0,0 +1,29 @@
+import os
+
+import pandas as pd
+
+from redcap_processing.split_duplicate_cell_lines import split_duplicate_cell_lines
+
+
+def test_split_duplicate_cell_lines(tmp_path):
+
+    # an old per patient file of two cell lines, and a single cell line one
+    (tmp_path / 'CL_C_PID_CGR0002 ;CGR0060 _SID_0001.csv').write_text(';record_id;cell_line_code;sister_cell_line_codes;age\n'
+                                                                    '0;1;GR0002;GR0060;54\n', encoding='utf-8')
+    (tmp_path / 'CL_C_PID_GR0003_SID_0002.csv').write_text(';record_id;cell_line_code;age\n'
+                                                         '0;2;GR0003;61\n', encoding='utf-8')
+
+    split_duplicate_cell_lines(str(tmp_path))
+
+    # one file per cell line, the original files being left in place
+    assert sorted(os.listdir(tmp_path)) == ['CL_C_PID_CGR0002 ;CGR0060 _SID_0001.csv',
+                                            'CL_C_PID_GR0002_SID_0001.csv',
+                                            'CL_C_PID_GR0003_SID_0002.csv',
+                                            'CL_C_PID_GR0060_SID_0001.csv']
+
+    for cell_line_code, sister_cell_line_codes in [('GR0002', 'GR0060'), ('GR0060', 'GR0002')]:
+        data_file = pd.read_csv(tmp_path / f'CL_C_PID_{cell_line_code}_SID_0001.csv', sep=';', index_col=0, dtype=str)
+        assert data_file.to_dict('records') == [{'record_id': '1',
+                                                 'cell_line_code': cell_line_code,
+                                                 'sister_cell_line_codes': sister_cell_line_codes,
+                                                 'age': '54'}]
@@ -0,0 +1,85 @@
+import os
+
+import pandas as pd
+import pytest
+
+from redcap_preprocessing import split_molecular_data_from_redcap
+from redcap_preprocessing.dataset import read_redcap
+from redcap_preprocessing.redcap_preprocessing import preprocess_redcap_data
+from redcap_preprocessing.streaming import read_redcap_batches
+
+
+def test_read_redcap_batches():
+
+    redcap, _, _ = read_redcap('data/prototype_redcap.csv')
+
+    batches = list(read_redcap_batches('data/prototype_redcap.csv', chunksize=1))
+
+    # one batch per record, with all its rows
+    assert [list(batch['record_id'].unique()) for batch in batches] == [[record_id] for record_id in redcap['record_id'].unique()]
+    pd.testing.assert_frame_equal(pd.concat(batches), redcap)
+
+
+def test_read_redcap_batches_not_grouped(tmp_path):
+
+    redcap, _, _ = read_redcap('data/prototype_redcap.csv')
+
+    # move the first row of the first record at the end
+    redcap = pd.concat([redcap.iloc[1:], redcap.iloc[:1]])
+    redcap.to_csv(tmp_path / 'redcap.csv', sep=';', index=False)
+
+    with pytest.raises(ValueError):
+        list(read_redcap_batches(str(tmp_path / 'redcap.csv'), chunksize=1))
+
+
+def test_streaming_same_outputs(tmp_path):
+
+    for save_as_single_file in [False, True]:
+
+        in_memory_dir = tmp_path / f'in_memory_{save_as_single_file}'
+        streaming_dir = tmp_path / f'streaming_{save_as_single_file}'
+
+        preprocess_redcap_data('data/prototype_redcap.csv', 'CRC', save_as_single_file, str(in_memory_dir))
+        preprocess_redcap_data('data/prototype_redcap.csv', 'CRC', save_as_single_file, str(streaming_dir), chunksize=2)
+
+        filenames = sorted(os.listdir(in_memory_dir))
+
+        assert len(filenames) > 0
+        assert sorted(os.listdir(streaming_dir)) == filenames
+
+        for filename in filenames:
+            assert (in_memory_dir / filename).read_bytes() == (streaming_dir / filename).read_bytes()
+
+
+def test_read_redcap_batches_types(tmp_path):
+
+    (tmp_path / 'redcap.csv').write_text('record_id;age;poids\n1;34;70\n2;;\n2;texte;71\n3;35;72\n')
+
+    batches = list(read_redcap_batches(str(tmp_path / 'redcap.csv'), chunksize=1))
+
+    # the types are widened as the chunks are read, the rows of a record
+    # split across chunks being cast together
+    assert list(batches[0]['age']) == [34]
+    assert list(batches[1]['age'].fillna('')) == ['', 'texte']
+    assert list(batches[2]['age']) == ['35']
+    assert batches[2]['poids'].dtype == float
+
+
+def test_streaming_interrupted(tmp_path, monkeypatch):
+
+    split_molecular_data = split_molecular_data_from_redcap.split_molecular_data
+    calls = []
+
+    def interrupted_split_molecular_data(*args, **kwargs):
+        calls.append(None)
+        if len(calls) == 2:
+            raise RuntimeError('interrupted')
+        return split_molecular_data(*args, **kwargs)
+
+    monkeypatch.setattr(split_molecular_data_from_redcap, 'split_molecular_data', interrupted_split_molecular_data)
+
+    with pytest.raises(RuntimeError):
+        preprocess_redcap_data('data/prototype_redcap.csv', 'CRC', True, str(tmp_path), chunksize=1)
+
+    # neither a truncated consolidated table nor its temporary file
+    assert [filename for filename in os.listdir(tmp_path) if 'PID_ALL' in filename] == []
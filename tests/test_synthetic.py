@@ -0,0 +1,74 @@
+import os
+
+import pandas as pd
+import pytest
+
+from redcap_preprocessing.benchmark import benchmark_cohort, main as benchmark_main
+from redcap_preprocessing.columns import get_redcap_columns
+from redcap_preprocessing.conversion_plan import read_conversion_table
+from redcap_preprocessing.dataset import RedcapDataset
+from redcap_preprocessing.redcap_preprocessing import preprocess_redcap_data
+from redcap_preprocessing.synthetic import generate_redcap_export, write_redcap_export
+
+
+@pytest.mark.parametrize('disease_type', ['CRC', 'PDAC'])
+def test_generate_redcap_export(disease_type):
+
+    redcap = generate_redcap_export(disease_type, 50, 'data/prototype_redcap.csv', seed=1)
+    redcap_conversion_table = read_conversion_table(f'redcap_preprocessing/tables/redcap_{disease_type}_conversion_table.csv')
+
+    # all the columns used by the splitters
+    assert set(get_redcap_columns(redcap_conversion_table, disease_type)) <= set(redcap.columns)
+
+    # grouped by record_id, the base row first
+    assert list(redcap['record_id'].unique()) == list(range(1, 51))
+    assert redcap.drop_duplicates('record_id')['redcap_repeat_instrument'].isna().all()
+
+    instruments = set(redcap['redcap_repeat_instrument'].dropna())
+    assert {'ligne_mtastatique_de_traitement', 'hai_chemotherapy', 'molecular_profile'} <= instruments
+    assert {'CRC': 'organoides', 'PDAC': 'organodes'}[disease_type] in instruments
+
+    # reproducible
+    pd.testing.assert_frame_equal(generate_redcap_export(disease_type, 50, 'data/prototype_redcap.csv', seed=1), redcap)
+
+
+def test_write_redcap_export(tmp_path):
+
+    n_rows = write_redcap_export(str(tmp_path / 'redcap.csv'), 'CRC', 30, 'data/prototype_redcap.csv', records_per_block=7)
+
+    dataset = RedcapDataset.from_csv(str(tmp_path / 'redcap.csv'), 'redcap_preprocessing/tables/redcap_CRC_conversion_table.csv', 'CRC')
+
+    assert len(dataset.redcap) == n_rows
+    assert list(dataset.redcap['record_id'].unique()) == list(range(1, 31))
+
+    # the cell line names are unique across the blocks
+    cell_lines = dataset.redcap['nom_lign_e'].dropna()
+    assert cell_lines.is_unique and len(cell_lines) > 0
+
+
+@pytest.mark.parametrize('disease_type', ['CRC', 'PDAC'])
+def test_preprocess_synthetic_export(tmp_path, disease_type):
+
+    write_redcap_export(str(tmp_path / 'redcap.csv'), disease_type, 20, 'data/prototype_redcap.csv')
+
+    preprocess_redcap_data(str(tmp_path / 'redcap.csv'), disease_type, True, str(tmp_path / 'outputs'))
+
+    clinical_data = pd.read_csv(tmp_path / 'outputs' / f'CLI_{disease_type[0]}_PID_ALL.csv', sep=';')
+    assert set(clinical_data['record_id']) == set(range(1, 21))
+
+
+def test_benchmark_cohort(tmp_path):
+
+    results = benchmark_cohort('CRC', 5, str(tmp_path), 'data/prototype_redcap.csv', trace_memory=False)
+
+    assert [result['stage'] for result in results] == ['load', 'clinical', 'treatment', 'molecular', 'end_to_end']
+    assert all(result['seconds'] > 0 and result['peak_memory_mb'] is None for result in results)
+    assert os.path.exists(tmp_path / 'redcap_CRC_5.csv')
+
+
+
+def test_benchmark_prototype():
+
+    # the prototype export is not shipped with the package
+    with pytest.raises(SystemExit):
+        benchmark_main(['--records', '5', '--no-memory'])
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+from redcap_preprocessing.conversion_plan import ConversionPlan
+from redcap_preprocessing.transform import add_content_values
+from redcap_preprocessing.utils import add_content
+from redcap_preprocessing import split_clinical_data_from_redcap
+from redcap_preprocessing import split_treatment_data_from_redcap
+from redcap_preprocessing import split_molecular_data_from_redcap
+
+
+redcap_filepath = 'data/prototype_redcap.csv'
+conversion_table_filepath = 'redcap_preprocessing/tables/redcap_CRC_conversion_table.csv'
+
+
+def test_add_content_values():
+
+    prior_content = np.array(['', np.nan, 'a', 'a', 'a', ''], dtype=object)
+    content = np.array(['b', 'b', '', np.nan, 'b', 1.0], dtype=object)
+
+    expected_content = [add_content(new, prior) for new, prior in zip(content, prior_content)]
+
+    assert list(add_content_values(content, prior_content)) == expected_content
+
+
+def test_vectorized_transform_matches_reference():
+
+    redcap = pd.read_csv(redcap_filepath, sep=';', encoding='utf-8-sig')
+
+    # clinical
+    conversion_plan = ConversionPlan.from_csv(conversion_table_filepath, 'clinical-profile')
+    redcap_clinical_data = redcap.groupby('record_id').first().reset_index()
+
+    reference = pd.concat([split_clinical_data_from_redcap.get_single_patient_clinical_data(row, conversion_plan)
+                           for index, row in redcap_clinical_data.iterrows()])
+    vectorized = split_clinical_data_from_redcap.get_clinical_data(redcap_clinical_data, conversion_plan)
+
+    pd.testing.assert_frame_equal(reference, vectorized)
+
+    # treatment
+    conversion_plan = ConversionPlan.from_csv(conversion_table_filepath, 'treatment')
+    redcap['redcap_repeat_instrument'] = redcap['redcap_repeat_instrument'].fillna('')
+    redcap_treatment_data = redcap[redcap['redcap_repeat_instrument'].isin(['', 'ligne_mtastatique_de_traitement', 'hai_chemotherapy'])]
+
+    reference = pd.concat([split_treatment_data_from_redcap.get_single_patient_treatment_data(patient_treatment_data.copy(), conversion_plan, 'CRC')
+                           for record_id, patient_treatment_data in redcap_treatment_data.groupby('record_id')])
+    vectorized = split_treatment_data_from_redcap.get_treatment_data(redcap_treatment_data, conversion_plan, 'CRC')
+
+    pd.testing.assert_frame_equal(reference, vectorized)
+
+    # molecular
+    conversion_plan = ConversionPlan.from_csv(conversion_table_filepath, 'molecular_profile')
+    redcap_molecular_data = redcap[redcap['redcap_repeat_instrument'] == 'molecular_profile']
+
+    reference = split_molecular_data_from_redcap.get_single_patient_molecular_data(redcap_molecular_data, conversion_plan)
+    vectorized = split_molecular_data_from_redcap.get_molecular_data(redcap_molecular_data, conversion_plan)
+
+    pd.testing.assert_frame_equal(reference, vectorized)
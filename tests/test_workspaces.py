@@ -0,0 +1,45 @@
+import json
+import os
+import time
+
+from redcap_preprocessing.workspaces import WorkspaceStore
+
+
+def test_workspace_store(tmp_path):
+
+    workspaces = WorkspaceStore(str(tmp_path), ttl=60)
+
+    workspace_id = workspaces.create()
+    other_workspace_id = workspaces.create()
+    assert workspace_id != other_workspace_id
+    assert os.path.isdir(workspaces.get_output_dir(workspace_id))
+
+    # only the existing workspaces are reachable
+    assert workspaces.get_path('..', 'outputs') is None
+    assert workspaces.get_path('0' * 32) is None
+
+    # the workspace untouched for longer than the ttl is removed
+    os.utime(workspaces.get_path(workspace_id), (time.time() - 120, time.time() - 120))
+    (tmp_path / 'not_a_workspace').mkdir()
+
+    assert workspaces.cleanup() == [workspace_id]
+    assert sorted(os.listdir(tmp_path)) == sorted([other_workspace_id, 'not_a_workspace'])
+
+
+def test_workspace_store_active_jobs(tmp_path):
+
+    workspaces = WorkspaceStore(str(tmp_path), ttl=60)
+
+    workspace_ids = {status: workspaces.create() for status in ['queued', 'running', 'done', 'failed']}
+    for status, workspace_id in workspace_ids.items():
+        with open(workspaces.get_path(workspace_id, 'job.json'), 'w') as file:
+            json.dump({'status': status}, file)
+        os.utime(workspaces.get_path(workspace_id), (time.time() - 120, time.time() - 120))
+
+    # the workspaces of the queued and running jobs are kept
+    assert sorted(workspaces.cleanup()) == sorted([workspace_ids['done'], workspace_ids['failed']])
+
+    # unless abandoned
+    os.utime(workspaces.get_path(workspace_ids['running']), (time.time() - 60 * 60, time.time() - 60 * 60))
+    assert workspaces.cleanup() == [workspace_ids['running']]
+    assert os.listdir(tmp_path) == [workspace_ids['queued']]
@@ -0,0 +1,55 @@
+import os
+import tarfile
+import zipfile
+
+import pandas as pd
+import pytest
+
+from redcap_preprocessing.redcap_preprocessing import preprocess_redcap_data
+from redcap_preprocessing.writer import PatientFileWriter
+
+
+def test_patient_file_writer(tmp_path):
+
+    frames = {f'CLI_C_PID_GR{i:04d}_SID_0001': pd.DataFrame({'sex': ['man'], 'record_id': [i]}) for i in range(20)}
+
+    with PatientFileWriter(str(tmp_path), io_workers=2, max_pending=3) as writer:
+        for filename, frame in frames.items():
+            writer.write(frame, filename)
+
+    # no temporary file left
+    assert sorted(os.listdir(tmp_path)) == sorted(f'{filename}.csv' for filename in frames)
+
+    for filename, frame in frames.items():
+        assert (tmp_path / f'{filename}.csv').read_text() == frame.to_csv(sep=';')
+
+
+def test_unknown_archive_format(tmp_path):
+
+    with pytest.raises(ValueError):
+        PatientFileWriter(str(tmp_path), archive_path=str(tmp_path / 'outputs.rar'))
+
+
+def test_archive_same_outputs(tmp_path):
+
+    preprocess_redcap_data('data/prototype_redcap.csv', 'CRC', False, str(tmp_path / 'files'))
+    filenames = sorted(os.listdir(tmp_path / 'files'))
+
+    preprocess_redcap_data('data/prototype_redcap.csv', 'CRC', False, str(tmp_path / 'zip'),
+                           archive_path=str(tmp_path / 'outputs.zip'))
+    preprocess_redcap_data('data/prototype_redcap.csv', 'CRC', False, str(tmp_path / 'tar'),
+                           archive_path=str(tmp_path / 'outputs.tar.gz'))
+
+    # the files only go to the archive
+    assert os.listdir(tmp_path / 'zip') == []
+    assert os.listdir(tmp_path / 'tar') == []
+
+    with zipfile.ZipFile(tmp_path / 'outputs.zip') as archive:
+        assert sorted(archive.namelist()) == filenames
+        for filename in filenames:
+            assert archive.read(filename) == (tmp_path / 'files' / filename).read_bytes()
+
+    with tarfile.open(tmp_path / 'outputs.tar.gz') as archive:
+        assert sorted(archive.getnames()) == filenames
+        for filename in filenames:
+            assert archive.extractfile(filename).read() == (tmp_path / 'files' / filename).read_bytes()